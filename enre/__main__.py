@@ -1,65 +1,244 @@
 import argparse
+import contextlib
+import functools
 import json
+import logging
 import sys
 import time
+import typing as ty
 from pathlib import Path
 
-from enre.analysis.analyze_manager import AnalyzeManager
+from enre.analysis.analyze_manager import AnalyzeManager, DiscoveryFilter
+from enre.analysis.batch import BatchProject, read_manifest, run_batch
+from enre.analysis.builtins_cache import BuiltinsCache, DefaultBuiltinsCacheDir
+from enre.analysis.incremental import IncrementalState
+from enre.analysis.parse_cache import ParseCache, DefaultCacheDir
+from enre.analysis.profiler import Profiler
+from enre.analysis.projection import Projection
 from enre.cfg.Resolver import Resolver
 from enre.cfg.module_tree import Scene
+from enre.dep.columnar import ColumnarDepGraph
 from enre.passes.aggregate_control_flow_info import aggregate_cfg_info
+from enre.passes.stable_ids import assign_stable_ids
+from enre.server.daemon import AnalysisDaemon, remove_stale_socket
 from enre.vis.representation import DepRepr
 from enre.vis.summary_repr import from_summaries, call_graph_representation
 
+logger = logging.getLogger(__name__)
 
 def main() -> None:
     parser = argparse.ArgumentParser()
     parser.add_argument("root path", type=str, nargs='?',
                         help="root package path")
     parser.add_argument("--profile", action="store_true", help="output consumed time in json format")
+    parser.add_argument("--profile-modules", action="store", type=int, default=10,
+                        help="count of the slowest modules listed by --profile")
+    parser.add_argument("--verbose", action="store_true", help="log every visited path and analyzed module")
     parser.add_argument("--cfg", action="store_true",
                         help="run control flow analysis and output module summaries")
     parser.add_argument("--compatible", action="store_true", help="output compatible format")
     parser.add_argument("--builtins", action="store", help="builtins module path")
     parser.add_argument("--cg", action="store_true", help="dump call graph in json")
+    parser.add_argument("--jobs", action="store", type=int, default=1,
+                        help="count of processes used to parse modules")
+    parser.add_argument("--parallel", action="store_true",
+                        help="analyze groups of modules which don't import each other in --jobs processes")
+    parser.add_argument("--no-parse-cache", action="store_true", help="parse every module without the ast cache")
+    parser.add_argument("--parse-cache-limit", action="store", type=int, default=512,
+                        help="size limit of the ast cache in megabytes")
+    parser.add_argument("--no-builtins-cache", action="store_true",
+                        help="analyze the builtins module without the snapshot of a previous run")
+    parser.add_argument("--include", action="append", default=[],
+                        help="glob of module paths relative to the root to analyze, can be given many times")
+    parser.add_argument("--exclude", action="append", default=[],
+                        help="glob of paths relative to the root to skip, can be given many times")
+    parser.add_argument("--max-file-size", action="store", type=int,
+                        help="skip modules larger than this size in kilobytes")
+    parser.add_argument("--stable-ids", action="store_true",
+                        help="derive entity ids from kind, name and location so they don't change between runs")
+    parser.add_argument("--memory-budget", action="store", type=int,
+                        help="resident memory in megabytes above which references of analyzed modules "
+                             "are spilled to disk")
+    parser.add_argument("--outline", action="store_true",
+                        help="only analyze declarations and imports, skip the bodies of functions and lambdas")
+    parser.add_argument("--relations", action="store",
+                        help="comma separated kinds of relations to report, e.g. Import,Call, "
+                             "other relations are not built unless the analysis needs them")
+    parser.add_argument("--entities", action="store",
+                        help="comma separated kinds of entities to report, e.g. Module,Class,Function")
+    parser.add_argument("--columnar", action="store_true",
+                        help="move the dependencies into compact arrays before writing the report")
+    parser.add_argument("--incremental", action="store",
+                        help="state file of the previous run, only re-analyze modules affected by changed files")
+    parser.add_argument("--serve", action="store",
+                        help="keep the analysis in memory and answer json queries on this unix socket")
+    parser.add_argument("--watch-interval", action="store", type=float, default=2.0,
+                        help="seconds between checks for changed files while serving, 0 to disable")
+    parser.add_argument("--batch", action="store",
+                        help="manifest of projects to analyze in --jobs processes, one json object per line "
+                             "with the root path and the output directory of a project")
     config = parser.parse_args()
-    root_path = Path(sys.argv[1])
+    if config.verbose:
+        logging.basicConfig(level=logging.DEBUG, format="%(name)s: %(message)s")
     start = time.time()
-    manager = enre_wrapper(root_path, config.compatible, config.cfg, config.cg, config.builtins)
+    parse_cache = None if config.no_parse_cache else ParseCache(DefaultCacheDir, config.parse_cache_limit * 1024 * 1024)
+    builtins_cache = None if config.no_builtins_cache else BuiltinsCache(DefaultBuiltinsCacheDir)
+    max_file_size = config.max_file_size * 1024 if config.max_file_size is not None else None
+    discovery = DiscoveryFilter(config.include, config.exclude, max_file_size)
+    memory_budget = config.memory_budget * 1024 * 1024 if config.memory_budget is not None else None
+    try:
+        projection = Projection.parse(config.relations, config.entities)
+    except ValueError as e:
+        parser.error(str(e))
+    if config.batch:
+        if not batch_wrapper(Path(config.batch), config, parse_cache, builtins_cache, discovery, memory_budget,
+                             projection):
+            sys.exit(1)
+        return
+    root_path = Path(sys.argv[1])
+    if config.serve:
+        # fail before the analysis if the socket can't be taken
+        try:
+            remove_stale_socket(Path(config.serve))
+        except FileExistsError as e:
+            parser.error(str(e))
+        builtins_path = Path(config.builtins) if config.builtins else None
+        daemon = AnalysisDaemon(root_path, builtins_path, config.cfg, config.jobs, parse_cache, builtins_cache,
+                                discovery)
+        print(f"serving queries on {config.serve}")
+        daemon.serve(Path(config.serve), config.watch_interval)
+        return
+    manager = enre_wrapper(root_path, config.compatible, config.cfg, config.cg, config.builtins, config.jobs,
+                           parse_cache, config.incremental, config.parallel, builtins_cache, discovery=discovery,
+                           stable_ids=config.stable_ids, memory_budget=memory_budget, columnar=config.columnar,
+                           outline=config.outline, projection=projection)
     end = time.time()
 
     if config.profile:
         time_in_json = json.dumps({
             "analyzed files": len(manager.root_db.tree),
-            "analysing time": end - start})
+            "analysing time": end - start,
+            "max import depth": manager.module_stack.max_depth,
+            "skipped files": len(manager.root_db.skipped_files),
+            "skipped bytes": sum(skipped.size or 0 for skipped in manager.root_db.skipped_files.values()),
+            **spill_report(manager),
+            **manager.profiler.report(config.profile_modules)})
         print(time_in_json)
         # print(f"analysing time: {end - start}s")
 
 
-def dump_call_graph(project_name: str, resolver: Resolver) -> None:
+def spill_report(manager: AnalyzeManager) -> ty.Dict[str, int]:
+    spill_store = manager.root_db.spill_store
+    if spill_store is None:
+        return {}
+    return {"spilled modules": spill_store.spilled_modules, "paged in modules": spill_store.loaded_modules}
+
+
+def batch_wrapper(manifest_path: Path, config: argparse.Namespace, parse_cache: ty.Optional[ParseCache],
+                  builtins_cache: ty.Optional[BuiltinsCache], discovery: DiscoveryFilter,
+                  memory_budget: ty.Optional[int] = None, projection: ty.Optional[Projection] = None) -> bool:
+    """
+    Analyze the projects of the manifest and print the result of every project in json.
+
+    :return: False if any project failed
+    """
+    projects = read_manifest(manifest_path)
+    analyze = functools.partial(_analyze_batch_project, config.compatible, config.cfg, config.cg, config.builtins,
+                                parse_cache, builtins_cache, discovery, config.stable_ids, memory_budget,
+                                config.columnar, config.outline, projection)
+
+    def warm_up(project: BatchProject) -> None:
+        if builtins_cache is not None and config.builtins:
+            builtin_path = Path(config.builtins)
+            key = builtins_cache.key_of(project.root.parent.joinpath(builtin_path), builtin_path)
+            if key is not None:
+                builtins_cache.preload(key)
+
+    results = run_batch(projects, config.jobs, analyze, warm_up)
+    for result in results:
+        print(json.dumps(result.to_json()))
+    return not any(result.failed for result in results)
+
+
+def _analyze_batch_project(compatible_format: bool, need_cfg: bool, need_call_graph: bool, builtin_module: str,
+                           parse_cache: ty.Optional[ParseCache], builtins_cache: ty.Optional[BuiltinsCache],
+                           discovery: DiscoveryFilter, stable_ids: bool, memory_budget: ty.Optional[int],
+                           columnar: bool, outline: bool, projection: ty.Optional[Projection],
+                           project: BatchProject) -> None:
+    # stdout of the batch is the json results of the projects, progress goes to stderr
+    with contextlib.redirect_stdout(sys.stderr):
+        enre_wrapper(project.root, compatible_format, need_cfg, need_call_graph, builtin_module,
+                     parse_cache=parse_cache, builtins_cache=builtins_cache, out_dir=project.output,
+                     discovery=discovery, stable_ids=stable_ids, memory_budget=memory_budget, columnar=columnar,
+                     outline=outline, projection=projection)
+
+
+def dump_call_graph(project_name: str, resolver: Resolver, out_dir: Path = Path()) -> None:
     call_graph = call_graph_representation(resolver)
-    out_path = f"{project_name}-call-graph-enre.json"
+    out_path = out_dir.joinpath(f"{project_name}-call-graph-enre.json")
     with open(out_path, "w") as file:
         json.dump(call_graph, file, indent=4)
 
 
 def enre_wrapper(root_path: Path, compatible_format: bool, need_cfg: bool, need_call_graph: bool,
-                 builtin_module: str) -> AnalyzeManager:
+                 builtin_module: str, jobs: int = 1, parse_cache: ty.Optional[ParseCache] = None,
+                 incremental_state: ty.Optional[str] = None, parallel: bool = False,
+                 builtins_cache: ty.Optional[BuiltinsCache] = None, out_dir: Path = Path(),
+                 discovery: ty.Optional[DiscoveryFilter] = None, stable_ids: bool = False,
+                 memory_budget: ty.Optional[int] = None, columnar: bool = False,
+                 outline: bool = False, projection: ty.Optional[Projection] = None) -> AnalyzeManager:
+    """
+    :param memory_budget: resident set size in bytes above which references of finished modules
+        are spilled to disk, ignored by incremental analysis which keeps its state in memory
+    :param columnar: copy the dependencies into a `ColumnarDepGraph` and release the references
+        of the entities before writing the report, the references of the returned manager are empty
+    :param outline: skip the bodies of functions and lambdas, ignored by incremental analysis
+        whose state is the state of a full analysis
+    :param projection: kinds of relations and entities to report, incremental analysis builds every
+        reference for its state and only leaves the others out of the report
+    """
     project_name = root_path.name
     builtins_path = Path(builtin_module) if builtin_module else None
-    manager = AnalyzeManager(root_path, builtins_path)
-    manager.work_flow()
-    out_path = Path(f"{project_name}-report-enre.json")
+    manager: AnalyzeManager
+    if incremental_state:
+        if memory_budget is not None:
+            logger.warning("--memory-budget is ignored by incremental analysis")
+        if outline:
+            logger.warning("--outline is ignored by incremental analysis")
+        manager = IncrementalState(Path(incremental_state)).analyze(root_path, builtins_path, jobs, parse_cache,
+                                                                     builtins_cache, discovery)
+        if projection is not None:
+            manager.root_db.projection = projection
+    else:
+        manager = AnalyzeManager(root_path, builtins_path, jobs, parse_cache, builtins_cache, discovery,
+                                 memory_budget, outline, build_summaries=need_cfg, projection=projection)
+        manager.work_flow(parallel)
+    profiler = manager.profiler
+    if stable_ids:
+        with profiler.measure("stable ids"):
+            assign_stable_ids(manager.root_db)
+    out_path = out_dir.joinpath(f"{project_name}-report-enre.json")
     if need_cfg:
         print("dependency analysis finished, now running control flow analysis")
-        resolver = cfg_wrapper(root_path, manager.scene)
+        resolver = cfg_wrapper(root_path, manager.scene, profiler, out_dir)
         print("control flow analysis finished")
-        aggregate_cfg_info(manager.root_db, resolver)
+        with profiler.measure("aggregate_cfg_info"):
+            aggregate_cfg_info(manager.root_db, resolver)
         if need_call_graph:
-            dump_call_graph(project_name, resolver)
+            with profiler.measure("call graph"):
+                dump_call_graph(project_name, resolver, out_dir)
 
-    with open(out_path, "w") as file:
-        if not compatible_format:
+    graph: ty.Optional[ColumnarDepGraph] = None
+    if columnar:
+        with profiler.measure("columnar"):
+            graph = ColumnarDepGraph.from_package_db(manager.root_db, release_refs=True)
+
+    with profiler.measure("json"), open(out_path, "w") as file:
+        if graph is not None:
+            DepRepr.write_columnar(graph, manager.root_db, file, compatible_format)
+        elif manager.root_db.spill_store is not None:
+            DepRepr.write_package_db(manager.root_db, file, compatible_format)
+        elif not compatible_format:
             json.dump(DepRepr.from_package_db(manager.root_db).to_json_1(), file, indent=4)
         else:
             repr = DepRepr.from_package_db(manager.root_db).to_json()
@@ -69,11 +248,15 @@ def enre_wrapper(root_path: Path, compatible_format: bool, need_cfg: bool, need_
     return manager
 
 
-def cfg_wrapper(root_path: Path, scene: Scene) -> Resolver:
-    resolver = Resolver(scene)
-    resolver.resolve_all()
-    out_path = Path(f"{root_path.name}-report-cfg.txt")
-    with open(out_path, "w") as file:
+def cfg_wrapper(root_path: Path, scene: Scene, profiler: ty.Optional[Profiler] = None,
+                out_dir: Path = Path()) -> Resolver:
+    if profiler is None:
+        profiler = Profiler()
+    with profiler.measure("resolve_all"):
+        resolver = Resolver(scene)
+        resolver.resolve_all()
+    out_path = out_dir.joinpath(f"{root_path.name}-report-cfg.txt")
+    with profiler.measure("cfg summaries"), open(out_path, "w") as file:
         summary_repr = from_summaries(scene.summaries)
         file.write(summary_repr)
     return resolver
@@ -12,7 +12,7 @@ from enre.analysis.env import EntEnv, ScopeEnv
 from enre.analysis.value_info import ValueInfo, ConstructorType, InstanceType, ModuleType, AnyType, PackageType
 from enre.cfg.module_tree import SummaryBuilder, StoreAble, FuncConst, StoreAbles, get_named_store_able, \
     ModuleSummary, Constant, IndexableKind, IndexableInfo, ConstantKind
-from enre.ent.EntKind import RefKind
+from enre.ent.EntKind import RefKind, EntKind
 from enre.ent.entity import AbstractValue
 from enre.ent.entity import Entity, UnknownVar, Module, ReferencedAttribute, Location, UnresolvedAttribute, \
     ModuleAlias, Class, LambdaFunction, Span, get_syntactic_span, get_anonymous_ent, NewlyCreated, SetContextValue, \
@@ -96,8 +96,8 @@ class ExprAnalyzer:
         ent_objs = lookup_res.found_entities
         ctx = self._env.get_ctx()
         for ent, ent_type in ent_objs:
-            ctx.add_ref(self.create_ref_by_ctx(ent, name_expr.lineno, name_expr.col_offset, self._typing_entities,
-                                               self._exp_ctx, name_expr))
+            self.add_ref_by_ctx(ctx, ent, name_expr.lineno, name_expr.col_offset, self._typing_entities,
+                                self._exp_ctx, name_expr)
 
         if not isinstance(self._exp_ctx, SetContext):
             if ent_objs:
@@ -110,9 +110,8 @@ class ExprAnalyzer:
             else:
                 unknown_var = UnknownVar.get_unknown_var(name_expr.id)
                 self._current_db.add_ent(unknown_var)
-                ctx.add_ref(
-                    self.create_ref_by_ctx(unknown_var, name_expr.lineno, name_expr.col_offset, self._typing_entities,
-                                           self._exp_ctx, name_expr))
+                self.add_ref_by_ctx(ctx, unknown_var, name_expr.lineno, name_expr.col_offset, self._typing_entities,
+                                    self._exp_ctx, name_expr)
                 return [], [(unknown_var, ValueInfo.get_any())]
         else:
             lhs_objs: SetContextValue = []
@@ -136,9 +135,8 @@ class ExprAnalyzer:
         ret: AbstractValue = []
         extend_known_possible_attribute(self.manager, attribute, possible_ents, ret, self._package_db, self._current_db)
         for ent, _ in ret:
-            self._env.get_ctx().add_ref(
-                self.create_ref_by_ctx(ent, attr_expr.lineno, attr_expr.col_offset,
-                                       self._typing_entities, self._exp_ctx, attr_expr))
+            self.add_ref_by_ctx(self._env.get_ctx(), ent, attr_expr.lineno, attr_expr.col_offset,
+                                self._typing_entities, self._exp_ctx, attr_expr)
         field_accesses = self._builder.load_field(possible_store_ables, attribute, self._exp_ctx, attr_expr)
         return field_accesses, ret
 
@@ -192,26 +190,27 @@ class ExprAnalyzer:
         # add function entity to dependency database
         self._current_db.add_ent(func_ent)
         # add reference of current context to the function entity
-        self._env.get_ctx().add_ref(
-            self.create_ref_by_ctx(func_ent, lam_expr.lineno, lam_expr.col_offset, self._typing_entities, self._exp_ctx,
-                                   lam_expr))
+        self.add_ref_by_ctx(self._env.get_ctx(), func_ent, lam_expr.lineno, lam_expr.col_offset,
+                            self._typing_entities, self._exp_ctx, lam_expr)
 
         # do not add lambda entity to the current environment
         # env.get_scope().add_continuous([(func_ent, EntType.get_bot())])
         # create the scope environment corresponding to the function
         func_summary = self.manager.create_function_summary(func_ent)
         self._new_builders.append(func_summary)
-        body_env = ScopeEnv(ctx_ent=func_ent, location=new_scope, builder=SummaryBuilder(func_summary))
+        builder = self.manager.create_summary_builder(func_summary, self._current_db.module_path)
+        body_env = ScopeEnv(ctx_ent=func_ent, location=new_scope, builder=builder)
         # do not add lambda entity to the scope environment corresponding to the function
         # body_env.add_continuous([(func_ent, EntType.get_bot())])
         # add parameters to the scope environment
         process_parameters(lam_expr.args, body_env, self._env, self.manager, self._package_db, self._current_db,
                            func_ent, func_summary, self._env.get_class_ctx())
-        hook_scope = self._env.get_scope(1) if in_class_env else self._env.get_scope()
-        # type error due to member in ast node is, but due to any member in our structure is only readable,
-        # this type error is safety
-        lam_body: List[ast.stmt] = [ast.Expr(lam_expr.body)]
-        hook_scope.add_hook(lam_body, body_env)
+        if self.manager.analyzes_bodies(self._current_db.module_path):
+            hook_scope = self._env.get_scope(1) if in_class_env else self._env.get_scope()
+            # type error due to member in ast node is, but due to any member in our structure is only readable,
+            # this type error is safety
+            lam_body: List[ast.stmt] = [ast.Expr(lam_expr.body)]
+            hook_scope.add_hook(lam_body, body_env)
         func_store_able = FuncConst(func_ent)
         return [func_store_able], [(func_ent, ValueInfo.get_any())]
 
@@ -273,11 +272,12 @@ class ExprAnalyzer:
                 for lhs, rhs in itertools.product(stores, ctx.rhs_store_ables):
                     self._builder.add_move(lhs, rhs)
 
-    def create_ref_by_ctx(self, target_ent: Entity, lineno: int, col_offset: int,
-                          typing_entities: Optional[Iterable[Entity]],
-                          ctx: ExpressionContext, expr: ast.expr) -> Ref:
+    def add_ref_by_ctx(self, ctx_ent: Entity, target_ent: Entity, lineno: int, col_offset: int,
+                       typing_entities: Optional[Iterable[Entity]],
+                       ctx: ExpressionContext, expr: ast.expr) -> None:
         """
-        Create a reference to the given entity by the expression's context.
+        Add a reference to the given entity by the expression's context, references of kinds
+        the projection doesn't build are not added.
         """
         ref_kind: RefKind
         match ctx:
@@ -289,10 +289,13 @@ class ExprAnalyzer:
                 ref_kind = RefKind.SetKind
             case _:
                 assert False, "unexpected context"
-        if typing_entities is not None:
+        module_path = self._current_db.module_path
+        target_kind = target_ent.kind()
+        if typing_entities is not None and self.manager.builds_relation(RefKind.Annotate, module_path, target_kind):
             for ent in typing_entities:
                 ent.add_ref(Ref(RefKind.Annotate, target_ent, lineno, col_offset, True, expr))
-        return Ref(ref_kind, target_ent, lineno, col_offset, typing_entities is not None, expr)
+        if self.manager.builds_relation(ref_kind, module_path, target_kind):
+            ctx_ent.add_ref(Ref(ref_kind, target_ent, lineno, col_offset, typing_entities is not None, expr))
 
     def aval_Tuple(self, tuple_exp: ast.Tuple) -> Tuple[StoreAbles, AbstractValue]:
         return self.aval_iterable_expr(tuple_exp.elts, IndexableKind.tpl, tuple_exp)
@@ -365,25 +368,29 @@ def extend_known_possible_attribute(manager: AnalyzeManager,
                                     ret: AbstractValue,
                                     package_db: RootDB,
                                     current_db: ModuleDB) -> None:
+    adds_unresolved = manager.keeps_entity(EntKind.UnresolvedAttr, current_db.module_path)
     for ent, ent_type in possible_ents:
         if isinstance(ent_type, InstanceType):
             class_attrs = ent_type.lookup_attr(attribute)
-            process_known_attr(class_attrs, attribute, ret, current_db, ent_type.class_ent, ent_type)
+            process_known_attr(class_attrs, attribute, ret, current_db, ent_type.class_ent, ent_type,
+                               adds_unresolved)
         elif isinstance(ent_type, ConstructorType):
             class_attrs = ent_type.lookup_attr(attribute)
-            process_known_attr(class_attrs, attribute, ret, current_db, ent_type.class_ent, ent_type)
+            process_known_attr(class_attrs, attribute, ret, current_db, ent_type.class_ent, ent_type,
+                               adds_unresolved)
         elif isinstance(ent_type, ModuleType):
             if isinstance(ent, Module):
                 manager.strict_analyze_module(ent)
             module_level_ents = ent_type.namespace[attribute]
-            process_known_attr(module_level_ents, attribute, ret, current_db, ent, ent_type)
+            process_known_attr(module_level_ents, attribute, ret, current_db, ent, ent_type, adds_unresolved)
         elif isinstance(ent_type, PackageType):
             package_level_ents = ent_type.namespace[attribute]
-            process_known_attr(package_level_ents, attribute, ret, current_db, ent, ent_type)
+            process_known_attr(package_level_ents, attribute, ret, current_db, ent, ent_type, adds_unresolved)
         elif isinstance(ent_type, AnyType):
             location = Location.global_name(attribute)
             referenced_attr = ReferencedAttribute(location.to_longname(), location)
-            current_db.add_ent(referenced_attr)
+            if manager.builds_referenced_attributes(current_db.module_path):
+                current_db.add_ent(referenced_attr)
             ret.append((referenced_attr, ValueInfo.get_any()))
         else:
             raise NotImplementedError("attribute receiver entity matching not implemented")
@@ -413,14 +420,15 @@ def extend_known_or_new_possible_attribute(manager: AnalyzeManager,
         elif isinstance(ent_type, AnyType):
             location = Location.global_name(attribute)
             referenced_attr = ReferencedAttribute(location.to_longname(), location)
-            current_db.add_ent(referenced_attr)
+            if manager.builds_referenced_attributes(current_db.module_path):
+                current_db.add_ent(referenced_attr)
             ret.append((referenced_attr, ValueInfo.get_any()))
         else:
             raise NotImplementedError("attribute receiver entity matching not implemented")
 
 
 def process_known_attr(attr_ents: Sequence[Entity], attribute: str, ret: AbstractValue, dep_db: ModuleDB,
-                       container: Entity, receiver_type: ValueInfo) -> None:
+                       container: Entity, receiver_type: ValueInfo, adds_unresolved: bool = True) -> None:
     if attr_ents:
         # when get attribute of another entity, presume
 
@@ -429,7 +437,8 @@ def process_known_attr(attr_ents: Sequence[Entity], attribute: str, ret: Abstrac
         # unresolved shouldn't be global
         location = container.location.append(attribute, Span.get_nil(), None)
         unresolved = UnresolvedAttribute(location.to_longname(), location, receiver_type)
-        dep_db.add_ent(unresolved)
+        if adds_unresolved:
+            dep_db.add_ent(unresolved)
         # dep_db.add_ref(container, Ref(RefKind.DefineKind, unresolved, 0, 0))
         # till now can't add `Define` reference to unresolved reference. If we do so, we could have duplicate  `Define`
         # relation in the class entity, while in a self set context.
@@ -1,21 +1,37 @@
 import ast
+import fnmatch
+import io
+import logging
 import typing as ty
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 from pathlib import Path
 
-from enre.analysis.env import EntEnv, ScopeEnv, get_from_bindings
-from enre.cfg.module_tree import FileSummary, SummaryBuilder, ModuleSummary, ClassSummary, FunctionSummary, Scene
-from enre.ent.EntKind import RefKind
+from enre.analysis.env import EntEnv, ScopeEnv, BuiltinsSubEnv, ContinuousSubEnv
+from enre.analysis.parse_cache import ParseCache
+from enre.analysis.profiler import Profiler
+from enre.analysis.projection import Projection
+from enre.cfg.module_tree import FileSummary, SummaryBuilder, ModuleSummary, ClassSummary, FunctionSummary, Scene, \
+    NullSummaryBuilder
+from enre.ent.EntKind import RefKind, EntKind
 from enre.ent.entity import Module, UnknownModule, Package, Entity, get_anonymous_ent, Class, Function, AbstractValue
 from enre.ref.Ref import Ref
 
 if ty.TYPE_CHECKING:
+    from enre.analysis.builtins_cache import BuiltinsCache
+    from enre.analysis.spill import SpillStore
     from enre.analysis.env import Bindings
 
+# progress of the analysis, one record per visited path and analyzed module
+logger = logging.getLogger(__name__)
+
 
 class ModuleStack:
     def __init__(self) -> None:
         self.finished_module_set: ty.Set[Path] = set()
         self.checking_stack: ty.List[Path] = []
+        # largest count of modules being analyzed at the same time
+        self.max_depth = 0
 
     def pop(self) -> Path:
         finished = self.checking_stack.pop()
@@ -24,6 +40,7 @@ class ModuleStack:
 
     def push(self, path: Path) -> None:
         self.checking_stack.append(path)
+        self.max_depth = max(self.max_depth, len(self.checking_stack))
 
     def finished_module(self, path: Path) -> bool:
         return path in self.finished_module_set
@@ -32,16 +49,161 @@ class ModuleStack:
         return path in self.checking_stack
 
 
+class FileSystemIndex:
+    """Files and directories of the project, relative to the parent of the project root.
+
+    Import resolution asks for the existence of many candidate paths, the index answers
+    them from memory instead of touching the filesystem. Paths outside the project are
+    not indexed and still checked on the filesystem.
+    """
+
+    def __init__(self, root_path: Path) -> None:
+        self.root_path = root_path
+        self.root_rel_path = Path(root_path.name)
+        self.files: ty.Set[Path] = set()
+        self.dirs: ty.Set[Path] = set()
+
+    def add_file(self, rel_path: Path) -> None:
+        self.files.add(rel_path)
+
+    def add_dir(self, rel_path: Path) -> None:
+        self.dirs.add(rel_path)
+
+    def covers(self, rel_path: Path) -> bool:
+        return not rel_path.is_absolute() and rel_path.parts[:1] == self.root_rel_path.parts
+
+    def exists(self, rel_path: Path) -> bool:
+        if self.covers(rel_path):
+            return rel_path in self.files or rel_path in self.dirs
+        return self.root_path.parent.joinpath(rel_path).exists()
+
+    def is_file(self, rel_path: Path) -> bool:
+        if self.covers(rel_path):
+            return rel_path in self.files
+        return self.root_path.parent.joinpath(rel_path).is_file()
+
+    def scan(self, path: Path, accept: ty.Callable[[Path], bool] = lambda path: True) -> None:
+        """
+        :param accept: paths not accepted are left out of the index, with everything under them
+        """
+        if not accept(path):
+            return
+        rel_path = path.relative_to(self.root_path.parent)
+        if path.is_file():
+            self.add_file(rel_path)
+        elif path.is_dir():
+            self.add_dir(rel_path)
+            for file in path.iterdir():
+                self.scan(file, accept)
+
+
+@dataclass(frozen=True)
+class SkippedFile:
+    # "exclude", "include" or "size"
+    reason: str
+    # size in bytes, None for a skipped directory
+    size: ty.Optional[int]
+
+
+class DiscoveryFilter:
+    """Decide which files and directories of the project are analyzed.
+
+    Patterns are matched by `fnmatch` against paths relative to the project root,
+    `*` also matches `/`. An excluded directory is not visited at all. If include
+    patterns are given, only modules matching one of them are analyzed. Modules
+    larger than `max_file_size` bytes are skipped too.
+    """
+
+    def __init__(self, include: ty.Sequence[str] = (), exclude: ty.Sequence[str] = (),
+                 max_file_size: ty.Optional[int] = None) -> None:
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.max_file_size = max_file_size
+
+    def skip(self, path: Path, root_path: Path) -> ty.Optional[SkippedFile]:
+        """
+        :return: why the path is skipped, None if it's analyzed
+        """
+        if path == root_path or not (self.include or self.exclude or self.max_file_size is not None):
+            return None
+        pattern_path = path.relative_to(root_path).as_posix()
+        if any(fnmatch.fnmatch(pattern_path, pattern) for pattern in self.exclude):
+            return SkippedFile("exclude", None if path.is_dir() else _file_size(path))
+        if not path.name.endswith(".py") or not path.is_file():
+            return None
+        if self.include and not any(fnmatch.fnmatch(pattern_path, pattern) for pattern in self.include):
+            return SkippedFile("include", _file_size(path))
+        if self.max_file_size is not None:
+            size = _file_size(path)
+            if size is not None and size > self.max_file_size:
+                return SkippedFile("size", size)
+        return None
+
+
+def _file_size(path: Path) -> ty.Optional[int]:
+    try:
+        return path.stat().st_size
+    except OSError:
+        return None
+
+
+def parse_module_file(absolute_path: Path, file_name: str, parse_cache: ty.Optional[ParseCache] = None) -> ast.Module:
+    if parse_cache is None:
+        try:
+            return ast.parse(absolute_path.read_text(encoding="utf-8"), file_name)
+        except (SyntaxError, UnicodeDecodeError):
+            return ast.Module([])
+    try:
+        source = absolute_path.read_bytes()
+    except OSError:
+        # keep the same error as reading the file without cache
+        return ast.parse(absolute_path.read_text(encoding="utf-8"), file_name)
+    key = parse_cache.key(source)
+    cached_tree = parse_cache.load(key)
+    if cached_tree is not None:
+        return cached_tree
+    tree: ast.Module
+    try:
+        # decode like `Path.read_text` does, including the newline translation
+        tree = ast.parse(io.TextIOWrapper(io.BytesIO(source), encoding="utf-8").read(), file_name)
+    except (SyntaxError, UnicodeDecodeError):
+        tree = ast.Module([], [])
+    parse_cache.store(key, tree)
+    return tree
+
+
+def parse_modules_parallel(project_root: Path, module_paths: ty.List[Path], jobs: int,
+                           parse_cache: ty.Optional[ParseCache] = None) -> ty.Dict[Path, ast.Module]:
+    """
+    Parse modules in a process pool, the parsed trees are sent back to the main process.
+    :param project_root: the root directory of the analyzed project
+    :param module_paths: paths of modules relative to the parent of the project root
+    :param jobs: count of worker processes
+    :param parse_cache: the cache shared by all workers, None if the cache is disabled
+    :return: the map from module path to its syntax tree
+    """
+    absolute_paths = [project_root.parent.joinpath(module_path) for module_path in module_paths]
+    file_names = [module_path.name for module_path in module_paths]
+    chunk_size = max(1, len(module_paths) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        trees = executor.map(parse_module_file, absolute_paths, file_names, [parse_cache] * len(module_paths),
+                             chunksize=chunk_size)
+        return dict(zip(module_paths, trees))
+
+
 class ModuleDB:
-    def __init__(self, project_root: Path, module_ent: Module):
+    def __init__(self, project_root: Path, module_ent: Module, tree: ty.Optional[ast.Module] = None,
+                 parse_cache: ty.Optional[ParseCache] = None):
         from enre.dep.DepDB import DepDB
         self.project_root = project_root
+        self.parse_cache = parse_cache
         self.module_path = module_ent.module_path
         self.module_ent = module_ent
         self.dep_db = DepDB()
         self.dep_db.add_ent(self.module_ent)
         self.ent_id_set: ty.Set[int] = set()
-        self._tree = self.parse_a_module(self.module_path)
+        # the module is parsed when the analysis reaches it, unless a parsed tree is given
+        self._tree: ty.Optional[ast.Module] = tree
         self.analyzed_set: ty.Set[ast.AST] = set()
 
     def add_ent(self, ent: "Entity") -> None:
@@ -51,14 +213,30 @@ class ModuleDB:
 
     @property
     def tree(self) -> ast.Module:
+        if self._tree is None:
+            self._tree = self.parse_a_module(self.module_path)
         return self._tree
 
+    def release_tree(self) -> None:
+        """
+        Drop the syntax tree after the module is analyzed, nodes still referred by
+        references and summaries are kept alive by them. The tree would be parsed
+        again if it's accessed later.
+        """
+        self._tree = None
+        self.analyzed_set = set()
+
+    def __getstate__(self) -> ty.Dict[str, ty.Any]:
+        # syntax trees can be parsed again, don't keep them in a pickled database
+        state = self.__dict__.copy()
+        state["_tree"] = None
+        state["analyzed_set"] = set()
+        state["parse_cache"] = None
+        return state
+
     def parse_a_module(self, module_path: Path) -> ast.Module:
         absolute_path = self.project_root.parent.joinpath(module_path)
-        try:
-            return ast.parse(absolute_path.read_text(encoding="utf-8"), module_path.name)
-        except (SyntaxError, UnicodeDecodeError):
-            return ast.Module([])
+        return parse_module_file(absolute_path, module_path.name, self.parse_cache)
 
     def get_module_level_bindings(self) -> "Bindings":
         bindings: Bindings = []
@@ -69,24 +247,59 @@ class ModuleDB:
 
 
 class RootDB:
-    def __init__(self, root_path: Path):
+    def __init__(self, root_path: Path, jobs: int = 1, parse_cache: ty.Optional[ParseCache] = None,
+                 discovery: ty.Optional[DiscoveryFilter] = None):
         from enre.dep.DepDB import DepDB
         self.root_dir = root_path
         self.global_db = DepDB()
         self.tree: ty.Dict[Path, ModuleDB] = dict()
         self.package_tree: ty.Dict[Path, Package] = dict()
+        self.parse_cache = parse_cache
+        self.discovery = discovery if discovery is not None else DiscoveryFilter()
+        # kinds of relations and entities reported, references of other kinds may not be created
+        self.projection = Projection()
+        # paths left out of the analysis by the discovery filter
+        self.skipped_files: ty.Dict[Path, SkippedFile] = dict()
+        self.fs_index = FileSystemIndex(root_path)
+        # references of finished modules are spilled to it when the memory budget is exceeded
+        self.spill_store: ty.Optional[SpillStore] = None
+        self._parsed_trees: ty.Dict[Path, ast.Module] = dict()
+        if jobs > 1:
+            self._parsed_trees = parse_modules_parallel(root_path, self.collect_py_files(root_path), jobs,
+                                                        parse_cache)
         self.initialize_tree(root_path)
+        self._parsed_trees.clear()
+        if parse_cache is not None:
+            parse_cache.evict()
         self.global_db.add_ent(get_anonymous_ent())
 
+    def accept(self, path: Path) -> bool:
+        """
+        Check the path with the discovery filter and record it if it's skipped.
+        """
+        rel_path = path.relative_to(self.root_dir.parent)
+        skipped = self.discovery.skip(path, self.root_dir)
+        if skipped is None:
+            self.skipped_files.pop(rel_path, None)
+            return True
+        self.skipped_files[rel_path] = skipped
+        return False
+
     def initialize_tree(self, path: Path) -> ty.List[Path]:
         py_files: ty.List[Path] = []
         rel_path = path.relative_to(self.root_dir.parent)
+        if not self.accept(path):
+            return py_files
+        if path.is_file():
+            self.fs_index.add_file(rel_path)
         if path.is_file() and path.name.endswith(".py"):
             py_files.append(rel_path)
             from enre.dep.DepDB import DepDB
             module_ent = Module(rel_path)
-            self.tree[rel_path] = ModuleDB(self.root_dir, module_ent)
+            self.tree[rel_path] = ModuleDB(self.root_dir, module_ent, self._parsed_trees.get(rel_path),
+                                           self.parse_cache)
         elif path.is_dir():
+            self.fs_index.add_dir(rel_path)
             sub_py_files = []
             for file in path.iterdir():
                 sub_py_files.extend(self.initialize_tree(file))
@@ -106,6 +319,32 @@ class RootDB:
 
         return py_files
 
+    def collect_py_files(self, path: Path) -> ty.List[Path]:
+        py_files: ty.List[Path] = []
+        if not self.accept(path):
+            return py_files
+        if path.is_file() and path.name.endswith(".py"):
+            py_files.append(path.relative_to(self.root_dir.parent))
+        elif path.is_dir():
+            for file in path.iterdir():
+                py_files.extend(self.collect_py_files(file))
+        return py_files
+
+    def checkpoint(self) -> None:
+        """
+        Called between modules by the analysis and the passes, when no references of
+        finished modules are being iterated, to spill them if memory is over the budget.
+        """
+        if self.spill_store is not None:
+            self.spill_store.checkpoint()
+
+    def absolute_path(self, rel_path: Path) -> Path:
+        return self.root_dir.parent.joinpath(rel_path)
+
+    def rebuild_fs_index(self) -> None:
+        self.fs_index = FileSystemIndex(self.root_dir)
+        self.fs_index.scan(self.root_dir, self.accept)
+
     def get_module_db_of_path(self, item: Path) -> ModuleDB:
         return self.tree[item]
 
@@ -122,21 +361,50 @@ class RootDB:
         self.tree[file_path].add_ent(ent)
 
 
-def merge_db(package_db: RootDB) -> "DepDB":
-    raise NotImplementedError("not implemented yet")
-
-
 class AnalyzeManager:
-    def __init__(self, root_path: Path, builtin_path: ty.Optional[Path]):
+    def __init__(self, root_path: Path, builtin_path: ty.Optional[Path], jobs: int = 1,
+                 parse_cache: ty.Optional[ParseCache] = None, builtins_cache: ty.Optional["BuiltinsCache"] = None,
+                 discovery: ty.Optional[DiscoveryFilter] = None, memory_budget: ty.Optional[int] = None,
+                 outline: bool = False, build_summaries: bool = True,
+                 projection: ty.Optional[Projection] = None):
+        """
+        :param memory_budget: resident set size in bytes above which references of finished
+            modules are spilled to disk, None to keep everything in memory
+        :param outline: only analyze declarations, function and lambda bodies of the project
+            are not visited
+        :param build_summaries: add the rules of the control flow analysis to the summaries, the
+            summaries of the project are empty without it
+        :param projection: kinds of relations and entities to report, references and helper
+            entities which can't be reported are not created
+        """
         self.project_root = root_path
-        self.root_db = RootDB(root_path)
+        self.jobs = jobs
+        self.profiler = Profiler()
+        with self.profiler.measure("tree"):
+            self.root_db = RootDB(root_path, jobs, parse_cache, discovery)
+        if memory_budget is not None:
+            from enre.analysis.spill import SpillStore
+            self.root_db.spill_store = SpillStore(memory_budget)
         self.module_stack = ModuleStack()
         self.scene: Scene = Scene()
         self.builtin_path = builtin_path
-        self.builtins_bindings: ty.Optional[Bindings] = None
+        self.outline = outline
+        self.build_summaries = build_summaries
+        if projection is not None:
+            self.root_db.projection = projection
+        self.builtins_sub_env: ty.Optional[BuiltinsSubEnv] = None
+        self.builtins_cache = builtins_cache
+        # module path to the paths of modules it imports, discovered while analyzing
+        self.import_graph: ty.Dict[Path, ty.Set[Path]] = dict()
+        # modules containing imports which can't be resolved in the project
+        self.unresolved_importers: ty.Set[Path] = set()
+        # import resolution results by the importing directory and the imported name
+        self._alias_paths: ty.Dict[ty.Tuple[Path, str], ty.Tuple[Path, Path]] = dict()
+        self._resolved_imports: ty.Dict[ty.Tuple[Path, Path], ty.Optional[Path]] = dict()
         if builtin_path:
             self.root_db.tree[builtin_path] = ModuleDB(self.project_root,
-                                                       Module(builtin_path, hard_longname=["builtins"]))
+                                                       Module(builtin_path, hard_longname=["builtins"]),
+                                                       parse_cache=parse_cache)
 
     def dir_structure_init(self, file_path: ty.Optional[Path] = None) -> bool:
         in_package = False
@@ -158,66 +426,166 @@ class AnalyzeManager:
 
         return in_package
 
-    def work_flow(self) -> None:
-        from enre.passes.entity_pass import EntityPass
+    def work_flow(self, parallel: bool = False) -> None:
+        """
+        :param parallel: analyze modules which don't import each other in `jobs` worker processes
+        """
+        if parallel and self.jobs > 1:
+            from enre.analysis.parallel import analyze_parallel
+            analyze_parallel(self, self.jobs)
+        else:
+            self.analyze_builtins()
+            with self.profiler.measure("modules"):
+                self.iter_dir(self.project_root)
+        self.run_global_passes()
+        self.evict_parse_cache()
+
+    def evict_parse_cache(self) -> None:
+        # trees of modules parsed while analyzing them are stored after the eviction of the tree initialization
+        parse_cache = self.root_db.parse_cache
+        if parse_cache is not None:
+            parse_cache.evict()
+
+    def run_global_passes(self) -> None:
         from enre.passes.build_ambiguous import BuildAmbiguous
         from enre.passes.build_visibility import BuildVisibility
-        self.analyze_builtins()
-        self.iter_dir(self.project_root)
-        build_ambiguous_pass = BuildAmbiguous(self.root_db)
-        build_ambiguous_pass.execute_pass()
-        build_visibility_pass = BuildVisibility(self.root_db)
-        build_visibility_pass.work_flow()
+        spill_store = self.root_db.spill_store
+        if spill_store is not None:
+            # builtins and modules merged from worker processes are finished as well
+            for rel_path, module_db in self.root_db.tree.items():
+                spill_store.module_finished(rel_path, module_db)
+        with self.profiler.measure("BuildAmbiguous"):
+            build_ambiguous_pass = BuildAmbiguous(self.root_db)
+            build_ambiguous_pass.execute_pass()
+        with self.profiler.measure("BuildVisibility"):
+            build_visibility_pass = BuildVisibility(self.root_db)
+            build_visibility_pass.work_flow()
 
     def iter_dir(self, path: Path) -> None:
         from enre.analysis.analyze_stmt import Analyzer
-        print(path)
+        logger.debug("visiting %s", path)
+        if path.relative_to(self.project_root.parent) in self.root_db.skipped_files:
+            return
         if path.is_dir():
             for sub_file in path.iterdir():
                 self.iter_dir(sub_file)
         elif path.name.endswith(".py"):
-            rel_path = path.relative_to(self.project_root.parent)
-            if self.module_stack.finished_module(rel_path):
-                print(f"the module {rel_path} already imported by some analyzed module")
-                return
-            else:
-                self.module_stack.push(rel_path)
-                self.analyze_module_top_stmts(rel_path)
-                self.module_stack.pop()
+            self.analyze_module(path.relative_to(self.project_root.parent))
 
-    def analyze_module_top_stmts(self, rel_path: Path) -> None:
+    def analyze_module(self, rel_path: Path) -> None:
+        if self.module_stack.finished_module(rel_path):
+            logger.debug("the module %s already imported by some analyzed module", rel_path)
+            return
+        else:
+            self.schedule_modules(rel_path)
+
+    def schedule_modules(self, rel_path: Path) -> None:
+        """
+        Analyze the module and the modules imported by it. A module is suspended before
+        a statement importing names from a module not analyzed yet, and resumed after
+        the imported module is finished, so a chain of imports is kept in a work stack
+        instead of nested calls.
+        """
+        work: ty.List[ty.Iterator[Path]] = []
+
+        def start(path: Path) -> None:
+            self.module_stack.push(path)
+            work.append(self.iter_module_top_stmts(path))
+
+        start(rel_path)
+        while work:
+            try:
+                imported_path = next(work[-1])
+            except StopIteration:
+                work.pop()
+                finished = self.module_stack.pop()
+                if self.root_db.spill_store is not None:
+                    self.root_db.spill_store.module_finished(finished, self.root_db.get_module_db_of_path(finished))
+                    self.root_db.checkpoint()
+                continue
+            if not self.need_analyze(imported_path):
+                logger.debug("importing the module %s now analyzing this module", imported_path)
+                start(imported_path)
+
+    def iter_module_top_stmts(self, rel_path: Path) -> ty.Iterator[Path]:
+        """
+        Analyze the module, yield the modules which must be analyzed before the analysis is resumed.
+        """
         from enre.analysis.analyze_stmt import Analyzer
         module_ent = self.root_db.get_module_db_of_path(rel_path).module_ent
         checker = Analyzer(rel_path, self)
         module_summary = self.create_file_summary(module_ent)
-        builder = SummaryBuilder(module_summary)
-        top_scope = ScopeEnv(module_ent, module_ent.location, SummaryBuilder(module_summary))
+        builder = self.create_summary_builder(module_summary, rel_path)
+        top_scope = ScopeEnv(module_ent, module_ent.location, self.create_summary_builder(module_summary, rel_path))
         if self.builtin_path:
             builtins_module_db = self.root_db.get_module_db_of_path(self.builtin_path)
             self.add_builtins_binding_to_scope(builtins_module_db, top_scope)
-        checker.analyze_top_stmts(checker.current_db.tree.body, builder,
-                                  EntEnv(top_scope))
+        with self.profiler.measure("modules", rel_path):
+            with self.profiler.measure("parse"):
+                tree = checker.current_db.tree
+            yield from checker.iter_top_stmts(tree.body, builder, EntEnv(top_scope))
+        # hooks of all scopes are analyzed at the end of analyze_top_stmts
+        checker.current_db.release_tree()
 
     def add_builtins_binding_to_scope(self, module_db: ModuleDB, scope: ScopeEnv) -> None:
-        if self.builtins_bindings:
-            scope.add_continuous(self.builtins_bindings)
-            return
+        # names bound by the module are found before the shared builtins
+        top_sub_env = scope.pop_sub_env()
+        scope.add_sub_env(ContinuousSubEnv(self.get_builtins_sub_env(module_db), top_sub_env))
+
+    def get_builtins_sub_env(self, module_db: ModuleDB) -> BuiltinsSubEnv:
+        if self.builtins_sub_env is not None:
+            return self.builtins_sub_env
         bindings: Bindings = module_db.get_module_level_bindings()
         bindings.append(("builtins", [(module_db.module_ent, module_db.module_ent.direct_type())]))
-        scope.add_continuous(bindings)
-        self.builtins_bindings = bindings
+        self.builtins_sub_env = BuiltinsSubEnv(bindings)
+        return self.builtins_sub_env
+
+    def analyzes_bodies(self, module_path: Path) -> bool:
+        """
+        :return: False if bodies of functions and lambdas of the module are skipped, the builtins
+            module is fully analyzed in outline mode so its cached snapshot is the same
+        """
+        return not self.outline or module_path == self.builtin_path
+
+    def builds_relation(self, kind: RefKind, module_path: Path, target_kind: ty.Optional[EntKind] = None) -> bool:
+        """
+        :return: False if references of the kind from entities of the module are not created,
+            references of the builtins module are always created so its cached snapshot is the same
+        """
+        projection = self.root_db.projection
+        if module_path == self.builtin_path or projection.builds(kind, target_kind):
+            return True
+        # invokes of the summaries at use references are not aggregated to new call references
+        return kind == RefKind.UseKind and self.build_summaries and projection.keeps_relation(RefKind.CallKind)
+
+    def keeps_entity(self, kind: EntKind, module_path: Path) -> bool:
+        return module_path == self.builtin_path or self.root_db.projection.keeps_entity(kind)
+
+    def builds_referenced_attributes(self, module_path: Path) -> bool:
+        return module_path == self.builtin_path or self.root_db.projection.builds_referenced_attributes()
 
     def analyze_builtins(self) -> None:
-        from enre.analysis.analyze_stmt import Analyzer
         if not self.builtin_path:
             return
+        with self.profiler.measure("builtins"):
+            if self.builtins_cache is not None:
+                self.builtins_cache.analyze_builtins(self, self._analyze_builtins)
+            else:
+                self._analyze_builtins()
+
+    def _analyze_builtins(self) -> None:
+        from enre.analysis.analyze_stmt import Analyzer
+        assert self.builtin_path is not None
         checker = Analyzer(self.builtin_path, self)
         module_ent = self.root_db.get_module_db_of_path(self.builtin_path).module_ent
         module_summary = self.create_file_summary(module_ent)
         builder = SummaryBuilder(module_summary)
-        checker.analyze_top_stmts(checker.current_db.tree.body, builder,
+        with self.profiler.measure("parse"):
+            tree = checker.current_db.tree
+        checker.analyze_top_stmts(tree.body, builder,
                                   EntEnv(ScopeEnv(module_ent, module_ent.location,
                                                   SummaryBuilder(module_summary))))
+        checker.current_db.release_tree()
 
     def need_analyze(self, rel_path: Path) -> bool:
         return self.module_stack.in_process(rel_path) or self.module_stack.finished_module(rel_path)
@@ -227,16 +595,20 @@ class AnalyzeManager:
         ty.Union[Module, Package], ty.Union[Module, Package]]:
         rel_path, head_module_path = self.alias2path(from_module_ent.module_path, module_identifier)
         if self.need_analyze(rel_path):
+            self.record_import(from_module_ent.module_path, rel_path)
             return self.root_db.get_module_db_of_path(rel_path).module_ent, self.root_db.get_path_ent(head_module_path)
         elif (p := self.resolve_import(from_module_ent, rel_path)) is not None:
-            if p.is_file():
+            fs_index = self.root_db.fs_index
+            p_rel = p.relative_to(self.project_root.parent)
+            if fs_index.is_file(p_rel):
+                self.record_import(from_module_ent.module_path, rel_path)
                 module_ent = self.root_db.get_module_db_of_path(rel_path).module_ent
                 if strict:
                     self.strict_analyze_module(module_ent)
                 return module_ent, self.root_db.get_path_ent(head_module_path)
             elif rel_path in self.root_db.package_tree:
                 package_ent = self.root_db.package_tree[rel_path]
-                if p.joinpath("__init__.py").exists():
+                if fs_index.exists(p_rel.joinpath("__init__.py")):
                     return self.import_module(from_module_ent, f"{module_identifier}.__init__", lineno, col_offset,
                                               strict)
                 return package_ent, self.root_db.get_path_ent(rel_path)
@@ -245,27 +617,77 @@ class AnalyzeManager:
                 self.root_db.package_tree[rel_path] = package_ent
                 return package_ent, self.root_db.get_path_ent(rel_path)
         else:
+            self.unresolved_importers.add(from_module_ent.module_path)
             unknown_module_name = module_identifier.split(".")[-1]
             unknown_module_ent = UnknownModule(unknown_module_name)
             module_db = self.root_db.get_module_db_of_path(from_module_ent.module_path)
             module_db.add_ent(unknown_module_ent)
-            from_module_ent.add_ref(Ref(RefKind.ImportKind, unknown_module_ent, lineno, col_offset, False, None))
+            if self.builds_relation(RefKind.ImportKind, from_module_ent.module_path):
+                from_module_ent.add_ref(Ref(RefKind.ImportKind, unknown_module_ent, lineno, col_offset, False, None))
             return unknown_module_ent, unknown_module_ent
             # raise NotImplementedError("unknown module not implemented yet")
 
+    def record_import(self, from_path: Path, imported_path: Path) -> None:
+        if from_path != imported_path:
+            self.import_graph.setdefault(from_path, set()).add(imported_path)
+
     def strict_analyze_module(self, module_ent: Module) -> None:
+        if self.module_stack.checking_stack:
+            self.record_import(self.module_stack.checking_stack[-1], module_ent.module_path)
         if self.module_stack.in_process(module_ent.module_path) or \
                 self.module_stack.finished_module(module_ent.module_path):
             return
-        from enre.analysis.analyze_stmt import Analyzer
         rel_path = module_ent.module_path
-        self.module_stack.push(rel_path)
-        print(f"importing the module {rel_path} now analyzing this module")
-        self.analyze_module_top_stmts(rel_path)
-        print(f"module {rel_path} finished")
-        self.module_stack.pop()
+        logger.debug("importing the module %s now analyzing this module", rel_path)
+        self.schedule_modules(rel_path)
+        logger.debug("module %s finished", rel_path)
+
+    def strict_imports(self, from_module_ent: Module, stmt: ast.stmt) -> ty.Iterator[Path]:
+        """
+        The module not analyzed yet which stmt imports names from if it's a `from ... import`
+        statement, the analyzer yields it when it reaches the statement, so entities are
+        created in the order of the statements.
+        """
+        if isinstance(stmt, ast.ImportFrom) and stmt.module is not None:
+            imported_path = self.strict_import_target(from_module_ent, stmt.module)
+            if imported_path is not None:
+                yield imported_path
+
+    def strict_import_target(self, from_module_ent: Module, module_identifier: str) -> ty.Optional[Path]:
+        """
+        :return: the module `import_module` would analyze for a strict import, None if
+            it's analyzed or being analyzed, or the import doesn't resolve to a module
+        """
+        rel_path, _ = self.alias2path(from_module_ent.module_path, module_identifier)
+        if self.need_analyze(rel_path):
+            return None
+        p = self.resolve_import(from_module_ent, rel_path)
+        if p is None:
+            return None
+        fs_index = self.root_db.fs_index
+        p_rel = p.relative_to(self.project_root.parent)
+        if fs_index.is_file(p_rel):
+            return rel_path
+        elif rel_path in self.root_db.package_tree and fs_index.exists(p_rel.joinpath("__init__.py")):
+            return self.strict_import_target(from_module_ent, f"{module_identifier}.__init__")
+        return None
+
+    def refresh_fs_index(self) -> None:
+        """
+        Scan the project tree again and forget the import resolution results,
+        used when files are added or removed after the manager is created.
+        """
+        self.root_db.rebuild_fs_index()
+        self._alias_paths.clear()
+        self._resolved_imports.clear()
 
     def alias2path(self, from_path: Path, alias: str) -> ty.Tuple[Path, Path]:
+        key = (from_path.parent, alias)
+        if key not in self._alias_paths:
+            self._alias_paths[key] = self._alias2path(from_path, alias)
+        return self._alias_paths[key]
+
+    def _alias2path(self, from_path: Path, alias: str) -> ty.Tuple[Path, Path]:
         def resolve_head_path(imported_path: Path, head_path: Path) -> ty.Tuple[Path, Path]:
             if str(imported_path) == str(head_path) + ".py":
                 return imported_path, imported_path
@@ -276,13 +698,14 @@ class AnalyzeManager:
         head_module_name = path_elems[0]
         rel_path = Path("/".join(path_elems) + ".py")
         dir_rel_path = Path("/".join(path_elems))
+        fs_index = self.root_db.fs_index
         from_path = from_path.parent
         while True:
             if from_path == Path():
                 break
-            if self.project_root.parent.joinpath(from_path).joinpath(rel_path).exists():
+            if fs_index.exists(from_path.joinpath(rel_path)):
                 return resolve_head_path(from_path.joinpath(rel_path), from_path.joinpath(head_module_name))
-            elif self.project_root.parent.joinpath(from_path).joinpath(dir_rel_path).exists():
+            elif fs_index.exists(from_path.joinpath(dir_rel_path)):
                 return resolve_head_path(from_path.joinpath(dir_rel_path), from_path.joinpath(head_module_name))
             from_path = from_path.parent
         return rel_path, from_path.joinpath(head_module_name)
@@ -290,6 +713,15 @@ class AnalyzeManager:
     def add_summary(self, summary: ModuleSummary) -> None:
         self.scene.summaries.append(summary)
 
+    def create_summary_builder(self, summary: ModuleSummary, module_path: Path) -> SummaryBuilder:
+        """
+        :return: a builder of the summary of an entity of the module, the builtins module is
+            always summarized so its cached snapshot is the same
+        """
+        if self.build_summaries or module_path == self.builtin_path:
+            return SummaryBuilder(summary)
+        return NullSummaryBuilder(summary)
+
     def create_file_summary(self, module_ent: Module) -> FileSummary:
         summary = FileSummary(module_ent)
         self.scene.summary_map[module_ent] = summary
@@ -309,19 +741,28 @@ class AnalyzeManager:
         return summary
 
     def get_from_builtins(self, name: str) -> "ty.Optional[AbstractValue]":
-        if self.builtins_bindings:
-            return get_from_bindings(name, self.builtins_bindings)
+        if self.builtins_sub_env is not None:
+            return self.builtins_sub_env.get(name).found_entities
         else:
             return None
 
     def resolve_import(self, from_module: Module, rel_path: Path) -> ty.Optional[Path]:
+        key = (from_module.module_path.parent, rel_path)
+        if key not in self._resolved_imports:
+            self._resolved_imports[key] = self._resolve_import(from_module.module_path.parent, rel_path)
+        return self._resolved_imports[key]
+
+    def _resolve_import(self, from_dir: Path, rel_path: Path) -> ty.Optional[Path]:
         project_root = self.project_root
-        parent_dir = project_root.parent.joinpath(from_module.module_path.parent)
+        fs_index = self.root_db.fs_index
+        parent_dir = project_root.parent.joinpath(from_dir)
+        if parent_dir.is_relative_to(project_root.parent):
+            parent_dir = parent_dir.relative_to(project_root.parent)
         while True:
             target_module_path = parent_dir.joinpath(rel_path)
-            if target_module_path.exists() and target_module_path.relative_to(project_root.parent) in self.root_db.tree:
-                return target_module_path
-            if parent_dir.samefile(project_root.parent):
+            if target_module_path in self.root_db.tree and fs_index.exists(target_module_path):
+                return project_root.parent.joinpath(target_module_path)
+            if parent_dir == Path() or parent_dir == parent_dir.parent:
                 break
             parent_dir = parent_dir.parent
 
@@ -329,4 +770,5 @@ class AnalyzeManager:
 
     def in_root_db(self, path: Path) -> bool:
         project_root = self.project_root
-        return path.exists() and path.relative_to(project_root.parent) in self.root_db.tree
+        rel_path = path.relative_to(project_root.parent)
+        return rel_path in self.root_db.tree and self.root_db.fs_index.exists(rel_path)
@@ -1,4 +1,5 @@
 import ast
+import logging
 import typing as ty
 from dataclasses import dataclass
 from pathlib import Path
@@ -22,6 +23,8 @@ from enre.ref.Ref import Ref
 if ty.TYPE_CHECKING:
     from enre.analysis.env import Binding, Bindings
 
+logger = logging.getLogger(__name__)
+
 DefaultDefHeadLen = 4
 DefaultClassHeadLen = 6
 DefaultAsyncDefHeadLen = 8
@@ -52,18 +55,35 @@ class Analyzer:
 
     def analyze(self, stmt: ast.AST, env: EntEnv) -> None:
         """Visit a node."""
-        method = 'analyze_' + stmt.__class__.__name__
+        for imported_path in self.iter_analyze(stmt, env):
+            self.manager.schedule_modules(imported_path)
+
+    def iter_analyze(self, stmt: ast.AST, env: EntEnv) -> ty.Iterator[Path]:
+        """
+        Visit a node like `analyze`, but before a `from ... import` statement in it is analyzed,
+        yield the module the statement needs to be analyzed first. The caller analyzes it before
+        resuming the iteration, so the visitors of statements containing other statements are
+        generators suspended inside the containing statements.
+        """
+        name = stmt.__class__.__name__
         default_avaler = self.get_default_avaler(env)
         if isinstance(stmt, ast.expr):
             default_avaler.aval(stmt)
             return
         if stmt in self.current_db.analyzed_set:
             return
-        visitor = getattr(self, method, self.generic_analyze)
-        visitor(stmt, env)
+        iter_visitor = getattr(self, 'iter_analyze_' + name, None)
+        if iter_visitor is not None:
+            yield from iter_visitor(stmt, env)
+        else:
+            visitor = getattr(self, 'analyze_' + name, None)
+            if visitor is not None:
+                visitor(stmt, env)
+            else:
+                yield from self.iter_generic_analyze(stmt, env)
         self.current_db.analyzed_set.add(stmt)
 
-    def generic_analyze(self, stmt: ast.AST, env: EntEnv) -> None:
+    def iter_generic_analyze(self, stmt: ast.AST, env: EntEnv) -> ty.Iterator[Path]:
         """Called if no explicit visitor function exists for a node."""
         default_avaler = self.get_default_avaler(env)
         for field, value in ast.iter_fields(stmt):
@@ -72,9 +92,9 @@ class Analyzer:
                     if isinstance(item, ast.expr):
                         default_avaler.aval(item)
                     elif isinstance(item, ast.AST):
-                        self.analyze(item, env)
+                        yield from self.iter_analyze(item, env)
             elif isinstance(value, ast.AST):
-                self.analyze(value, env)
+                yield from self.iter_analyze(value, env)
 
     def analyze_function(self, name: str, args: ast.arguments, body: ty.List[ast.stmt], span: Span,
                          decorators: ty.List[ast.expr], env: EntEnv) -> Function:
@@ -94,7 +114,7 @@ class Analyzer:
         fun_summary = self.manager.create_function_summary(func_ent)
         env.get_scope().get_builder().add_child(fun_summary)
         # and corresponding summary builder
-        builder = SummaryBuilder(fun_summary)
+        builder = self.manager.create_summary_builder(fun_summary, self.current_db.module_path)
         # add function entity to the current environment
         new_binding: "Bindings" = [(func_name, [(func_ent, ValueInfo.get_any())])]
         env.get_scope().add_continuous(new_binding)
@@ -111,8 +131,9 @@ class Analyzer:
                                   env.get_scope().get_builder(), env)
             decorator_stores, _ = avaler.aval(decorator)
             parent_builder.add_invoke(decorator_stores, [[FuncConst(func_ent)]], [], decorator)
-        hook_scope = env.get_scope(1) if in_class_env else env.get_scope()
-        hook_scope.add_hook(body, body_env)
+        if self.manager.analyzes_bodies(self.current_db.module_path):
+            hook_scope = env.get_scope(1) if in_class_env else env.get_scope()
+            hook_scope.add_hook(body, body_env)
         return func_ent
 
     def analyze_FunctionDef(self, def_stmt: ast.FunctionDef, env: EntEnv) -> None:
@@ -140,7 +161,7 @@ class Analyzer:
         func_ent.static_kind = method_visitor.static_kind
         func_ent.readonly_property_name = method_visitor.readonly_property_name
 
-    def analyze_ClassDef(self, class_stmt: ast.ClassDef, env: EntEnv) -> None:
+    def iter_analyze_ClassDef(self, class_stmt: ast.ClassDef, env: EntEnv) -> ty.Iterator[Path]:
         avaler = self.get_default_avaler(env)
         now_location = env.get_scope().get_location()
         class_code_span = get_syntactic_head(class_stmt)
@@ -169,31 +190,31 @@ class Analyzer:
         env.get_scope().add_continuous(new_binding)
         class_summary = self.manager.create_class_summary(class_ent)
         parent_builder.add_child(class_summary)
-        builder = SummaryBuilder(class_summary)
+        builder = self.manager.create_summary_builder(class_summary, self.current_db.module_path)
         body_env = ScopeEnv(ctx_ent=class_ent, location=new_scope, class_ctx=class_ent, builder=builder)
         body_env.add_continuous(new_binding)
         # todo: bugfix, the environment should be same as the environment of class
         env.add_scope(body_env)
 
-        self.analyze_top_stmts(class_stmt.body, builder, env)
+        yield from self.iter_top_stmts(class_stmt.body, builder, env)
         env.pop_scope()
         # env.get_scope().add_hook(class_stmt.body, body_env)
         # we can't use this solution because after class definition, the stmts after class definition should be able to
         # known the class's attribute
 
-    def analyze_If(self, if_stmt: ast.If, env: EntEnv) -> None:
+    def iter_analyze_If(self, if_stmt: ast.If, env: EntEnv) -> ty.Iterator[Path]:
         in_len = len(env.get_scope())
         avaler = self.get_default_avaler(env)
         avaler.aval(if_stmt.test)
         before = len(env.get_scope())
         env.add_sub_env(BasicSubEnv())
-        self.analyze_stmts(if_stmt.body, env)
+        yield from self.iter_stmts(if_stmt.body, env)
         body_env = env.pop_sub_env()
         after = len(env.get_scope())
         assert before == after
         for stmt in if_stmt.orelse:
             env.add_sub_env(BasicSubEnv())
-            self.analyze(stmt, env)
+            yield from self.iter_analyze(stmt, env)
             branch_env = env.pop_sub_env()
             body_env = ParallelSubEnv(body_env, branch_env)
         if not if_stmt.orelse:
@@ -204,7 +225,7 @@ class Analyzer:
         # print(f"in length: {in_len} out length: {out_len}")
         assert (in_len == out_len)
 
-    def analyze_For(self, for_stmt: ast.For, env: EntEnv) -> None:
+    def iter_analyze_For(self, for_stmt: ast.For, env: EntEnv) -> ty.Iterator[Path]:
         from enre.analysis.assign_target import unpack_semantic, dummy_iter
         iterable_store, iterable = self.get_default_avaler(env).aval(for_stmt.iter)
         iter_value = dummy_iter(iterable)
@@ -220,7 +241,7 @@ class Analyzer:
         # self._avaler.aval(for_stmt.iter, env)
         # todo: verify it's two re evaluation
         env.add_sub_env(BasicSubEnv())
-        self.analyze_stmts(for_stmt.body, env)
+        yield from self.iter_stmts(for_stmt.body, env)
         sub_env = env.pop_sub_env()
         optional_sub_env = OptionalSubEnv(sub_env)
         continuous_sub_env = ContinuousSubEnv(env.pop_sub_env(), optional_sub_env)
@@ -289,13 +310,19 @@ class Analyzer:
                 self.current_db.add_ent(alias_ent)
                 alias_binding: Bindings = [(module_alias.asname, [(alias_ent, ModuleType(path_ent.names))])]
                 env.get_scope().add_continuous(alias_binding)
-            env.get_ctx().add_ref(Ref(RefKind.ImportKind, path_ent, import_stmt.lineno,
-                                      import_stmt.col_offset, False, None))
+            if self.manager.builds_relation(RefKind.ImportKind, self.current_db.module_path):
+                env.get_ctx().add_ref(Ref(RefKind.ImportKind, path_ent, import_stmt.lineno,
+                                          import_stmt.col_offset, False, None))
+
+    def iter_analyze_ImportFrom(self, import_stmt: ast.ImportFrom, env: EntEnv) -> ty.Iterator[Path]:
+        # the imported module is analyzed before names are imported from it
+        yield from self.manager.strict_imports(self.module, import_stmt)
+        self.analyze_ImportFrom(import_stmt, env)
 
     def analyze_ImportFrom(self, import_stmt: ast.ImportFrom, env: EntEnv) -> None:
         module_identifier = import_stmt.module
         if module_identifier is None:
-            print("implicit import not implemented yet")
+            logger.debug("implicit import not implemented yet")
             return
         file_ent, bound_ent = self.manager.import_module(self.module, module_identifier, import_stmt.lineno,
                                                          import_stmt.col_offset, True)
@@ -310,9 +337,10 @@ class Analyzer:
                 as_name = alias.asname
                 imported_ents = get_file_level_ent(file_ent, name)
                 import_binding: Binding
-                for e in imported_ents:
-                    current_ctx.add_ref(
-                        Ref(RefKind.ImportKind, e, import_stmt.lineno, import_stmt.col_offset, False, None))
+                if self.manager.builds_relation(RefKind.ImportKind, self.current_db.module_path):
+                    for e in imported_ents:
+                        current_ctx.add_ref(
+                            Ref(RefKind.ImportKind, e, import_stmt.lineno, import_stmt.col_offset, False, None))
                 if name == "*":
                     for ent in imported_ents:
                         new_bindings.append((ent.longname.name, [(ent, ent.direct_type())]))
@@ -351,7 +379,7 @@ class Analyzer:
                     new_bindings.append((alias.name, [(unknown_var, ValueInfo.get_any())]))
             env.get_scope().add_continuous(new_bindings)
 
-    def analyze_With(self, with_stmt: ast.With, env: EntEnv) -> None:
+    def iter_analyze_With(self, with_stmt: ast.With, env: EntEnv) -> ty.Iterator[Path]:
         from enre.analysis.assign_target import unpack_semantic
         for with_item in with_stmt.items:
             context_expr = with_item.context_expr
@@ -366,12 +394,12 @@ class Analyzer:
                                 env.get_scope().get_builder(),
                                 AnalyzeContext(env, self.manager, self.package_db, self.current_db,
                                                (target_lineno, target_col_offset), False))
-        self.analyze_stmts(with_stmt.body, env)
+        yield from self.iter_stmts(with_stmt.body, env)
 
-    def analyze_Try(self, try_stmt: ast.Try, env: EntEnv) -> None:
+    def iter_analyze_Try(self, try_stmt: ast.Try, env: EntEnv) -> ty.Iterator[Path]:
         from enre.analysis.error_handler import handler_semantic
         env.add_sub_env(BasicSubEnv())
-        self.analyze_stmts(try_stmt.body, env)
+        yield from self.iter_stmts(try_stmt.body, env)
         try_body_env = env.pop_sub_env()
 
         for handler in try_stmt.handlers:
@@ -384,16 +412,16 @@ class Analyzer:
                 handler_semantic(handler.name, ast.Expr(err_constructor),
                                  AnalyzeContext(env, self.manager, self.package_db, self.current_db,
                                                 (target_lineno, target_col_offset), False))
-            self.analyze_stmts(handler.body, env)
+            yield from self.iter_stmts(handler.body, env)
             handler_env = env.pop_sub_env()
             try_body_env = ParallelSubEnv(try_body_env, handler_env)
 
         env.add_sub_env(BasicSubEnv())
-        self.analyze_stmts(try_stmt.orelse, env)
+        yield from self.iter_stmts(try_stmt.orelse, env)
         orelse_body_env = env.pop_sub_env()
 
         env.add_sub_env(BasicSubEnv())
-        self.analyze_stmts(try_stmt.finalbody, env)
+        yield from self.iter_stmts(try_stmt.finalbody, env)
         finally_body_env = env.pop_sub_env()
 
         try_env = ParallelSubEnv(try_body_env, ParallelSubEnv(orelse_body_env, finally_body_env))
@@ -403,18 +431,27 @@ class Analyzer:
     # entry of analysis of a module
     def analyze_top_stmts(self, stmts: ty.List[ast.stmt], builder: SummaryBuilder,
                           env: ty.Optional[EntEnv]) -> None:
+        for imported_path in self.iter_top_stmts(stmts, builder, env):
+            self.manager.schedule_modules(imported_path)
+
+    def iter_top_stmts(self, stmts: ty.List[ast.stmt], builder: SummaryBuilder,
+                       env: ty.Optional[EntEnv]) -> ty.Iterator[Path]:
+        """
+        Analyze the statements like `analyze_top_stmts`, but before a `from ... import` statement
+        is analyzed, yield the module it needs to be analyzed first, see `iter_analyze`.
+        """
         if env is None:
             env = EntEnv(ScopeEnv(ctx_ent=self.module, location=Location(), builder=builder))
 
         for stmt in stmts:
-            self.analyze(stmt, env)
+            yield from self.iter_analyze(stmt, env)
 
         for hook in env.get_scope().get_hooks():
             stmts = hook.stmts
             scope_env = hook.scope_env
             before = len(env.get_scope())
             env.add_scope(scope_env)
-            self.analyze_top_stmts(stmts, scope_env.get_builder(), env)
+            yield from self.iter_top_stmts(stmts, scope_env.get_builder(), env)
             env.pop_scope()
             after = len(env.get_scope())
             assert (before == after)
@@ -427,9 +464,9 @@ class Analyzer:
             return_store_ables, _ = avaler.aval(value)
             builder.add_return(return_store_ables, value)
 
-    def analyze_stmts(self, stmts: ty.List[ast.stmt], env: EntEnv) -> None:
+    def iter_stmts(self, stmts: ty.List[ast.stmt], env: EntEnv) -> ty.Iterator[Path]:
         for stmt in stmts:
-            self.analyze(stmt, env)
+            yield from self.iter_analyze(stmt, env)
 
     def declare_semantic(self, target_expr: ast.expr, env: EntEnv) -> None:
         raise NotImplementedError("not implemented yet")
@@ -125,14 +125,14 @@ def newly_define_semantic(newly_created: NewlyCreated,
             new_bindings.append((new_attr.longname.name, [(new_attr, value_type)]))
             ctx.current_db.add_ent(new_attr)
             ctx_ent.add_ref(Ref(RefKind.DefineKind, new_attr, target_lineno, target_col_offset, False, None))
-            ctx_ent.add_ref(Ref(RefKind.SetKind, new_attr, target_lineno, target_col_offset, False, None))
+            add_set_ref(ctx_ent, new_attr, ctx)
         else:
             # newly defined variable
             new_var = Variable(ctx.env.get_ctx(), location.to_longname(), location)
             new_bindings.append((new_var.longname.name, [(new_var, value_type)]))
             ctx.current_db.add_ent(new_var)
             ctx.env.get_ctx().add_ref(Ref(RefKind.DefineKind, new_var, target_lineno, target_col_offset, False, None))
-            ctx.env.get_ctx().add_ref(Ref(RefKind.SetKind, new_var, target_lineno, target_col_offset, False, None))
+            add_set_ref(ctx.env.get_ctx(), new_var, ctx)
             # record the target assign to target entity
             # do nothing if target is not a variable, record the possible Set relation in add_ref method of DepDB
     elif isinstance(tar_ent, UnresolvedAttribute):
@@ -143,7 +143,7 @@ def newly_define_semantic(newly_created: NewlyCreated,
             ctx.current_db.add_ent(new_attr)
             receiver_class.add_ref(
                 Ref(RefKind.DefineKind, new_attr, target_lineno, target_col_offset, False, None))
-            ctx.env.get_ctx().add_ref(Ref(RefKind.SetKind, new_attr, target_lineno, target_col_offset, False, None))
+            add_set_ref(ctx.env.get_ctx(), new_attr, ctx)
 
 
 def assign_known_target(tar_ent: Entity,
@@ -158,7 +158,7 @@ def assign_known_target(tar_ent: Entity,
         new_bindings.append((tar_ent.longname.name, [(tar_ent, value_type)]))
         # add_target_var(target, value_type, env, self.dep_db)
         # self.dep_db.add_ref(env.get_ctx(), Ref(RefKind.DefineKind, target, target_expr.lineno, target_expr.col_offset))
-        ctx.env.get_ctx().add_ref(Ref(RefKind.SetKind, tar_ent, target_lineno, target_col_offset, False, None))
+        add_set_ref(ctx.env.get_ctx(), tar_ent, ctx)
         # record the target assign to target entity
     elif isinstance(tar_ent, UnresolvedAttribute):
         assert False
@@ -171,7 +171,13 @@ def assign_known_target(tar_ent: Entity,
                 Ref(RefKind.DefineKind, new_attr, target_lineno, target_col_offset))
             ctx.env.get_ctx().add_ref(Ref(RefKind.SetKind, new_attr, target_lineno, target_col_offset))
     else:
-        ctx.env.get_ctx().add_ref(Ref(RefKind.SetKind, tar_ent, target_lineno, target_col_offset, False, None))
+        add_set_ref(ctx.env.get_ctx(), tar_ent, ctx)
+
+
+def add_set_ref(ctx_ent: Entity, tar_ent: Entity, ctx: "AnalyzeContext") -> None:
+    if ctx.manager.builds_relation(RefKind.SetKind, ctx.current_db.module_path, tar_ent.kind()):
+        target_lineno, target_col_offset = ctx.coordinate
+        ctx_ent.add_ref(Ref(RefKind.SetKind, tar_ent, target_lineno, target_col_offset, False, None))
 
 
 def compress_abstract_value(entities: AbstractValue) -> AbstractValue:
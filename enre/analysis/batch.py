@@ -0,0 +1,167 @@
+import json
+import logging
+import multiprocessing
+import time
+import traceback
+import typing as ty
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+JsonDict = ty.Dict[str, ty.Any]
+
+# characters of the traceback of a failed project sent to the parent, the end of longer ones is kept
+_MaxErrorLength = 16 * 1024
+
+
+class BatchProject:
+    """A project of the batch manifest and the directory its reports are written to."""
+
+    def __init__(self, root: Path, output: Path) -> None:
+        self.root = root
+        self.output = output
+
+
+class ProjectResult:
+    def __init__(self, project: BatchProject, error: ty.Optional[str], elapsed: float) -> None:
+        self.project = project
+        self.error = error
+        self.elapsed = elapsed
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    def to_json(self) -> JsonDict:
+        ret: JsonDict = {
+            "root": str(self.project.root),
+            "output": str(self.project.output),
+            "status": "failed" if self.failed else "ok",
+            "time": self.elapsed,
+        }
+        if self.error is not None:
+            ret["error"] = self.error
+        return ret
+
+
+def read_manifest(manifest_path: Path) -> ty.List[BatchProject]:
+    """
+    Read a manifest of one json object per line, e.g. `{"root": "repos/a/a", "output": "out/a"}`,
+    blank lines are skipped.
+
+    :raise ValueError: if a line is not an object with `root` and `output`
+    """
+    projects: ty.List[BatchProject] = []
+    with open(manifest_path) as file:
+        for lineno, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+                projects.append(BatchProject(Path(entry["root"]), Path(entry["output"])))
+            except (json.JSONDecodeError, KeyError, TypeError) as e:
+                raise ValueError(f"{manifest_path}:{lineno}: invalid manifest entry: {e}") from e
+    return projects
+
+
+def _run_project(analyze: ty.Callable[[BatchProject], None], project: BatchProject, conn: Connection) -> None:
+    try:
+        if not project.root.is_dir():
+            conn.send(f"project root {project.root} doesn't exist or is not a directory")
+            return
+        project.output.mkdir(parents=True, exist_ok=True)
+        analyze(project)
+    except BaseException:
+        error = traceback.format_exc()
+        if len(error) > _MaxErrorLength:
+            error = "...\n" + error[-_MaxErrorLength:]
+        conn.send(error)
+    else:
+        conn.send(None)
+    finally:
+        conn.close()
+
+
+def run_batch(projects: ty.List[BatchProject], jobs: int, analyze: ty.Callable[[BatchProject], None],
+              warm_up: ty.Optional[ty.Callable[[BatchProject], None]] = None) -> ty.List[ProjectResult]:
+    """
+    Analyze every project in a process of its own, at most `jobs` processes run at the
+    same time. Processes are forked from this process, so modules imported and caches
+    loaded here are shared by all of them. A project raising an exception or a process
+    killed by the system only fails its own project.
+
+    :param analyze: analyze a project and write its reports, called in the child process
+    :param warm_up: called after the first project finished, before other projects start,
+        e.g. to load caches written by the first project
+    :return: results in the order of projects
+    """
+    if not projects:
+        return []
+    context: ty.Union[multiprocessing.context.ForkContext, multiprocessing.context.SpawnContext]
+    if "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+    else:
+        context = multiprocessing.get_context("spawn")
+    results: ty.List[ty.Optional[ProjectResult]] = [None] * len(projects)
+    pending = deque(enumerate(projects))
+    running: ty.Dict[ty.Any, ty.Tuple[int, ty.Any, Connection, float]] = dict()
+    # connections not read yet to the sentinels of their processes, and the errors read from them,
+    # connections are read before processes exit since a child blocks sending more than the pipe holds
+    unread: ty.Dict[Connection, ty.Any] = dict()
+    received: ty.Dict[ty.Any, ty.Optional[str]] = dict()
+
+    def start_next() -> None:
+        index, project = pending.popleft()
+        recv_conn, send_conn = context.Pipe(duplex=False)
+        process = context.Process(target=_run_project, args=(analyze, project, send_conn), daemon=True)
+        process.start()
+        send_conn.close()
+        running[process.sentinel] = (index, process, recv_conn, time.time())
+        unread[recv_conn] = process.sentinel
+
+    def receive(recv_conn: Connection) -> None:
+        sentinel = unread.pop(recv_conn)
+        try:
+            received[sentinel] = recv_conn.recv()
+        except EOFError:
+            pass
+
+    def collect(ready: ty.List[ty.Any]) -> None:
+        for obj in ready:
+            if obj in unread:
+                receive(obj)
+        for obj in ready:
+            if obj not in running:
+                continue
+            index, process, recv_conn, started = running.pop(obj)
+            process.join()
+            # everything the process sent before it exited is in the pipe
+            if recv_conn in unread and recv_conn.poll():
+                receive(recv_conn)
+            unread.pop(recv_conn, None)
+            error: ty.Optional[str]
+            if obj in received:
+                error = received.pop(obj)
+            else:
+                error = f"process exited with code {process.exitcode}"
+            recv_conn.close()
+            result = ProjectResult(projects[index], error, time.time() - started)
+            if result.failed:
+                logger.warning("project %s failed: %s", result.project.root, error)
+            else:
+                logger.info("project %s finished in %.2fs", result.project.root, result.elapsed)
+            results[index] = result
+
+    if warm_up is not None:
+        # the first project fills the caches shared with the other projects
+        start_next()
+        while running:
+            collect(wait([*running.keys(), *unread.keys()]))
+        warm_up(projects[0])
+    while pending or running:
+        while pending and len(running) < max(jobs, 1):
+            start_next()
+        collect(wait([*running.keys(), *unread.keys()]))
+    return [result for result in results if result is not None]
@@ -0,0 +1,318 @@
+import gc
+import hashlib
+import io
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import typing as ty
+from pathlib import Path
+
+from enre.analysis.cache_dir import user_cache_dir, is_private_dir
+from enre.analysis.incremental import PickleRecursionLimit
+from enre.cfg.module_tree import ModuleSummary
+from enre.ent.entity import Entity, UnknownVar, get_anonymous_ent, next_entity_id, reserve_entity_ids, \
+    assign_entity_ids, renumber_entities
+from enre.ref.Ref import Ref
+
+if ty.TYPE_CHECKING:
+    from enre.analysis.analyze_manager import AnalyzeManager, ModuleDB
+
+logger = logging.getLogger(__name__)
+
+DefaultBuiltinsCacheDir = user_cache_dir().joinpath("builtins")
+_SnapshotFormatVersion = 1
+
+# hash of the source files of the analyzer, computed once per process
+_analyzer_fingerprint: ty.Optional[str] = None
+
+
+def analyzer_fingerprint() -> str:
+    """
+    :return: hash of the source code of the `enre` package, a snapshot taken by another
+        version of the analyzer is never loaded
+    """
+    global _analyzer_fingerprint
+    if _analyzer_fingerprint is None:
+        hasher = hashlib.sha256()
+        package_dir = Path(__file__).resolve().parent.parent
+        for source_path in sorted(package_dir.rglob("*.py")):
+            hasher.update(str(source_path.relative_to(package_dir)).encode())
+            try:
+                hasher.update(source_path.read_bytes())
+            except OSError:
+                continue
+        _analyzer_fingerprint = hasher.hexdigest()
+    return _analyzer_fingerprint
+
+
+class BuiltinsSnapshot:
+    """Everything the analysis of the builtins module adds to an `AnalyzeManager`.
+
+    Entity ids are the ids of the run taking the snapshot, they are moved by the
+    same offset when the snapshot is loaded, so a loaded snapshot numbers the
+    entities as if the builtins module was analyzed in the loading run.
+    """
+
+    def __init__(self, module_db: "ModuleDB", global_ents: ty.List[Entity], anonymous_refs: ty.List[Ref],
+                 summaries: ty.List[ModuleSummary], summary_items: ty.List[ty.Tuple[Entity, ModuleSummary]],
+                 imported_paths: ty.Set[Path], unresolved: bool, first_id: int, id_count: int) -> None:
+        self.module_db = module_db
+        self.global_ents = global_ents
+        self.anonymous_refs = anonymous_refs
+        self.summaries = summaries
+        self.summary_items = summary_items
+        self.imported_paths = imported_paths
+        self.unresolved = unresolved
+        # id of the builtins module entity and count of ids used by the analysis
+        self.first_id = first_id
+        self.id_count = id_count
+
+
+class _NotCacheable(Exception):
+    """The builtins module refers to entities of the analyzed project."""
+
+
+class _SnapshotPickler(pickle.Pickler):
+    def __init__(self, file: ty.IO[bytes], project_ents: ty.Set[int], first_id: int) -> None:
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._project_ents = project_ents
+        self._first_id = first_id
+        self.new_ents: ty.List[Entity] = []
+        # checking subclasses of an abstract class is slow, it's done once per type
+        self._entity_types: ty.Dict[type, bool] = dict()
+
+    def reducer_override(self, obj: ty.Any) -> ty.Any:
+        obj_type = type(obj)
+        is_entity = self._entity_types.get(obj_type)
+        if is_entity is None:
+            is_entity = self._entity_types[obj_type] = issubclass(obj_type, Entity)
+        if not is_entity:
+            return NotImplemented
+        if obj is get_anonymous_ent():
+            return _load_shared, ("anonymous", None)
+        if isinstance(obj, UnknownVar) and UnknownVar.is_pooled(obj):
+            # unknown variables are shared by name, the id is kept if the variable is created on load
+            old_id = obj.id if obj.id >= self._first_id else None
+            return _load_shared, ("unknown", (obj.longname.name, old_id))
+        if id(obj) in self._project_ents:
+            raise _NotCacheable
+        self.new_ents.append(obj)
+        return NotImplemented
+
+
+# pooled unknown variables created while loading a snapshot, with the ids they had in the snapshot
+_created_unknown_vars: ty.Optional[ty.List[ty.Tuple[UnknownVar, ty.Optional[int]]]] = None
+
+
+def _load_shared(kind: str, key: ty.Any) -> ty.Any:
+    if kind == "anonymous":
+        return get_anonymous_ent()
+    name, old_id = key
+    if _created_unknown_vars is not None and not UnknownVar.is_pooled_name(name):
+        unknown_var = UnknownVar.get_unknown_var(name)
+        _created_unknown_vars.append((unknown_var, old_id))
+        return unknown_var
+    return UnknownVar.get_unknown_var(name)
+
+
+class BuiltinsCache:
+    """On-disk snapshots of the analyzed builtins module.
+
+    A snapshot is stored by the hash of the builtins stub, its path, the version
+    of the running interpreter and the source code of the analyzer. Loading a
+    snapshot replaces parsing and analyzing the stub, which dominates the time
+    of analyzing a small project. Snapshots are not taken if the builtins module
+    refers to entities of the analyzed project. Snapshots are unpickled, they are
+    not used if their directory is writable by other users.
+    """
+
+    def __init__(self, cache_dir: Path = DefaultBuiltinsCacheDir) -> None:
+        self.cache_dir = cache_dir
+        self._private: ty.Optional[bool] = None
+        self._interpreter_tag = f"{sys.implementation.cache_tag}-{sys.hexversion}-{_SnapshotFormatVersion}"
+        # snapshots read ahead of time, shared with forked processes
+        self._preloaded: ty.Dict[str, bytes] = dict()
+
+    def key(self, manager: "AnalyzeManager") -> ty.Optional[str]:
+        assert manager.builtin_path is not None
+        return self.key_of(manager.root_db.absolute_path(manager.builtin_path), manager.builtin_path)
+
+    def key_of(self, stub_path: Path, builtin_path: Path) -> ty.Optional[str]:
+        """
+        :param stub_path: path of the builtins stub to read
+        :param builtin_path: path of the builtins module given to the manager
+        """
+        try:
+            source = stub_path.read_bytes()
+        except OSError:
+            return None
+        hasher = hashlib.sha256(self._interpreter_tag.encode())
+        hasher.update(analyzer_fingerprint().encode())
+        hasher.update(str(builtin_path).encode())
+        hasher.update(source)
+        return hasher.hexdigest()
+
+    def usable(self) -> bool:
+        if self._private is None:
+            self._private = is_private_dir(self.cache_dir)
+        return self._private
+
+    def preload(self, key: str) -> bool:
+        """
+        Keep the snapshot stored by key in memory, processes forked later load it without reading the file.
+
+        :return: True if the snapshot exists
+        """
+        if not self.usable():
+            return False
+        try:
+            self._preloaded[key] = self._entry_path(key).read_bytes()
+        except OSError:
+            return False
+        return True
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f"{key}.pickle")
+
+    def analyze_builtins(self, manager: "AnalyzeManager", analyze: ty.Callable[[], None]) -> None:
+        """
+        Restore the builtins module of the manager from a snapshot, or analyze it by
+        calling `analyze` and store a snapshot of the result.
+        """
+        key = self.key(manager)
+        if key is None:
+            analyze()
+            return
+        if self.restore(key, manager):
+            logger.debug("builtins restored from snapshot %s", key)
+            return
+        from enre.analysis.parallel import shared_entities, EntitySnapshot
+        builtin_path = manager.builtin_path
+        assert builtin_path is not None
+        root_db = manager.root_db
+        scene = manager.scene
+        module_ent = root_db.get_module_db_of_path(builtin_path).module_ent
+        first_id = module_ent.id
+        if next_entity_id() != first_id + 1:
+            # entities were created after the builtins module, a snapshot couldn't reproduce the ids
+            analyze()
+            return
+        project_ents = [ent for ent in shared_entities(manager)
+                        if ent is not module_ent and ent is not get_anonymous_ent()]
+        project_snapshot = EntitySnapshot(project_ents)
+        anonymous_ref_count = len(get_anonymous_ent().refs())
+        global_count = len(root_db.global_db.ents)
+        summary_count = len(scene.summaries)
+        summary_map_count = len(scene.summary_map)
+        unresolved_before = builtin_path in manager.unresolved_importers
+        analyze()
+        if project_snapshot.changes():
+            logger.debug("builtins changed entities of the project, no snapshot is taken")
+            return
+        snapshot = BuiltinsSnapshot(root_db.get_module_db_of_path(builtin_path),
+                                    root_db.global_db.ents[global_count:],
+                                    get_anonymous_ent().refs()[anonymous_ref_count:],
+                                    scene.summaries[summary_count:],
+                                    list(scene.summary_map.items())[summary_map_count:],
+                                    set(manager.import_graph.get(builtin_path, set())),
+                                    not unresolved_before and builtin_path in manager.unresolved_importers,
+                                    first_id, next_entity_id() - first_id)
+        self.store(key, snapshot, {id(ent) for ent in project_ents})
+
+    def store(self, key: str, snapshot: BuiltinsSnapshot, project_ents: ty.Set[int]) -> None:
+        file = io.BytesIO()
+        pickler = _SnapshotPickler(file, project_ents, snapshot.first_id)
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, PickleRecursionLimit))
+        try:
+            # the list of entities is completed while the snapshot is pickled
+            pickler.dump((snapshot, pickler.new_ents))
+        except _NotCacheable:
+            logger.debug("builtins refer to entities of the project, no snapshot is taken")
+            return
+        except (RecursionError, pickle.PicklingError, TypeError):
+            return
+        finally:
+            sys.setrecursionlimit(limit)
+        if not self.usable():
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as out:
+                out.write(file.getvalue())
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError:
+            # a cache failure should never fail the analysis
+            return
+
+    def load(self, key: str) -> ty.Optional[ty.Tuple[BuiltinsSnapshot, ty.List[Entity],
+                                                      ty.List[ty.Tuple[UnknownVar, ty.Optional[int]]]]]:
+        global _created_unknown_vars
+        data = self._preloaded.get(key)
+        if data is None:
+            if not self.usable():
+                return None
+            try:
+                data = self._entry_path(key).read_bytes()
+            except OSError:
+                return None
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(max(limit, PickleRecursionLimit))
+        created: ty.List[ty.Tuple[UnknownVar, ty.Optional[int]]] = []
+        _created_unknown_vars = created
+        # all loaded objects stay alive, collecting garbage while loading only costs time
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            snapshot, new_ents = pickle.loads(data)
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError, TypeError, ValueError):
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+            _created_unknown_vars = None
+            sys.setrecursionlimit(limit)
+        if not isinstance(snapshot, BuiltinsSnapshot):
+            return None
+        return snapshot, new_ents, created
+
+    def restore(self, key: str, manager: "AnalyzeManager") -> bool:
+        """
+        Replace the builtins module of the manager with the snapshot stored by key.
+
+        :return: False if there is no usable snapshot, the manager is not changed then
+        """
+        builtin_path = manager.builtin_path
+        assert builtin_path is not None
+        root_db = manager.root_db
+        module_ent = root_db.get_module_db_of_path(builtin_path).module_ent
+        # the ids of the snapshot start from the id of the builtins module entity if
+        # nothing was created after it, as if the builtins module is analyzed now
+        first_id = module_ent.id if next_entity_id() == module_ent.id + 1 else next_entity_id()
+        loaded = self.load(key)
+        if loaded is None:
+            return False
+        snapshot, new_ents, created = loaded
+        offset = first_id - snapshot.first_id
+        renumber_entities([(ent, ent.id + offset) for ent in new_ents] +
+                          [(unknown_var, old_id + offset) for unknown_var, old_id in created if old_id is not None])
+        reserve_entity_ids(first_id + snapshot.id_count)
+        assign_entity_ids([unknown_var for unknown_var, old_id in created if old_id is None], next_entity_id())
+        module_db = snapshot.module_db
+        module_db.project_root = manager.project_root
+        module_db.parse_cache = root_db.parse_cache
+        module_db.ent_id_set = {ent_id + offset for ent_id in module_db.ent_id_set}
+        root_db.tree[builtin_path] = module_db
+        root_db.global_db.ents.extend(snapshot.global_ents)
+        anonymous = get_anonymous_ent()
+        anonymous.set_refs(anonymous.refs() + snapshot.anonymous_refs)
+        manager.scene.summaries.extend(snapshot.summaries)
+        for ent, summary in snapshot.summary_items:
+            manager.scene.summary_map[ent] = summary
+        if snapshot.imported_paths:
+            manager.import_graph.setdefault(builtin_path, set()).update(snapshot.imported_paths)
+        if snapshot.unresolved:
+            manager.unresolved_importers.add(builtin_path)
+        return True
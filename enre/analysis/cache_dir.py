@@ -0,0 +1,42 @@
+import logging
+import os
+import stat
+import typing as ty
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def user_cache_dir() -> Path:
+    """
+    :return: the cache directory of the user, `$XDG_CACHE_HOME/enre` or `~/.cache/enre`
+    """
+    xdg_cache_home = os.environ.get("XDG_CACHE_HOME")
+    base = Path(xdg_cache_home) if xdg_cache_home else Path.home().joinpath(".cache")
+    return base.joinpath("enre")
+
+
+def is_private_dir(path: Path) -> bool:
+    """
+    Create the directory readable only by the user if it doesn't exist. Caches are unpickled,
+    so a cache directory other users can write to could make the analyzer run their code.
+
+    :return: False if the directory can't be created, isn't owned by the user or is
+        writable by others, the cache in it shouldn't be used then
+    """
+    try:
+        path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        path.mkdir(mode=0o700, exist_ok=True)
+        dir_stat = os.stat(path)
+    except OSError as e:
+        logger.warning("cache directory %s can't be created, caching is disabled: %s", path, e)
+        return False
+    getuid: ty.Optional[ty.Callable[[], int]] = getattr(os, "getuid", None)
+    if not stat.S_ISDIR(dir_stat.st_mode):
+        logger.warning("cache directory %s is not a directory, caching is disabled", path)
+        return False
+    if getuid is not None and (dir_stat.st_uid != getuid() or dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH)):
+        logger.warning("cache directory %s is not owned by the user or writable by others, caching is disabled",
+                       path)
+        return False
+    return True
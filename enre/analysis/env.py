@@ -1,6 +1,8 @@
 import ast
 from abc import ABC, abstractmethod
-from typing import List, TYPE_CHECKING, Tuple, TypeAlias, Optional
+from bisect import bisect_left
+from collections import defaultdict
+from typing import List, TYPE_CHECKING, Tuple, TypeAlias, Optional, Dict, AbstractSet
 
 from enre.cfg.module_tree import SummaryBuilder
 from enre.ent.entity import Entity, Location
@@ -27,54 +29,114 @@ class SubEnvLookupResult:
 
 
 class SubEnv(ABC):
+    """
+    A sub environment is frozen when it becomes a part of another sub environment, no
+    bindings are added to it after that.
+    """
 
     def __init__(self, depth: int = 0) -> None:
         self.depth = depth
+        self._frozen = False
 
     def join(self, sub_env: "SubEnv") -> "ParallelSubEnv":
         return ParallelSubEnv(self, sub_env)
 
+    def freeze(self) -> "SubEnv":
+        self._frozen = True
+        return self
+
     @abstractmethod
     def get(self, name: str) -> SubEnvLookupResult:
         ...
 
     @abstractmethod
-    def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
+    def names(self) -> AbstractSet[str]:
+        """
+        :return: names the sub environment may find, looking up any other name finds
+            nothing and isn't must found
+        """
         ...
 
-
-def get_from_bindings(name: str, bindings: "Bindings") -> "AbstractValue":
-    ret = []
-    for n, binds in bindings:
-        if n == name:
-            ret.extend(binds)
-    return ret
+    @abstractmethod
+    def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
+        ...
 
 
 class BasicSubEnv(SubEnv):
     def __init__(self, pairs: "Optional[Bindings]" = None):
         super().__init__(1)
-        if pairs is None:
-            pairs = []
-        self._bindings_list = [pairs]
+        # values bound to a name by every bindings list, the last list binding any value wins
+        self._index: Dict[str, List[Tuple[int, AbstractValue]]] = defaultdict(list)
+        self._bindings_count = 0
+        if pairs is not None:
+            self.create_continuous_bindings(pairs)
 
     def get(self, name: str) -> SubEnvLookupResult:
-        for bindings in reversed(self._bindings_list):
-            ret = get_from_bindings(name, bindings)
+        bound = self._index.get(name)
+        if not bound:
+            return SubEnvLookupResult([], False)
+        ret: AbstractValue = []
+        position = len(bound)
+        while position > 0:
+            # values of one bindings list are consecutive
+            bindings_no = bound[position - 1][0]
+            start = position
+            while start > 0 and bound[start - 1][0] == bindings_no:
+                start -= 1
+            for _, binds in bound[start:position]:
+                ret.extend(binds)
             if ret:
                 return SubEnvLookupResult(ret, True)
+            position = start
         return SubEnvLookupResult([], False)
 
+    def names(self) -> AbstractSet[str]:
+        return self._index.keys()
+
     def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
-        self._bindings_list.append(pairs)
+        assert not self._frozen
+        bindings_no = self._bindings_count
+        self._bindings_count += 1
+        for n, binds in pairs:
+            self._index[n].append((bindings_no, binds))
         return self
 
 
+class BuiltinsSubEnv(SubEnv):
+    """Bindings of the builtins module indexed by name, one instance is shared by the top
+    scopes of all modules and no bindings are added to it."""
+
+    def __init__(self, pairs: "Bindings") -> None:
+        super().__init__(1)
+        self._index: Dict[str, AbstractValue] = dict()
+        # duplicated pairs are dropped once, as ScopeEnv.add_continuous drops them
+        bound: Dict[str, List[AbstractValue]] = defaultdict(list)
+        for n, binds in pairs:
+            if binds not in bound[n]:
+                bound[n].append(binds)
+                self._index.setdefault(n, []).extend(binds)
+        self.freeze()
+
+    def get(self, name: str) -> SubEnvLookupResult:
+        values = self._index.get(name)
+        if not values:
+            return SubEnvLookupResult([], False)
+        return SubEnvLookupResult(list(values), True)
+
+    def names(self) -> AbstractSet[str]:
+        return self._index.keys()
+
+    def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
+        return ContinuousSubEnv(self, BasicSubEnv(pairs))
+
+
 class ParallelSubEnv(SubEnv):
     def __init__(self, b1: SubEnv, b2: SubEnv) -> None:
         super().__init__(max(b1.depth, b2.depth) + 1)
-        self._branch1_sub_env = b1
-        self._branch2_sub_env = b2
+        self._branch1_sub_env = b1.freeze()
+        self._branch2_sub_env = b2.freeze()
+        self._names: Optional[AbstractSet[str]] = None
+        self.freeze()
 
     def get(self, name: str) -> SubEnvLookupResult:
         look_up_res1 = self._branch1_sub_env.get(name)
@@ -83,11 +145,33 @@ class ParallelSubEnv(SubEnv):
         found_entities = look_up_res1.found_entities + look_up_res2.found_entities
         return SubEnvLookupResult(found_entities, is_must_found)
 
+    def names(self) -> AbstractSet[str]:
+        if self._names is None:
+            self._names = self._branch1_sub_env.names() | self._branch2_sub_env.names()
+        return self._names
+
     def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
         new_sub_env = BasicSubEnv(pairs)
         return ContinuousSubEnv(self, new_sub_env)
 
 
+class _Chain:
+    """Backward environments of a sequence of continuous environments, each continuous
+    environment is the forward environment of the next one, indexed by the names they may
+    find. The first forward environment of the sequence is the base of the chain."""
+
+    def __init__(self, base: SubEnv) -> None:
+        self.base = base
+        self.layers: List[SubEnv] = []
+        self.index: Dict[str, List[int]] = defaultdict(list)
+
+    def append(self, layer: SubEnv) -> None:
+        layer_no = len(self.layers)
+        self.layers.append(layer.freeze())
+        for name in layer.names():
+            self.index[name].append(layer_no)
+
+
 class ContinuousSubEnv(SubEnv):
     def __init__(self, forward: SubEnv, backward: SubEnv) -> None:
         """
@@ -95,21 +179,51 @@ class ContinuousSubEnv(SubEnv):
         """
         super().__init__(1 + max(forward.depth, backward.depth))
         # print(f"ContinuousSubEnv constructed, depth: {self.depth}")
-        self._forward = forward
+        self._forward = forward.freeze()
         self._backward = backward
+        self._names: Optional[AbstractSet[str]] = None
+        # the forward environment grows with every branch of a scope, instead of following
+        # it, a lookup visits the backward environments of the chain finding the name
+        self._chain: _Chain
+        if isinstance(forward, ContinuousSubEnv) and forward._chain_length == len(forward._chain.layers):
+            self._chain = forward._chain
+            self._chain.append(forward._backward)
+        else:
+            self._chain = _Chain(forward)
+        # layers of the chain before this environment
+        self._chain_length: int = len(self._chain.layers)
 
     def get(self, name: str) -> SubEnvLookupResult:
         backward_lookup_res = self._backward.get(name)
         # print(f"finding name {name} in env {self}")
         if backward_lookup_res.must_found:
             return backward_lookup_res
-        else:
-            # print(f"name {name} not found continue find at {self._forward}")
-            forward_lookup_res = self._forward.get(name)
-            found_entities = backward_lookup_res.found_entities + forward_lookup_res.found_entities
-            return SubEnvLookupResult(found_entities, forward_lookup_res.must_found)
+        found_entities = list(backward_lookup_res.found_entities)
+        layers = self._chain.layers
+        layer_nos = self._chain.index.get(name, [])
+        for position in range(bisect_left(layer_nos, self._chain_length) - 1, -1, -1):
+            layer_lookup_res = layers[layer_nos[position]].get(name)
+            found_entities.extend(layer_lookup_res.found_entities)
+            if layer_lookup_res.must_found:
+                return SubEnvLookupResult(found_entities, True)
+        # print(f"name {name} not found continue find at {self._chain.base}")
+        base_lookup_res = self._chain.base.get(name)
+        found_entities.extend(base_lookup_res.found_entities)
+        return SubEnvLookupResult(found_entities, base_lookup_res.must_found)
+
+    def names(self) -> AbstractSet[str]:
+        if not self._frozen:
+            return self._backward.names() | self._forward.names()
+        if self._names is None:
+            names = set(self._backward.names())
+            names.update(self._chain.base.names())
+            for layer in self._chain.layers[:self._chain_length]:
+                names.update(layer.names())
+            self._names = names
+        return self._names
 
     def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
+        assert not self._frozen
         self._backward = self._backward.create_continuous_bindings(pairs)
         return self
 
@@ -117,12 +231,16 @@ class ContinuousSubEnv(SubEnv):
 class OptionalSubEnv(SubEnv):
     def __init__(self, sub_env: SubEnv) -> None:
         super().__init__(sub_env.depth + 1)
-        self._optional = sub_env
+        self._optional = sub_env.freeze()
+        self.freeze()
 
     def get(self, name: str) -> SubEnvLookupResult:
         optional_lookup_res = self._optional.get(name)
         return SubEnvLookupResult(optional_lookup_res.found_entities, False)
 
+    def names(self) -> AbstractSet[str]:
+        return self._optional.names()
+
     def create_continuous_bindings(self, pairs: "Bindings") -> "SubEnv":
         new_sub_env = BasicSubEnv(pairs)
         return ContinuousSubEnv(self, new_sub_env)
@@ -0,0 +1,372 @@
+import hashlib
+import os
+import pickle
+import sys
+import typing as ty
+from collections import defaultdict
+from pathlib import Path
+
+from enre.analysis.analyze_manager import AnalyzeManager, ModuleDB, DiscoveryFilter
+from enre.analysis.parse_cache import ParseCache
+from enre.analysis.profiler import Profiler
+from enre.ent.EntKind import RefKind
+from enre.ent.entity import Entity, Module, Package, UnknownVar, NameSpaceEntity, Class, UnknownModule, \
+    invalidate_class_caches, reserve_entity_ids, next_entity_id
+from enre.ref.Ref import Ref
+
+if ty.TYPE_CHECKING:
+    from enre.analysis.builtins_cache import BuiltinsCache
+
+_StateFormatVersion = 7
+
+# modification time in nanoseconds, size and content hash of a file
+FileSignature = ty.Tuple[int, int, str]
+
+PickleRecursionLimit = 20000
+
+
+def file_signature(path: Path, previous: ty.Optional[FileSignature] = None) -> ty.Optional[FileSignature]:
+    """
+    :param path: the path of the file
+    :param previous: signature recorded last time, the file would not be read
+        again if its modification time and size are unchanged
+    :return: the signature of the file, None if the file can't be read
+    """
+    try:
+        stat = path.stat()
+        if previous is not None and previous[0] == stat.st_mtime_ns and previous[1] == stat.st_size:
+            return previous
+        content_hash = hashlib.sha256(path.read_bytes()).hexdigest()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, content_hash
+
+
+def _pickle_recursion_limit() -> int:
+    return max(sys.getrecursionlimit(), PickleRecursionLimit)
+
+
+class IncrementalState:
+    """Analysis state kept between runs of the incremental mode.
+
+    The state contains the analyzed `AnalyzeManager` before the global passes,
+    the signatures of all analyzed files and the import graph discovered while
+    analyzing. A run re-analyzes the modified modules and all modules transitively
+    importing them, then the global passes run on the whole project again.
+
+    The state is written to `state_path`. If no path is given, the analyzed manager
+    itself is kept in memory with a `GlobalPassCheckpoint`, and the results of the
+    global passes are reverted before the next run instead of pickling the manager.
+    """
+
+    def __init__(self, state_path: ty.Optional[Path]) -> None:
+        self.state_path = state_path
+        self._live: ty.Optional[ty.Tuple[AnalyzeManager, GlobalPassCheckpoint, ty.Optional[FileSignature]]] = None
+        self._signatures: ty.Dict[Path, FileSignature] = dict()
+
+    def analyze(self, root_path: Path, builtin_path: ty.Optional[Path], jobs: int = 1,
+                parse_cache: ty.Optional[ParseCache] = None,
+                builtins_cache: ty.Optional["BuiltinsCache"] = None,
+                discovery: ty.Optional[DiscoveryFilter] = None) -> AnalyzeManager:
+        manager = self.load(root_path, builtin_path)
+        if manager is None:
+            manager = AnalyzeManager(root_path, builtin_path, jobs, parse_cache, builtins_cache, discovery)
+            manager.analyze_builtins()
+            manager.iter_dir(root_path)
+            signatures = self.collect_signatures(manager, dict())
+        else:
+            manager.root_db.parse_cache = parse_cache
+            manager.builtins_cache = builtins_cache
+            # files matching the filter of this run are added, others are removed
+            manager.root_db.discovery = discovery if discovery is not None else DiscoveryFilter()
+            signatures = self.update(manager, parse_cache)
+        if self.state_path is None:
+            checkpoint = GlobalPassCheckpoint(manager)
+            manager.run_global_passes()
+            # kept after the passes succeed, a failed run analyzes the project again next time
+            self._live = manager, checkpoint, self.builtins_signature(manager)
+            self._signatures = signatures
+        else:
+            self.save(manager, signatures)
+            manager.run_global_passes()
+        manager.evict_parse_cache()
+        return manager
+
+    def is_outdated(self, manager: AnalyzeManager) -> bool:
+        """
+        :return: True if any analyzed file changed, or any file was added or removed
+            since the state was saved
+        """
+        return self.collect_signatures(manager, self._signatures) != self._signatures
+
+    def _read_state(self) -> ty.Optional[bytes]:
+        assert self.state_path is not None
+        try:
+            return self.state_path.read_bytes()
+        except OSError:
+            return None
+
+    def _write_state(self, snapshot: bytes) -> None:
+        assert self.state_path is not None
+        tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+        tmp_path.write_bytes(snapshot)
+        os.replace(tmp_path, self.state_path)
+
+    def load(self, root_path: Path, builtin_path: ty.Optional[Path]) -> ty.Optional[AnalyzeManager]:
+        if self.state_path is None:
+            return self._load_live(root_path, builtin_path)
+        snapshot = self._read_state()
+        if snapshot is None:
+            return None
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(_pickle_recursion_limit())
+        try:
+            state = pickle.loads(snapshot)
+        except (EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        finally:
+            sys.setrecursionlimit(limit)
+        if not isinstance(state, dict) or state.get("version") != _StateFormatVersion:
+            return None
+        manager: AnalyzeManager = state["manager"]
+        if manager.project_root != root_path or manager.builtin_path != builtin_path:
+            return None
+        if builtin_path is not None and \
+                file_signature(root_path.parent.joinpath(builtin_path)) != state["builtins_signature"]:
+            return None
+        self._signatures = state["signatures"]
+        manager.profiler = Profiler()
+        reserve_entity_ids(state["entity_id"])
+        for module_db in manager.root_db.tree.values():
+            for ent in module_db.dep_db.ents:
+                if isinstance(ent, UnknownVar):
+                    UnknownVar.register_unknown_var(ent)
+        for ent in manager.root_db.global_db.ents:
+            if isinstance(ent, UnknownVar):
+                UnknownVar.register_unknown_var(ent)
+        return manager
+
+    def _load_live(self, root_path: Path, builtin_path: ty.Optional[Path]) -> ty.Optional[AnalyzeManager]:
+        if self._live is None:
+            return None
+        manager, checkpoint, builtins_signature = self._live
+        # the manager is modified by the run, it's kept again only if the run succeeds
+        self._live = None
+        if manager.project_root != root_path or manager.builtin_path != builtin_path or \
+                self.builtins_signature(manager) != builtins_signature:
+            return None
+        checkpoint.restore(manager)
+        manager.profiler = Profiler()
+        return manager
+
+    @staticmethod
+    def builtins_signature(manager: AnalyzeManager) -> ty.Optional[FileSignature]:
+        if manager.builtin_path is None:
+            return None
+        return file_signature(manager.project_root.parent.joinpath(manager.builtin_path))
+
+    def save(self, manager: AnalyzeManager, signatures: ty.Dict[Path, FileSignature]) -> None:
+        builtins_signature = self.builtins_signature(manager)
+        parse_cache = manager.root_db.parse_cache
+        manager.root_db.parse_cache = None
+        state = {"version": _StateFormatVersion,
+                 "manager": manager,
+                 "signatures": signatures,
+                 "builtins_signature": builtins_signature,
+                 "entity_id": next_entity_id()}
+        limit = sys.getrecursionlimit()
+        sys.setrecursionlimit(_pickle_recursion_limit())
+        try:
+            snapshot = pickle.dumps(state, pickle.HIGHEST_PROTOCOL)
+        finally:
+            sys.setrecursionlimit(limit)
+            manager.root_db.parse_cache = parse_cache
+        self._write_state(snapshot)
+        self._signatures = signatures
+
+    def collect_signatures(self, manager: AnalyzeManager,
+                           previous: ty.Dict[Path, FileSignature]) -> ty.Dict[Path, FileSignature]:
+        signatures: ty.Dict[Path, FileSignature] = dict()
+        for rel_path in manager.root_db.collect_py_files(manager.project_root):
+            signature = file_signature(manager.project_root.parent.joinpath(rel_path), previous.get(rel_path))
+            if signature is not None:
+                signatures[rel_path] = signature
+        return signatures
+
+    def update(self, manager: AnalyzeManager, parse_cache: ty.Optional[ParseCache]) -> ty.Dict[Path, FileSignature]:
+        previous = self._signatures
+        signatures = self.collect_signatures(manager, previous)
+        modified = {p for p in signatures.keys() & previous.keys() if signatures[p] != previous[p]}
+        added = signatures.keys() - previous.keys()
+        deleted = previous.keys() - signatures.keys()
+        if not (modified or added or deleted):
+            return signatures
+        affected = set(modified) | deleted
+        manager.refresh_fs_index()
+        if added or deleted:
+            # a new or removed file may change how other modules resolve their imports
+            affected |= manager.unresolved_importers
+        affected = transitive_importers(manager.import_graph, affected)
+        drop_modules(manager, affected, deleted)
+        for rel_path in sorted(affected - deleted):
+            if rel_path in manager.root_db.tree:
+                module_ent = manager.root_db.tree[rel_path].module_ent
+                manager.root_db.tree[rel_path] = ModuleDB(manager.project_root, module_ent,
+                                                          parse_cache=parse_cache)
+        for rel_path in sorted(added):
+            add_module(manager, rel_path)
+        manager.iter_dir(manager.project_root)
+        return signatures
+
+
+class GlobalPassCheckpoint:
+    """Sizes of the analysis results before the global passes.
+
+    The global passes and the control flow analysis only append entities to the
+    global database and references to entities, fill the resolved targets of
+    references, the visibility information of classes and the heap objects of
+    summaries, so restoring the sizes and clearing the rest reverts them.
+    """
+
+    def __init__(self, manager: AnalyzeManager) -> None:
+        root_db = manager.root_db
+        self.global_ent_count = len(root_db.global_db.ents)
+        self.ref_counts: ty.List[ty.Tuple[Entity, int]] = [(ent, len(ent.refs())) for ent in _analyzed_ents(manager)]
+
+    def restore(self, manager: AnalyzeManager) -> None:
+        root_db = manager.root_db
+        root_db.global_db.ents = root_db.global_db.ents[:self.global_ent_count]
+        for ent, ref_count in self.ref_counts:
+            refs = ent.refs()
+            if len(refs) > ref_count:
+                ent.set_refs(refs[:ref_count])
+            for ref in refs[:ref_count]:
+                if ref.resolved_targets:
+                    ref.resolved_targets.clear()
+            if isinstance(ent, Class):
+                ent.abstract_info = None
+                ent.readonly_attribute.clear()
+                ent.private_attribute.clear()
+        for summary in manager.scene.summaries:
+            summary.reset_object()
+
+
+def _analyzed_ents(manager: AnalyzeManager) -> ty.Iterator[Entity]:
+    root_db = manager.root_db
+    for module_db in root_db.tree.values():
+        yield from module_db.dep_db.ents
+    yield from root_db.global_db.ents
+    yield from root_db.package_tree.values()
+
+
+def transitive_importers(import_graph: ty.Dict[Path, ty.Set[Path]], modules: ty.Set[Path]) -> ty.Set[Path]:
+    importers: ty.Dict[Path, ty.Set[Path]] = dict()
+    for from_path, imported_paths in import_graph.items():
+        for imported_path in imported_paths:
+            importers.setdefault(imported_path, set()).add(from_path)
+    ret = set(modules)
+    stack = list(modules)
+    while stack:
+        current = stack.pop()
+        for importer in importers.get(current, ()):
+            if importer not in ret:
+                ret.add(importer)
+                stack.append(importer)
+    return ret
+
+
+def drop_modules(manager: AnalyzeManager, module_paths: ty.Set[Path], deleted: ty.Set[Path]) -> None:
+    """
+    Remove analysis result of the given modules. Module entities are kept, so packages
+    and the following analysis could refer to the same entity, the entities defined in
+    the modules are removed from the databases, the summaries and all references.
+    """
+    root_db = manager.root_db
+    dropped: ty.Set[int] = set()
+    dropped_ents: ty.List[Entity] = []
+    kept_modules: ty.List[Module] = []
+    for rel_path in module_paths:
+        if rel_path not in root_db.tree:
+            continue
+        module_db = root_db.tree[rel_path]
+        module_ent = module_db.module_ent
+        for ent in module_db.dep_db.ents:
+            if ent is module_ent or isinstance(ent, UnknownVar):
+                # unknown variables are shared by all modules
+                continue
+            dropped.add(id(ent))
+            dropped_ents.append(ent)
+        module_ent.set_refs([])
+        module_ent.names.clear()
+        kept_modules.append(module_ent)
+        manager.module_stack.finished_module_set.discard(rel_path)
+        manager.import_graph.pop(rel_path, None)
+        manager.unresolved_importers.discard(rel_path)
+        if rel_path in deleted:
+            dropped.add(id(module_ent))
+            dropped_ents.append(module_ent)
+            del root_db.tree[rel_path]
+
+    # every unknown variable imported from an unknown module was added to the global database once
+    unknown_var_occurrences: ty.Dict[int, int] = defaultdict(int)
+    for ent in dropped_ents:
+        if isinstance(ent, UnknownModule):
+            for ref in ent.refs():
+                if ref.ref_kind == RefKind.DefineKind and isinstance(ref.target_ent, UnknownVar):
+                    unknown_var_occurrences[id(ref.target_ent)] += 1
+    # entities are compared by their names, remove the dropped entities by identity
+    global_ents: ty.List[Entity] = []
+    for ent in root_db.global_db.ents:
+        if id(ent) in dropped:
+            continue
+        if unknown_var_occurrences[id(ent)] > 0:
+            unknown_var_occurrences[id(ent)] -= 1
+            continue
+        global_ents.append(ent)
+    root_db.global_db.ents = global_ents
+    for module_db in root_db.tree.values():
+        for ent in module_db.dep_db.ents:
+            _remove_dropped_refs(ent, dropped)
+    for ent in root_db.global_db.ents:
+        _remove_dropped_refs(ent, dropped)
+    for package_ent in root_db.package_tree.values():
+        _remove_dropped_refs(package_ent, dropped)
+    invalidate_class_caches()
+
+    scene = manager.scene
+    summary_owners = {id(ent) for ent in kept_modules} | dropped
+    scene.summaries = [summary for summary in scene.summaries if id(summary.get_ent()) not in summary_owners]
+    for ent in dropped_ents + kept_modules:
+        scene.summary_map.pop(ent, None)
+
+
+def _remove_dropped_refs(ent: Entity, dropped: ty.Set[int]) -> None:
+    refs = ent.refs()
+    if any(id(ref.target_ent) in dropped for ref in refs):
+        ent.set_refs([ref for ref in refs if id(ref.target_ent) not in dropped])
+    if isinstance(ent, NameSpaceEntity):
+        for name, ents in ent.names.items():
+            if any(id(e) in dropped for e in ents):
+                ents[:] = [e for e in ents if id(e) not in dropped]
+    if isinstance(ent, Class):
+        if any(id(e) in dropped for e in ent.inherits):
+            ent.inherits[:] = [e for e in ent.inherits if id(e) not in dropped]
+
+
+def add_module(manager: AnalyzeManager, rel_path: Path) -> None:
+    root_db = manager.root_db
+    module_ent = Module(rel_path)
+    root_db.tree[rel_path] = ModuleDB(manager.project_root, module_ent, parse_cache=root_db.parse_cache)
+    child: ty.Union[Module, Package] = module_ent
+    package_path = rel_path.parent
+    while package_path != Path() and root_db.absolute_path(package_path).is_relative_to(root_db.root_dir):
+        is_new_package = package_path not in root_db.package_tree
+        if is_new_package:
+            package_ent = Package(package_path)
+            root_db.global_db.add_ent(package_ent)
+            root_db.package_tree[package_path] = package_ent
+        root_db.package_tree[package_path].add_ref(Ref(RefKind.ContainKind, child, 0, 0, False, None))
+        if not is_new_package:
+            break
+        child = root_db.package_tree[package_path]
+        package_path = package_path.parent
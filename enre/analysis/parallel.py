@@ -0,0 +1,639 @@
+import ast
+import gc
+import io
+import logging
+import multiprocessing
+import pickle
+import sys
+import typing as ty
+from pathlib import Path
+
+from enre.analysis.analyze_manager import AnalyzeManager, ModuleDB
+from enre.analysis.incremental import PickleRecursionLimit
+from enre.cfg.module_tree import ModuleSummary
+from enre.ent.entity import Entity, NameSpaceEntity, Class, Module, UnknownVar, get_anonymous_ent, assign_entity_ids, \
+    invalidate_class_caches, next_entity_id
+from enre.ref.Ref import Ref
+
+logger = logging.getLogger(__name__)
+
+# the manager and the objects shared with forked worker processes
+_task_manager: ty.Optional[AnalyzeManager] = None
+_task_shared: ty.Optional["SharedObjects"] = None
+
+
+class ImportPrescan:
+    """Imports of the modules of the project, found before the modules are analyzed.
+
+    `reads` maps a module to the modules it may read while it's analyzed. Importing
+    `a.b` binds the package `a`, and any module of the package can be reached through
+    attributes of it, so the importing module may read all modules of the package.
+
+    `strict_imports` maps a module to the modules its `from ... import` statements
+    analyze first, in the order the analyzer reaches the statements, `start` and
+    `finish` number the events of the serial analysis following them from the modules
+    in the order of `iter_dir`.
+    """
+
+    def __init__(self, manager: AnalyzeManager) -> None:
+        self.manager = manager
+        root_db = manager.root_db
+        self.module_paths = [rel_path for rel_path in root_db.tree.keys() if rel_path != manager.builtin_path]
+        self.reads: ty.Dict[Path, ty.List[Path]] = dict()
+        self.strict_imports: ty.Dict[Path, ty.List[Path]] = dict()
+        self.start: ty.Dict[Path, int] = dict()
+        self.finish: ty.Dict[Path, int] = dict()
+        modules = set(self.module_paths)
+        modules_of_package: ty.Dict[Path, ty.List[Path]] = dict()
+        for rel_path in self.module_paths:
+            for package_path in rel_path.parents:
+                if package_path in root_db.package_tree:
+                    modules_of_package.setdefault(package_path, []).append(rel_path)
+        for rel_path in self.module_paths:
+            module_db = root_db.tree[rel_path]
+            read: ty.Dict[Path, None] = dict()
+            for node in ast.walk(module_db.tree):
+                if isinstance(node, ast.Import):
+                    aliases = [alias.name for alias in node.names]
+                elif isinstance(node, ast.ImportFrom) and node.module is not None:
+                    # names imported from a package may be its modules
+                    aliases = [node.module] + [f"{node.module}.{alias.name}" for alias in node.names]
+                else:
+                    continue
+                for alias in aliases:
+                    imported_path, head_path = manager.alias2path(rel_path, alias)
+                    if imported_path in modules:
+                        read[imported_path] = None
+                    if isinstance(node, ast.Import):
+                        read.update(dict.fromkeys(modules_of_package.get(head_path, [])))
+            strict: ty.List[Path] = []
+            self._scan_scope(module_db.module_ent, module_db.tree.body, strict)
+            self.strict_imports[rel_path] = [imported for imported in strict if imported in modules]
+            # importing from a package analyzes its `__init__` module
+            read.update(dict.fromkeys(self.strict_imports[rel_path]))
+            read.pop(rel_path, None)
+            self.reads[rel_path] = list(read)
+        self._number_serial_analysis()
+
+    def _scan_scope(self, module_ent: Module, stmts: ty.List[ast.stmt], strict: ty.List[Path]) -> None:
+        # bodies of functions are analyzed after the statements of the scope defining them
+        hooks: ty.List[ty.List[ast.stmt]] = []
+        self._scan_stmts(module_ent, stmts, strict, hooks, hooks)
+        for hook in hooks:
+            self._scan_scope(module_ent, hook, strict)
+
+    def _scan_stmts(self, module_ent: Module, nodes: ty.Iterable[ast.AST], strict: ty.List[Path],
+                    hooks: ty.List[ty.List[ast.stmt]], outer_hooks: ty.List[ty.List[ast.stmt]]) -> None:
+        """
+        Follow the order of `Analyzer.iter_analyze`, bodies of methods are analyzed after
+        the statements of the scope defining the class, like in `Analyzer.analyze_function`.
+        """
+        for node in nodes:
+            if isinstance(node, ast.expr):
+                continue
+            elif isinstance(node, ast.ImportFrom):
+                if node.module is not None:
+                    imported_path = self.manager.strict_import_target(module_ent, node.module)
+                    if imported_path is not None:
+                        strict.append(imported_path)
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if self.manager.analyzes_bodies(module_ent.module_path):
+                    outer_hooks.append(node.body)
+            elif isinstance(node, ast.ClassDef):
+                class_hooks: ty.List[ty.List[ast.stmt]] = []
+                self._scan_stmts(module_ent, node.body, strict, class_hooks, hooks)
+                for hook in class_hooks:
+                    self._scan_scope(module_ent, hook, strict)
+            elif isinstance(node, ast.For):
+                # the else branch isn't analyzed by `Analyzer.iter_analyze_For`
+                self._scan_stmts(module_ent, node.body, strict, hooks, hooks)
+            else:
+                for _, value in ast.iter_fields(node):
+                    if isinstance(value, list):
+                        self._scan_stmts(module_ent, (item for item in value if isinstance(item, ast.AST)),
+                                         strict, hooks, hooks)
+                    elif isinstance(value, ast.AST):
+                        self._scan_stmts(module_ent, [value], strict, hooks, hooks)
+
+    def _number_serial_analysis(self) -> None:
+        clock = 0
+        for root in self.module_paths:
+            if root in self.start:
+                continue
+            self.start[root] = clock
+            clock += 1
+            work: ty.List[ty.Tuple[Path, ty.Iterator[Path]]] = [(root, iter(self.strict_imports[root]))]
+            while work:
+                current, imported_paths = work[-1]
+                imported_path = next(imported_paths, None)
+                if imported_path is None:
+                    work.pop()
+                    self.finish[current] = clock
+                    clock += 1
+                elif imported_path not in self.start:
+                    self.start[imported_path] = clock
+                    clock += 1
+                    work.append((imported_path, iter(self.strict_imports[imported_path])))
+
+    def dependencies(self) -> ty.Dict[Path, ty.Dict[Path, int]]:
+        """
+        Modules a module of the project must be analyzed with or after, so it reads them
+        in the same state as the serial analysis does.
+
+        :return: the map from a module to the modules it depends on and the count of waves
+            it must be analyzed after them, modules depending on each other with 0 waves
+            are analyzed in the same group
+        """
+        start, finish = self.start, self.finish
+        ret: ty.Dict[Path, ty.Dict[Path, int]] = {rel_path: dict() for rel_path in self.module_paths}
+
+        def depend(rel_path: Path, dependency: Path, waves: int) -> None:
+            ret[rel_path][dependency] = max(ret[rel_path].get(dependency, 0), waves)
+
+        for rel_path, read in self.reads.items():
+            for imported_path in read:
+                if finish[imported_path] < finish[rel_path]:
+                    # the imported module is finished before the module reads it, or it's
+                    # analyzed when a statement of the module imports it
+                    depend(rel_path, imported_path, 1)
+                else:
+                    # the module is analyzed while the imported module is suspended, or it
+                    # reads the imported module before it's analyzed, an attribute of the
+                    # imported module the module reads starts analyzing it then
+                    depend(rel_path, imported_path, 0)
+                    depend(imported_path, rel_path, 0)
+        return ret
+
+
+def import_components(dependencies: ty.Dict[Path, ty.Dict[Path, int]]) -> ty.List[ty.List[Path]]:
+    """
+    Group the modules into the strongly connected components of the dependency graph,
+    modules of a component are analyzed in one process.
+
+    :param dependencies: see `ImportPrescan.dependencies`
+    :return: components after the components they depend on
+    """
+    index_of: ty.Dict[Path, int] = dict()
+    low_link: ty.Dict[Path, int] = dict()
+    on_stack: ty.Set[Path] = set()
+    stack: ty.List[Path] = []
+    components: ty.List[ty.List[Path]] = []
+    for root in dependencies:
+        if root in index_of:
+            continue
+        # Tarjan's algorithm with an explicit stack, import chains may be longer than the recursion limit
+        work: ty.List[ty.Tuple[Path, ty.Iterator[Path]]] = [(root, iter(dependencies[root]))]
+        index_of[root] = low_link[root] = len(index_of)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            current, successors = work[-1]
+            successor = next(successors, None)
+            if successor is not None:
+                if successor not in index_of:
+                    index_of[successor] = low_link[successor] = len(index_of)
+                    stack.append(successor)
+                    on_stack.add(successor)
+                    work.append((successor, iter(dependencies[successor])))
+                elif successor in on_stack:
+                    low_link[current] = min(low_link[current], index_of[successor])
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                low_link[parent] = min(low_link[parent], low_link[current])
+            if low_link[current] == index_of[current]:
+                component: ty.List[Path] = []
+                while True:
+                    member = stack.pop()
+                    on_stack.discard(member)
+                    component.append(member)
+                    if member == current:
+                        break
+                components.append(component)
+    return components
+
+
+def component_waves(dependencies: ty.Dict[Path, ty.Dict[Path, int]],
+                    components: ty.List[ty.List[Path]]) -> ty.List[ty.List[ty.List[Path]]]:
+    """
+    Schedule the components in waves, components of a wave don't depend on each other
+    and can be analyzed in parallel once the earlier waves are merged.
+
+    :param components: components after the components they depend on, see `import_components`
+    """
+    wave_of: ty.Dict[Path, int] = dict()
+    waves: ty.List[ty.List[ty.List[Path]]] = []
+    for component in components:
+        members = set(component)
+        wave = max((wave_of[dependency] + waves_after for rel_path in component
+                    for dependency, waves_after in dependencies[rel_path].items()
+                    if dependency not in members), default=0)
+        for rel_path in component:
+            wave_of[rel_path] = wave
+        while len(waves) <= wave:
+            waves.append([])
+        waves[wave].append(component)
+    return waves
+
+
+def _component_weight(manager: AnalyzeManager, component: ty.List[Path]) -> int:
+    weight = 0
+    for rel_path in component:
+        try:
+            weight += manager.root_db.absolute_path(rel_path).stat().st_size
+        except OSError:
+            continue
+    return weight
+
+
+def schedule_components(manager: AnalyzeManager, components: ty.List[ty.List[Path]],
+                        task_count: int, order: ty.Dict[Path, int]) -> ty.List[ty.List[Path]]:
+    """
+    Pack components into at most task_count tasks of similar total file size,
+    the largest components are placed first.
+
+    :param order: modules of a task are sorted by it, the serial analysis starts them in this order
+    """
+    weighted = sorted(((_component_weight(manager, component), index) for index, component in enumerate(components)),
+                      reverse=True)
+    task_weights = [0] * min(task_count, len(components))
+    tasks: ty.List[ty.List[Path]] = [[] for _ in task_weights]
+    for weight, index in weighted:
+        lightest = task_weights.index(min(task_weights))
+        task_weights[lightest] += weight
+        tasks[lightest].extend(components[index])
+    return [sorted(task, key=order.__getitem__) for task in tasks if task]
+
+
+def shared_entities(manager: AnalyzeManager) -> ty.List[Entity]:
+    """
+    Entities existing before the worker processes start, they are identified by
+    their ids when analysis results are sent back from the workers.
+    """
+    root_db = manager.root_db
+    ents: ty.Dict[int, Entity] = dict()
+
+    def add(ent: Entity) -> None:
+        if id(ent) not in ents:
+            ents[id(ent)] = ent
+
+    for module_db in root_db.tree.values():
+        add(module_db.module_ent)
+        for ent in module_db.dep_db.ents:
+            add(ent)
+    for ent in root_db.global_db.ents:
+        add(ent)
+    for package_ent in root_db.package_tree.values():
+        add(package_ent)
+    add(get_anonymous_ent())
+    for unknown_var in UnknownVar.pooled_vars():
+        add(unknown_var)
+    for ent in list(ents.values()):
+        for ref in ent.refs():
+            add(ref.target_ent)
+    return list(ents.values())
+
+
+class EntityChange:
+    """References and names added to a shared entity by a worker process."""
+
+    def __init__(self, ent: Entity, ref_count: int, refs: ty.List[Ref],
+                 names: ty.Dict[str, ty.List[Entity]], inherits: ty.List[Class]) -> None:
+        self.ent = ent
+        self.ref_count = ref_count
+        self.refs = refs
+        self.names = names
+        self.inherits = inherits
+
+    def apply(self) -> None:
+        ent = self.ent
+        if len(ent.refs()) == self.ref_count:
+            # no other worker changed the entity, the references are already distinct
+            ent.set_refs(ent.refs() + self.refs)
+        else:
+            for ref in self.refs:
+                Entity.add_ref(ent, ref)
+        if isinstance(ent, NameSpaceEntity):
+            for name, ents in self.names.items():
+                ent.names[name].extend(ents)
+        if isinstance(ent, Class):
+            ent.inherits.extend(self.inherits)
+
+
+class EntitySnapshot:
+    def __init__(self, ents: ty.List[Entity]) -> None:
+        self._ents = ents
+        self._ref_counts = [len(ent.refs()) for ent in ents]
+        self._name_counts = [{name: len(bound) for name, bound in ent.names.items()}
+                             if isinstance(ent, NameSpaceEntity) else dict() for ent in ents]
+        self._inherit_counts = [len(ent.inherits) if isinstance(ent, Class) else 0 for ent in ents]
+
+    def changes(self) -> ty.List[EntityChange]:
+        ret: ty.List[EntityChange] = []
+        for ent, ref_count, name_counts, inherit_count in zip(self._ents, self._ref_counts, self._name_counts,
+                                                              self._inherit_counts):
+            refs = ent.refs()[ref_count:]
+            names: ty.Dict[str, ty.List[Entity]] = dict()
+            if isinstance(ent, NameSpaceEntity):
+                for name, bound in ent.names.items():
+                    count = name_counts.get(name)
+                    if count is None or len(bound) > count:
+                        names[name] = bound[count or 0:]
+            inherits = ent.inherits[inherit_count:] if isinstance(ent, Class) else []
+            if refs or names or inherits:
+                ret.append(EntityChange(ent, ref_count, refs, names, inherits))
+        return ret
+
+
+class AnalysisShard:
+    """Analysis result of the modules of one task, computed in a worker process."""
+
+    def __init__(self, module_dbs: ty.Dict[Path, ModuleDB], global_ents: ty.List[Entity],
+                 changes: ty.List[EntityChange], summaries: ty.List[ModuleSummary],
+                 summary_items: ty.List[ty.Tuple[Entity, ModuleSummary]],
+                 import_graph: ty.Dict[Path, ty.Set[Path]], unresolved_importers: ty.Set[Path],
+                 module_times: ty.Dict[Path, float], max_import_depth: int) -> None:
+        self.module_dbs = module_dbs
+        self.global_ents = global_ents
+        self.changes = changes
+        self.summaries = summaries
+        self.summary_items = summary_items
+        self.import_graph = import_graph
+        self.unresolved_importers = unresolved_importers
+        self.module_times = module_times
+        self.max_import_depth = max_import_depth
+        # entities created by the worker, filled when the shard is loaded
+        self.new_ents: ty.List[Entity] = []
+
+
+class SharedObjects:
+    """Entities and syntax trees existing before the worker processes start.
+
+    Workers refer to them by keys instead of pickling copies of them, the keys are
+    resolved to the objects of this process when the results are loaded. The keys and
+    the snapshot of the entities are computed once before the workers are forked, the
+    workers inherit them.
+    """
+
+    def __init__(self, manager: AnalyzeManager, module_paths: ty.List[Path]) -> None:
+        """
+        :param module_paths: modules analyzed by the workers, nodes of their trees are shared
+        """
+        self.ents = shared_entities(manager)
+        self.snapshot = EntitySnapshot(self.ents)
+        self._ents_by_id: ty.Dict[int, Entity] = dict()
+        self._nodes = {str(rel_path): list(ast.walk(manager.root_db.tree[rel_path].tree))
+                       for rel_path in module_paths}
+        self.persistent_ids: ty.Dict[int, ty.Tuple[str, ty.Any]] = {id(ent): ("entity", ent.id)
+                                                                     for ent in self.ents}
+        for module_path, nodes in self._nodes.items():
+            for index, node in enumerate(nodes):
+                self.persistent_ids[id(node)] = ("node", (module_path, index))
+
+    def entity(self, ent_id: int) -> Entity:
+        if not self._ents_by_id:
+            self._ents_by_id = {ent.id: ent for ent in self.ents}
+        return self._ents_by_id[ent_id]
+
+    def node(self, key: ty.Tuple[str, int]) -> ast.AST:
+        module_path, index = key
+        return self._nodes[module_path][index]
+
+
+# objects of this process referred by the shard being loaded
+_loading_shared: ty.Optional[SharedObjects] = None
+
+
+def _load_shared(kind: str, key: ty.Any) -> ty.Any:
+    assert _loading_shared is not None
+    if kind == "entity":
+        return _loading_shared.entity(key)
+    elif kind == "node":
+        return _loading_shared.node(key)
+    return UnknownVar.get_unknown_var(key)
+
+
+class _ShardPickler(pickle.Pickler):
+    def __init__(self, file: ty.IO[bytes], persistent_ids: ty.Dict[int, ty.Tuple[str, ty.Any]]) -> None:
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self._persistent_ids = persistent_ids
+        self.new_ents: ty.List[Entity] = []
+        # checking subclasses of an abstract class is slow, it's done once per type
+        self._entity_types: ty.Dict[type, bool] = dict()
+
+    def reducer_override(self, obj: ty.Any) -> ty.Any:
+        # unlike persistent_id, this is not called for atomic objects and objects already pickled
+        pid = self._persistent_ids.get(id(obj))
+        if pid is not None:
+            return _load_shared, pid
+        obj_type = type(obj)
+        is_entity = self._entity_types.get(obj_type)
+        if is_entity is None:
+            is_entity = self._entity_types[obj_type] = issubclass(obj_type, Entity)
+        if is_entity:
+            if isinstance(obj, UnknownVar) and UnknownVar.is_pooled(obj):
+                # unknown variables are shared by name
+                return _load_shared, ("unknown", obj.longname.name)
+            self.new_ents.append(obj)
+        return NotImplemented
+
+
+def dump_shard(shard: AnalysisShard, persistent_ids: ty.Dict[int, ty.Tuple[str, ty.Any]]) -> bytes:
+    file = io.BytesIO()
+    pickler = _ShardPickler(file, persistent_ids)
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, PickleRecursionLimit))
+    try:
+        # the list of new entities is completed while the shard is pickled
+        pickler.dump((shard, pickler.new_ents))
+    finally:
+        sys.setrecursionlimit(limit)
+    return file.getvalue()
+
+
+def load_shard(data: bytes, shared: SharedObjects) -> AnalysisShard:
+    global _loading_shared
+    limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(limit, PickleRecursionLimit))
+    _loading_shared = shared
+    # all loaded objects stay alive, collecting garbage while loading only costs time
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        shard, new_ents = pickle.loads(data)
+    finally:
+        if gc_enabled:
+            gc.enable()
+        _loading_shared = None
+        sys.setrecursionlimit(limit)
+    assert isinstance(shard, AnalysisShard)
+    shard.new_ents = new_ents
+    return shard
+
+
+def _analyze_task(module_paths: ty.List[Path]) -> ty.Tuple[ty.List[Path], bytes]:
+    manager = _task_manager
+    shared = _task_shared
+    assert manager is not None and shared is not None
+    root_db = manager.root_db
+    # entities of the shard are pickled with their references
+    root_db.spill_store = None
+    scene = manager.scene
+    global_count = len(root_db.global_db.ents)
+    summary_count = len(scene.summaries)
+    summary_map_count = len(scene.summary_map)
+    import_graph_before = set(manager.import_graph.keys())
+    unresolved_before = set(manager.unresolved_importers)
+    finished_before = set(manager.module_stack.finished_module_set)
+    for rel_path in module_paths:
+        manager.analyze_module(rel_path)
+    finished = manager.module_stack.finished_module_set - finished_before
+    foreign_modules = sorted(finished - set(module_paths))
+    shard = AnalysisShard({rel_path: root_db.tree[rel_path] for rel_path in module_paths},
+                          root_db.global_db.ents[global_count:],
+                          shared.snapshot.changes(),
+                          scene.summaries[summary_count:],
+                          list(scene.summary_map.items())[summary_map_count:],
+                          {k: v for k, v in manager.import_graph.items() if k not in import_graph_before},
+                          manager.unresolved_importers - unresolved_before,
+                          dict(manager.profiler.module_times),
+                          manager.module_stack.max_depth)
+    return foreign_modules, dump_shard(shard, shared.persistent_ids)
+
+
+def merge_db(manager: AnalyzeManager, shard: AnalysisShard) -> None:
+    """
+    Merge the analysis result of a worker into the databases and the scene of the manager.
+    """
+    root_db = manager.root_db
+    for rel_path, module_db in shard.module_dbs.items():
+        module_db.parse_cache = root_db.parse_cache
+        root_db.tree[rel_path] = module_db
+        manager.module_stack.finished_module_set.add(rel_path)
+    root_db.global_db.ents.extend(shard.global_ents)
+    for change in shard.changes:
+        change.apply()
+    # names and bases of shared classes were extended without add_ref
+    invalidate_class_caches()
+    manager.scene.summaries.extend(shard.summaries)
+    for ent, summary in shard.summary_items:
+        manager.scene.summary_map[ent] = summary
+    for from_path, imported_paths in shard.import_graph.items():
+        manager.import_graph.setdefault(from_path, set()).update(imported_paths)
+    manager.unresolved_importers |= shard.unresolved_importers
+    manager.profiler.add_module_times(shard.module_times)
+    manager.module_stack.max_depth = max(manager.module_stack.max_depth, shard.max_import_depth)
+
+
+def _renumber_entities(manager: AnalyzeManager, shards: ty.List[AnalysisShard], shared: SharedObjects,
+                       first_id: int) -> None:
+    """
+    Entities created by different workers may have the same id, number all of them
+    again in the order of the modules defining them.
+    """
+    root_db = manager.root_db
+    known = {id(ent) for ent in shared.ents}
+    new_ents: ty.Dict[int, Entity] = dict()
+    added_ents: ty.Dict[Path, ty.List[Entity]] = dict()
+    for shard in shards:
+        for rel_path, module_db in shard.module_dbs.items():
+            # ids of the entities added to the module database, they are changed below
+            added_ents[rel_path] = [ent for ent in module_db.dep_db.ents if ent.id in module_db.ent_id_set]
+    for module_db in root_db.tree.values():
+        for ent in module_db.dep_db.ents:
+            if id(ent) not in known:
+                new_ents.setdefault(id(ent), ent)
+    for ent in root_db.global_db.ents:
+        if id(ent) not in known:
+            new_ents.setdefault(id(ent), ent)
+    for shard in shards:
+        for ent in shard.new_ents:
+            new_ents.setdefault(id(ent), ent)
+    for unknown_var in UnknownVar.pooled_vars():
+        if id(unknown_var) not in known:
+            new_ents.setdefault(id(unknown_var), unknown_var)
+    assign_entity_ids(new_ents.values(), first_id)
+    for rel_path, ents in added_ents.items():
+        root_db.tree[rel_path].ent_id_set = {ent.id for ent in ents}
+
+
+def analyze_parallel(manager: AnalyzeManager, jobs: int) -> None:
+    """
+    Analyze the strongly connected components of the import graph in waves. Components
+    of a wave only import components of earlier waves, they are analyzed in forked worker
+    processes and their results are merged before the workers of the next wave start
+    from the merged state. Builtins are analyzed once before the workers start and shared
+    with all of them. Falls back to analyzing all modules in this process if processes
+    can't be forked.
+    """
+    manager.analyze_builtins()
+    if manager.builtin_path:
+        manager.get_builtins_sub_env(manager.root_db.get_module_db_of_path(manager.builtin_path))
+    if "fork" not in multiprocessing.get_all_start_methods():
+        logger.warning("parallel analysis needs the fork start method, analyzing modules in one process")
+        with manager.profiler.measure("modules"):
+            manager.iter_dir(manager.project_root)
+        return
+    with manager.profiler.measure("import prescan"):
+        prescan = ImportPrescan(manager)
+        dependencies = prescan.dependencies()
+        components = import_components(dependencies)
+        waves = component_waves(dependencies, components)
+    sizes = sorted((len(component) for component in components), reverse=True)
+    manager.profiler.record_groups(sizes, len(waves))
+    logger.info("analyzing %d groups of modules in %d waves, the largest groups have %s modules",
+                len(components), len(waves), sizes[:5])
+    for wave in waves:
+        # every task is analyzed in a process forked for it, a task per process costs the fewest forks
+        tasks = schedule_components(manager, wave, jobs, prescan.start)
+        if len(tasks) <= 1:
+            # nothing to analyze in parallel, forking and merging would only cost time
+            with manager.profiler.measure("modules"):
+                for task in tasks:
+                    for rel_path in task:
+                        manager.analyze_module(rel_path)
+        elif not _analyze_wave(manager, tasks, jobs):
+            with manager.profiler.measure("modules"):
+                manager.iter_dir(manager.project_root)
+            break
+    for module_db in manager.root_db.tree.values():
+        if module_db.module_path != manager.builtin_path:
+            module_db.release_tree()
+
+
+def _analyze_wave(manager: AnalyzeManager, tasks: ty.List[ty.List[Path]], jobs: int) -> bool:
+    """
+    Analyze the tasks in forked worker processes and merge their results.
+
+    :return: False if a worker analyzed modules of another task, the results are dropped then
+    """
+    global _task_manager, _task_shared
+    module_paths = [rel_path for task in tasks for rel_path in task]
+    shared = SharedObjects(manager, module_paths)
+    first_id = next_entity_id()
+    _task_manager = manager
+    _task_shared = shared
+    # collections in the workers would touch and copy every page of the objects they inherit
+    gc.freeze()
+    try:
+        context = multiprocessing.get_context("fork")
+        # every task starts from the state of this process
+        with manager.profiler.measure("modules"), context.Pool(min(jobs, len(tasks)), maxtasksperchild=1) as pool:
+            results = pool.map(_analyze_task, tasks, chunksize=1)
+    finally:
+        gc.unfreeze()
+        _task_manager = None
+        _task_shared = None
+    foreign_modules = [rel_path for task_foreign_modules, _ in results for rel_path in task_foreign_modules]
+    if foreign_modules:
+        # the import prescan missed an import, the tasks are not independent
+        logger.warning("modules %s were reached from other groups, analyzing modules in one process",
+                       foreign_modules)
+        return False
+    with manager.profiler.measure("merge"):
+        shards = [load_shard(data, shared) for _, data in results]
+        for shard in shards:
+            merge_db(manager, shard)
+        _renumber_entities(manager, shards, shared, first_id)
+    return True
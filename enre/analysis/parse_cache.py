@@ -0,0 +1,118 @@
+import ast
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+import time
+import typing as ty
+from pathlib import Path
+
+from enre.analysis.cache_dir import user_cache_dir, is_private_dir
+
+DefaultCacheDir = user_cache_dir().joinpath("ast")
+DefaultSizeLimit = 512 * 1024 * 1024
+_CacheFormatVersion = 1
+# seconds after which a temporary file is left by a failed process, younger ones may still be written
+_StaleTmpAge = 60 * 60
+
+
+class ParseCache:
+    """On-disk cache of parsed modules.
+
+    Syntax trees are stored by the hash of the file content and the version
+    of the running interpreter, so a file is parsed again only if its content
+    changes or another interpreter reads the cache. The total size of the
+    cache is kept under `size_limit` by evicting the least recently used
+    entries, every cache hit refreshes the modification time of its entry.
+    The cache isn't used if its directory is writable by other users, since
+    entries are unpickled.
+    """
+
+    def __init__(self, cache_dir: Path = DefaultCacheDir, size_limit: int = DefaultSizeLimit) -> None:
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        self._interpreter_tag = f"{sys.implementation.cache_tag}-{sys.hexversion}-{_CacheFormatVersion}"
+        self._private: ty.Optional[bool] = None
+
+    def usable(self) -> bool:
+        if self._private is None:
+            self._private = is_private_dir(self.cache_dir)
+        return self._private
+
+    def key(self, source: bytes) -> str:
+        hasher = hashlib.sha256(self._interpreter_tag.encode())
+        hasher.update(source)
+        return hasher.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir.joinpath(f"{key}.pickle")
+
+    def load(self, key: str) -> ty.Optional[ast.Module]:
+        if not self.usable():
+            return None
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as file:
+                tree = pickle.load(file)
+            os.utime(entry_path)
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+            return None
+        return tree if isinstance(tree, ast.Module) else None
+
+    def store(self, key: str, tree: ast.Module) -> None:
+        if not self.usable():
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump(tree, file, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._entry_path(key))
+        except (OSError, RecursionError):
+            # a cache failure should never fail the analysis
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def evict(self) -> None:
+        """
+        Remove least recently used entries until the cache fits in the size limit, and
+        temporary files of stores which failed without removing them.
+        """
+        if not self.usable():
+            return
+        entries: ty.List[ty.Tuple[float, int, str]] = []
+        total_size = 0
+        stale_before = time.time() - _StaleTmpAge
+        try:
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".tmp"):
+                        try:
+                            if entry.stat().st_mtime < stale_before:
+                                os.remove(entry.path)
+                        except OSError:
+                            pass
+                        continue
+                    if not entry.name.endswith(".pickle"):
+                        continue
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+        except OSError:
+            return
+        if total_size <= self.size_limit:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total_size <= self.size_limit:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total_size -= size
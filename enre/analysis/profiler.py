@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import typing as ty
+from collections import defaultdict
+from contextlib import contextmanager
+from pathlib import Path
+
+JsonDict = ty.Dict[str, ty.Any]
+
+
+def peak_rss(children: bool = False) -> ty.Optional[int]:
+    """
+    :param children: measure the largest terminated child process instead of this process
+    :return: peak resident set size in bytes, None if the platform can't measure it
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    who = resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF
+    max_rss = resource.getrusage(who).ru_maxrss
+    # kilobytes on linux, bytes on macOS
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+def current_rss() -> ty.Optional[int]:
+    """
+    :return: resident set size of this process in bytes, the peak size if the platform
+        can't measure the current one
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            resident_pages = int(file.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return peak_rss()
+
+
+class Profiler:
+    """Time spent in each phase of the analysis and in each module.
+
+    Measured sections can be nested, the time of a nested section is not counted
+    for the enclosing one. A module analyzed because another module imports it is
+    not counted for the importing module, and the parse time of a module is
+    counted for the `parse` phase instead of the module.
+    """
+
+    def __init__(self) -> None:
+        self.phase_times: ty.Dict[str, float] = defaultdict(float)
+        self.module_times: ty.Dict[Path, float] = defaultdict(float)
+        # sizes of the groups of modules analyzed in parallel and the count of waves analyzing them
+        self.group_sizes: ty.Optional[ty.List[int]] = None
+        self.group_waves = 0
+        # phase, module and the time the section was started or resumed
+        self._stack: ty.List[ty.Tuple[str, ty.Optional[Path], float]] = []
+
+    def _suspend_current(self, now: float) -> None:
+        if self._stack:
+            phase, module, resumed = self._stack[-1]
+            self._record(phase, module, now - resumed)
+
+    def _record(self, phase: str, module: ty.Optional[Path], elapsed: float) -> None:
+        self.phase_times[phase] += elapsed
+        if module is not None:
+            self.module_times[module] += elapsed
+
+    @contextmanager
+    def measure(self, phase: str, module: ty.Optional[Path] = None) -> ty.Iterator[None]:
+        now = time.perf_counter()
+        self._suspend_current(now)
+        self._stack.append((phase, module, now))
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            phase, module, resumed = self._stack.pop()
+            self._record(phase, module, now - resumed)
+            if self._stack:
+                parent_phase, parent_module, _ = self._stack[-1]
+                self._stack[-1] = (parent_phase, parent_module, now)
+
+    def add_module_times(self, module_times: ty.Dict[Path, float]) -> None:
+        """
+        Add time measured in another process, it's not counted in the phase time of this process.
+        """
+        for module, elapsed in module_times.items():
+            self.module_times[module] += elapsed
+
+    def record_groups(self, sizes: ty.List[int], waves: int) -> None:
+        self.group_sizes = sizes
+        self.group_waves = waves
+
+    def slowest_modules(self, count: int) -> ty.List[ty.Tuple[Path, float]]:
+        return sorted(self.module_times.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def report(self, slowest_count: int = 10) -> JsonDict:
+        ret: JsonDict = {
+            "phases": dict(self.phase_times),
+            "slowest modules": [{"module": str(module), "time": elapsed}
+                                for module, elapsed in self.slowest_modules(slowest_count)],
+            "peak rss": peak_rss(),
+        }
+        if self.group_sizes is not None:
+            ret["parallel groups"] = {"count": len(self.group_sizes), "waves": self.group_waves,
+                                      "largest": self.group_sizes[:slowest_count]}
+        children_rss = peak_rss(children=True)
+        if children_rss:
+            ret["peak rss of child processes"] = children_rss
+        return ret
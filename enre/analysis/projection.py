@@ -0,0 +1,84 @@
+import typing as ty
+
+from enre.ent.EntKind import RefKind, EntKind
+
+# relations the analysis reads to resolve names, attributes and bases, built for every projection
+AnalysisRefKinds = frozenset({RefKind.DefineKind, RefKind.ContainKind, RefKind.InheritKind})
+
+# relations which may target a referenced attribute, rebuilt to the attributes it resolves to
+AttributeRefKinds = frozenset({RefKind.UseKind, RefKind.CallKind, RefKind.SetKind, RefKind.Annotate})
+
+
+class Projection:
+    """Kinds of relations and entities written to the report.
+
+    The report of a projection is the full report without the nodes of other entity
+    kinds and without the edges of other relation kinds or from or to dropped nodes.
+    References of kinds the analysis doesn't read are not created unless they are in
+    the projection, nor are the helper entities only such references would target.
+    """
+
+    def __init__(self, relations: ty.Optional[ty.Iterable[RefKind]] = None,
+                 entities: ty.Optional[ty.Iterable[EntKind]] = None) -> None:
+        """
+        :param relations: kinds of relations to report, None for all
+        :param entities: kinds of entities to report, None for all
+        """
+        self.relations = frozenset(relations) if relations is not None else None
+        self.entities = frozenset(entities) if entities is not None else None
+
+    @classmethod
+    def parse(cls, relations: ty.Optional[str], entities: ty.Optional[str]) -> "Projection":
+        """
+        Create a projection from comma separated kind names as they are written in reports.
+
+        :raise ValueError: if any name isn't a kind name
+        """
+        return Projection(_parse_kinds(RefKind, relations) if relations is not None else None,
+                          _parse_kinds(EntKind, entities) if entities is not None else None)
+
+    def keeps_relation(self, kind: RefKind) -> bool:
+        return self.relations is None or kind in self.relations
+
+    def keeps_entity(self, kind: EntKind) -> bool:
+        return self.entities is None or kind in self.entities
+
+    def keeps_ref(self, src: EntKind, kind: RefKind, dest: EntKind) -> bool:
+        return self.keeps_relation(kind) and self.keeps_entity(src) and self.keeps_entity(dest)
+
+    def builds(self, kind: RefKind, target_kind: ty.Optional[EntKind] = None) -> bool:
+        """
+        :param target_kind: kind of the target entity of the reference, None if it's unknown
+        :return: False if references of the kind to the target are not created by the analysis,
+            references to referenced attributes are created while their unresolved attributes are
+            reported, since these are created from the references when attributes are resolved
+        """
+        if kind in AnalysisRefKinds or self.keeps_relation(kind):
+            return True
+        return (target_kind == EntKind.ReferencedAttr and kind in AttributeRefKinds
+                and self.keeps_entity(EntKind.UnresolvedAttr))
+
+    def builds_referenced_attributes(self) -> bool:
+        return (self.relations is None or not self.relations.isdisjoint(AttributeRefKinds)
+                or self.keeps_entity(EntKind.UnresolvedAttr))
+
+    def builds_ambiguous_attributes(self) -> bool:
+        return (self.builds_referenced_attributes() or self.keeps_relation(RefKind.HasambiguousKind)
+                or self.keeps_entity(EntKind.AmbiguousAttr))
+
+
+_Kind = ty.TypeVar("_Kind", RefKind, EntKind)
+
+
+def _parse_kinds(kind_type: ty.Type[_Kind], names: str) -> ty.List[_Kind]:
+    by_name = {kind.value.lower(): kind for kind in kind_type}
+    kinds = []
+    for name in names.split(","):
+        name = name.strip()
+        if not name:
+            continue
+        kind = by_name.get(name.lower())
+        if kind is None:
+            raise ValueError(f"unknown kind {name!r}, expected one of {', '.join(k.value for k in kind_type)}")
+        kinds.append(kind)
+    return kinds
@@ -0,0 +1,118 @@
+import ast
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import weakref
+import typing as ty
+from pathlib import Path
+
+from enre.analysis.profiler import current_rss
+from enre.ent.entity import Entity, SpilledRefs
+from enre.ref.Ref import Ref
+
+if ty.TYPE_CHECKING:
+    from enre.analysis.analyze_manager import ModuleDB
+
+logger = logging.getLogger(__name__)
+
+
+class _RefsPickler(pickle.Pickler):
+    """Write entities and syntax nodes as their ids, the store keeps them alive, so
+    references paged in point to the same objects as the summaries and other modules."""
+
+    def __init__(self, file: ty.IO[bytes], objects: ty.Dict[int, ty.Any]) -> None:
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.objects = objects
+
+    def persistent_id(self, obj: ty.Any) -> ty.Optional[int]:
+        if isinstance(obj, (Entity, ast.AST)):
+            self.objects[id(obj)] = obj
+            return id(obj)
+        return None
+
+
+class _RefsUnpickler(pickle.Unpickler):
+    def __init__(self, file: ty.IO[bytes], objects: ty.Dict[int, ty.Any]) -> None:
+        super().__init__(file)
+        self.objects = objects
+
+    def persistent_load(self, pid: ty.Any) -> ty.Any:
+        return self.objects[pid]
+
+
+def _remove_dir(path: str, owner_pid: int) -> None:
+    # forked processes share the directory, only the process creating it removes it
+    if os.getpid() == owner_pid:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+class SpillStore:
+    """References of finished modules written to a temporary directory.
+
+    A module is spilled when the resident set of the process is over the budget at a
+    checkpoint, references of all its entities are replaced by a marker and written to
+    one file. The first access to the references of any of these entities pages the
+    whole module back in, so passes visiting entities module by module load every
+    spilled module once and the module can be spilled again at the next checkpoint.
+
+    Entities, summaries and syntax trees stay in memory, only the references are spilled.
+    """
+
+    def __init__(self, budget: int) -> None:
+        """
+        :param budget: resident set size in bytes above which finished modules are spilled
+        """
+        self.budget = budget
+        self._dir = Path(tempfile.mkdtemp(prefix="enre-spill-"))
+        weakref.finalize(self, _remove_dir, str(self._dir), os.getpid())
+        # finished modules in memory, in the order they were finished or paged in
+        self._resident: ty.Dict[Path, "ModuleDB"] = dict()
+        self._spill_count = 0
+        self.spilled_modules = 0
+        self.loaded_modules = 0
+
+    def module_finished(self, rel_path: Path, module_db: "ModuleDB") -> None:
+        self._resident.setdefault(rel_path, module_db)
+
+    def over_budget(self) -> bool:
+        rss = current_rss()
+        return rss is not None and rss > self.budget
+
+    def checkpoint(self) -> None:
+        """
+        Spill all finished modules in memory if the process is over the budget.
+        """
+        if self._resident and self.over_budget():
+            for rel_path, module_db in list(self._resident.items()):
+                self.spill(rel_path, module_db)
+
+    def spill(self, rel_path: Path, module_db: "ModuleDB") -> None:
+        del self._resident[rel_path]
+        spill_path = self._dir.joinpath(f"{self._spill_count}.pickle")
+        self._spill_count += 1
+        objects: ty.Dict[int, ty.Any] = dict()
+        spilled = SpilledRefs(lambda: self._load(rel_path, module_db, spilled, spill_path, objects))
+        ent_refs: ty.List[ty.Tuple[Entity, ty.List[Ref]]] = []
+        for ent in module_db.dep_db.ents:
+            refs = ent.spill_refs(spilled)
+            if refs is not None:
+                ent_refs.append((ent, refs))
+        if not ent_refs:
+            return
+        with open(spill_path, "wb") as file:
+            _RefsPickler(file, objects).dump(ent_refs)
+        self.spilled_modules += 1
+        logger.debug("spilled references of %d entities of %s", len(ent_refs), rel_path)
+
+    def _load(self, rel_path: Path, module_db: "ModuleDB", spilled: SpilledRefs, spill_path: Path,
+              objects: ty.Dict[int, ty.Any]) -> None:
+        with open(spill_path, "rb") as file:
+            ent_refs: ty.List[ty.Tuple[Entity, ty.List[Ref]]] = _RefsUnpickler(file, objects).load()
+        spill_path.unlink()
+        for ent, refs in ent_refs:
+            ent.restore_refs(spilled, refs)
+        self.loaded_modules += 1
+        self._resident.setdefault(rel_path, module_db)
+        logger.debug("paged in references of %s", rel_path)
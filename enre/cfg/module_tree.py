@@ -62,6 +62,11 @@ class ModuleSummary:
     def get_object(self) -> HeapObject:
         pass
 
+    @abstractmethod
+    def reset_object(self) -> None:
+        """Drop the heap object created by the control flow analysis."""
+        ...
+
     def get_invokes(self) -> "Iterable[Invoke]":
         rules = self.rules
         invokes = set()
@@ -114,6 +119,9 @@ class FileSummary(ModuleSummary):
             self._correspond_obj = new_obj
             return new_obj
 
+    def reset_object(self) -> None:
+        self._correspond_obj = None
+
     def get_namespace(self) -> NameSpace:
         return self.get_object().get_namespace()
 
@@ -158,6 +166,9 @@ class ClassSummary(ModuleSummary):
             self._correspond_obj = new_obj
             return new_obj
 
+    def reset_object(self) -> None:
+        self._correspond_obj = None
+
     def get_ent(self) -> Entity:
         return self.cls
 
@@ -195,6 +206,9 @@ class FunctionSummary(ModuleSummary):
                 new_obj.namespace[self.kwarg].add(IndexableObject(None, None))
             return new_obj
 
+    def reset_object(self) -> None:
+        self._correspond_obj = None
+
     def get_ent(self) -> Entity:
         return self.func
 
@@ -606,6 +620,49 @@ class SummaryBuilder(object):
         self.mod.add_child(summary)
 
 
+class NullSummaryBuilder(SummaryBuilder):
+    """A builder adding no rules and no syntax names to its summary, used when the control
+    flow analysis doesn't run. Values it returns are only passed back to the builder."""
+
+    def add_store_able(self, store_able: StoreAble) -> None:
+        return
+
+    def add_move(self, lhs: StoreAble, rhs: StoreAble) -> StoreAble:
+        return lhs
+
+    def add_move_temp(self, rhs: StoreAble, expr: ast.expr) -> Temporary:
+        return self.create_temp(expr)
+
+    def add_invoke(self, func: StoreAbles, args: List[StoreAbles],
+                   kwargs: List[Tuple[str, StoreAbles]], invoke_expr: ast.expr) -> StoreAbles:
+        return []
+
+    def add_inherit(self, cls: Class, args: List[StoreAbles]) -> None:
+        return
+
+    def load_field(self, field_accesses: StoreAbles, field: str, context: "ExpressionContext",
+                   expr: ast.expr) -> StoreAbles:
+        return []
+
+    def load_index(self, bases: StoreAbles, context: "ExpressionContext", expr: ast.expr) -> StoreAbles:
+        return []
+
+    def load_index_rvalues(self, bases: StoreAbles, expr: ast.expr) -> StoreAbles:
+        return []
+
+    def load_index_lvalue(self, base: StoreAble, expr: ast.expr) -> IndexAccess:
+        return IndexAccess(base, expr)
+
+    def add_return(self, return_stores: StoreAbles, expr: ast.expr) -> None:
+        return
+
+    def create_list(self, info: IndexableInfo, expr: ast.expr) -> StoreAble:
+        return self.create_temp(expr)
+
+    def add_list(self, info: IndexableInfo, lst_stores: StoreAbles, expr: ast.expr) -> None:
+        return
+
+
 def get_named_store_able(current_module: Entity, ent: Entity, named_node: ast.expr) -> Optional[StoreAble]:
     ret: Optional[StoreAble] = None
     match ent:
@@ -1,26 +1,91 @@
 import typing as ty
+from collections import defaultdict
+
 from enre.ent.EntKind import RefKind
 from enre.ent.entity import Entity, Class, Module, EntLongname, ModuleAlias
 from enre.ref.Ref import Ref
 
 
+class _DefinedNames:
+    """Targets of the define references of an entity by their names, following the
+    reference list of the entity up to the count of indexed references."""
+
+    def __init__(self, refs: ty.List[Ref]) -> None:
+        self.refs = refs
+        self.count = 0
+        self.targets: ty.Dict[str, ty.List[Entity]] = defaultdict(list)
+
+    def update(self) -> None:
+        refs = self.refs
+        for index in range(self.count, len(refs)):
+            ref = refs[index]
+            if ref.ref_kind == RefKind.DefineKind:
+                self.targets[ref.target_ent.longname.name].append(ref.target_ent)
+        self.count = len(refs)
+
+
 class DepDB:
+    """Entities of a module or of the global scope.
+
+    Entities are indexed by long name, the define references of an entity are indexed
+    by the name of the target when the entity is first looked up. Entities appended to
+    `ents` and references added to entities after they are indexed are indexed at the
+    next lookup, assigning `ents` or replacing the references of an entity rebuilds
+    the index.
+    """
+
     def __init__(self) -> None:
-        self.ents: ty.List[Entity] = []
+        self._ents: ty.List[Entity] = []
+        self._longname_index: ty.Dict[EntLongname, ty.List[Entity]] = defaultdict(list)
+        # count of entities of self._ents in the long name index
+        self._indexed_count = 0
+        self._defined_names: ty.Dict[int, _DefinedNames] = dict()
+
+    def __getstate__(self) -> ty.Dict[str, ty.Any]:
+        # indexes are keyed by ids of entities, they are rebuilt after loading
+        return {"_ents": self._ents}
+
+    def __setstate__(self, state: ty.Dict[str, ty.Any]) -> None:
+        self.ents = state["_ents"]
+
+    @property
+    def ents(self) -> ty.List[Entity]:
+        return self._ents
+
+    @ents.setter
+    def ents(self, ents: ty.List[Entity]) -> None:
+        self._ents = ents
+        self._longname_index = defaultdict(list)
+        self._indexed_count = 0
+        self._defined_names = dict()
 
     def add_ent(self, ent: Entity) -> None:
-        self.ents.append(ent)
+        self._ents.append(ent)
 
+    def _update_longname_index(self) -> None:
+        ents = self._ents
+        for index in range(self._indexed_count, len(ents)):
+            ent = ents[index]
+            self._longname_index[ent.longname].append(ent)
+        self._indexed_count = len(ents)
+
+    def get_ents_by_longname(self, longname: EntLongname) -> ty.List[Entity]:
+        self._update_longname_index()
+        return list(self._longname_index.get(longname, []))
+
+    def _get_defined_names(self, ent: Entity) -> _DefinedNames:
+        refs = ent.refs()
+        defined_names = self._defined_names.get(id(ent))
+        if defined_names is None or defined_names.refs is not refs:
+            defined_names = self._defined_names[id(ent)] = _DefinedNames(refs)
+        defined_names.update()
+        return defined_names
 
     def _get_define_entities(self, ent_longname: EntLongname, ent_name: str) -> ty.List[Entity]:
         ret: ty.List[Entity] = []
-        for ent_1 in self.ents:
-            if ent_1.longname == ent_longname:
-                refs = ent_1.refs()
-                for ref in refs:
-                    if ref.ref_kind == RefKind.DefineKind and ref.target_ent.longname.name == ent_name:
-                        ret.append(ref.target_ent)
-
+        self._update_longname_index()
+        for ent_1 in self._longname_index.get(ent_longname, []):
+            ret.extend(self._get_defined_names(ent_1).targets.get(ent_name, []))
         return ret
 
     def get_class_attributes(self, ent: Class, attribute: str) -> ty.List[Entity]:
@@ -33,6 +98,16 @@ class DepDB:
 
     def remove(self, target: Entity) -> None:
         try:
-            self.ents.remove(target)
+            index = self._ents.index(target)
         except ValueError:
-            pass
+            return
+        removed = self._ents.pop(index)
+        if index < self._indexed_count:
+            self._indexed_count -= 1
+            same_longname = self._longname_index[removed.longname]
+            for position, ent in enumerate(same_longname):
+                if ent is removed:
+                    del same_longname[position]
+                    break
+            if not any(ent is removed for ent in same_longname):
+                self._defined_names.pop(id(removed), None)
@@ -0,0 +1,136 @@
+import typing as ty
+from array import array
+
+from enre.analysis.analyze_manager import RootDB
+from enre.ent.EntKind import RefKind
+from enre.ent.entity import Entity
+
+# codes of reference kinds in the kind column
+RefKindCodes: ty.List[RefKind] = list(RefKind)
+_RefKindCode: ty.Dict[RefKind, int] = {kind: code for code, kind in enumerate(RefKindCodes)}
+
+InTypeContextFlag = 1
+
+
+class ColumnarDepGraph:
+    """The finished dependency graph in parallel arrays.
+
+    Every entity reachable from the databases has an index into `ents`. Edges are the
+    references of the entities grouped by their source entity, edge `i` goes from
+    `ents[src[i]]` to `ents[dest[i]]`. `out_offsets` is the CSR index of the edges of
+    an entity: the edges of entity `e` are `out_offsets[e]` to `out_offsets[e + 1]`.
+    `in_offsets` and `in_edges` index the edges by their target the same way. Resolved
+    targets of edge `i` are `resolved[resolved_offsets[i]:resolved_offsets[i + 1]]`.
+
+    `occurrences` lists the entities in the order of the databases, an entity added to
+    more than one database occurs more than once, as it does in the reports.
+    """
+
+    def __init__(self) -> None:
+        self.ents: ty.List[Entity] = []
+        self.ent_index: ty.Dict[int, int] = dict()
+        self.occurrences = array("l")
+        self.src = array("l")
+        self.dest = array("l")
+        self.kind = array("B")
+        self.lineno = array("l")
+        self.col_offset = array("l")
+        self.flags = array("B")
+        self.resolved_offsets = array("l", [0])
+        self.resolved = array("l")
+        self.out_offsets = array("l")
+        self.in_offsets = array("l")
+        self.in_edges = array("l")
+
+    def index_of(self, ent: Entity) -> int:
+        index = self.ent_index.get(id(ent))
+        if index is None:
+            index = self.ent_index[id(ent)] = len(self.ents)
+            self.ents.append(ent)
+        return index
+
+    @classmethod
+    def from_package_db(cls, package_db: RootDB, release_refs: bool = False) -> "ColumnarDepGraph":
+        """
+        Copy the references of all entities of the databases into a graph, called after
+        the passes changing references.
+
+        :param release_refs: replace the references of every entity by an empty list after
+            they are copied, the graph is then the only copy of the dependencies
+        """
+        graph = ColumnarDepGraph()
+        ent_lists = [module_db.dep_db.ents for module_db in package_db.tree.values()]
+        ent_lists.append(package_db.global_db.ents)
+        # entities of the databases are numbered before targets, edges are appended in the order of sources
+        for ents in ent_lists:
+            for ent in ents:
+                graph.occurrences.append(graph.index_of(ent))
+        out_offsets = array("l", [0])
+        for ents in ent_lists:
+            for ent in ents:
+                src = graph.ent_index[id(ent)]
+                if src == len(out_offsets) - 1:
+                    graph._add_edges(src, ent)
+                    out_offsets.append(len(graph.src))
+                    if release_refs:
+                        ent.set_refs([])
+            package_db.checkpoint()
+        # targets which are not in any database have no edges
+        out_offsets.extend([len(graph.src)] * (len(graph.ents) + 1 - len(out_offsets)))
+        graph.out_offsets = out_offsets
+        graph._build_in_index()
+        return graph
+
+    def _add_edges(self, src: int, ent: Entity) -> None:
+        for ref in ent.refs():
+            self.src.append(src)
+            self.dest.append(self.index_of(ref.target_ent))
+            self.kind.append(_RefKindCode[ref.ref_kind])
+            self.lineno.append(ref.lineno)
+            self.col_offset.append(ref.col_offset)
+            self.flags.append(InTypeContextFlag if ref.in_type_ctx else 0)
+            for target in ref.resolved_targets:
+                self.resolved.append(self.index_of(target))
+            self.resolved_offsets.append(len(self.resolved))
+
+    def _build_in_index(self) -> None:
+        # counting sort of the edges by their targets
+        in_offsets = array("l", [0]) * (len(self.ents) + 1)
+        for dest in self.dest:
+            in_offsets[dest + 1] += 1
+        for index in range(len(self.ents)):
+            in_offsets[index + 1] += in_offsets[index]
+        positions = in_offsets[:-1]
+        in_edges = array("l", [0]) * len(self.dest)
+        for edge, dest in enumerate(self.dest):
+            in_edges[positions[dest]] = edge
+            positions[dest] += 1
+        self.in_offsets = in_offsets
+        self.in_edges = in_edges
+
+    def out_edges(self, index: int) -> range:
+        return range(self.out_offsets[index], self.out_offsets[index + 1])
+
+    def in_edges_of(self, index: int) -> "array[int]":
+        return self.in_edges[self.in_offsets[index]:self.in_offsets[index + 1]]
+
+    def ref_kind(self, edge: int) -> RefKind:
+        return RefKindCodes[self.kind[edge]]
+
+    def in_type_ctx(self, edge: int) -> bool:
+        return bool(self.flags[edge] & InTypeContextFlag)
+
+    def resolved_targets(self, edge: int) -> "array[int]":
+        return self.resolved[self.resolved_offsets[edge]:self.resolved_offsets[edge + 1]]
+
+    def edges_of_kind(self, kind: RefKind) -> ty.List[int]:
+        code = _RefKindCode[kind]
+        return [edge for edge, edge_kind in enumerate(self.kind) if edge_kind == code]
+
+    def nbytes(self) -> int:
+        """
+        :return: bytes of the arrays of the graph, not counting the entities
+        """
+        columns = [self.occurrences, self.src, self.dest, self.kind, self.lineno, self.col_offset, self.flags,
+                   self.resolved_offsets, self.resolved, self.out_offsets, self.in_offsets, self.in_edges]
+        return sum(column.itemsize * len(column) for column in columns)
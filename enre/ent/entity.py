@@ -1,5 +1,6 @@
 import ast
 import typing
+import weakref
 from abc import abstractmethod, ABC
 from collections import defaultdict
 from dataclasses import dataclass
@@ -16,31 +17,91 @@ if typing.TYPE_CHECKING:
 _EntityID = 0
 
 
+def next_entity_id() -> int:
+    return _EntityID
+
+
+def reserve_entity_ids(next_id: int) -> None:
+    """
+    Make sure entities created later never reuse ids below next_id, entities
+    loaded from a pickled database keep their ids.
+    """
+    global _EntityID
+    _EntityID = max(_EntityID, next_id)
+
+
+def assign_entity_ids(ents: typing.Iterable["Entity"], first_id: int) -> None:
+    """
+    Number the entities consecutively from first_id, used for entities created
+    in another process whose ids may collide with the ids of this process.
+    """
+    next_id = first_id
+    for ent in ents:
+        ent._id = next_id
+        next_id += 1
+    reserve_entity_ids(next_id)
+
+
+def renumber_entities(new_ids: typing.Iterable[typing.Tuple["Entity", int]], reserve: bool = True) -> None:
+    """
+    Give each entity the paired id, used for entities loaded from a snapshot taken
+    by another run.
+
+    :param reserve: make sure entities created later never reuse the given ids
+    """
+    next_id = 0
+    for ent, ent_id in new_ids:
+        ent._id = ent_id
+        next_id = max(next_id, ent_id + 1)
+    if reserve:
+        reserve_entity_ids(next_id)
+
+
 class EntLongname:
+    """Dotted long name of an entity, interned by its parts.
+
+    Creating a long name from the parts of an existing one returns the existing object,
+    so long names are compared by identity and the joined string and its hash are
+    computed once. Unpickled long names are interned again. The table doesn't keep long
+    names alive, so long running processes don't keep every name they have seen.
+    """
+    __slots__ = ("_scope", "_longname", "_hash", "__weakref__")
+    _scope: Tuple[str, ...]
+    _longname: str
+    _hash: int
+
+    _interned: "weakref.WeakValueDictionary[Tuple[str, ...], EntLongname]" = weakref.WeakValueDictionary()
+
+    def __new__(cls, scope: typing.Sequence[str]) -> "EntLongname":
+        key = tuple(scope)
+        interned = cls._interned.get(key)
+        if interned is None:
+            interned = super().__new__(cls)
+            interned._scope = key
+            interned._longname = '.'.join(key)
+            interned._hash = hash(interned._longname)
+            cls._interned[key] = interned
+        return interned
+
     @property
     def longname(self) -> str:
-        return '.'.join(self._scope)
+        return self._longname
 
     @property
     def name(self) -> str:
         return self._scope[-1]
 
-    def __init__(self, scope: List[str]):
-        self._scope = scope
-
     def __eq__(self, other: object) -> bool:
-        if isinstance(other, EntLongname) and len(other._scope) == len(self._scope):
-            for lhs, rhs in zip(self._scope, other._scope):
-                if lhs != rhs:
-                    return False
-            return True
-        return False
+        return self is other
 
     def __hash__(self) -> int:
-        return hash(self.longname)
+        return self._hash
+
+    def __reduce__(self) -> Tuple[type, Tuple[Tuple[str, ...]]]:
+        return EntLongname, (self._scope,)
 
 
-@dataclass
+@dataclass(slots=True)
 class Span:
     start_line: int
     end_line: int
@@ -82,6 +143,8 @@ _Default_Empty_Path = Path()
 
 
 class Location:
+    __slots__ = ("_scope", "_span", "_file_path")
+
     def append(self, name: str, new_span: Span, new_path: Optional[Path]) -> "Location":
         if new_path is None:
             new_path = self._file_path
@@ -128,8 +191,60 @@ class Syntactic(ABC):
         ...
 
 
+class SpilledRefs(List["Ref"]):
+    """Stands for references written to disk, calling `load` puts them back to their entities."""
+
+    def __init__(self, load: Callable[[], None]) -> None:
+        super().__init__()
+        self.load = load
+
+
+# entities with fewer references look for a duplicated reference by comparing all of them
+_RefIndexThreshold = 8
+
+_RefKey: TypeAlias = Tuple[RefKind, int, int]
+
+
+class RefIndex:
+    """References of an entity by their kind and position.
+
+    Equal references have the same kind, line and column, a new reference is only
+    compared with the references in its bucket. A bucket holds the reference itself
+    until a second reference shares its position. The index follows the reference
+    list by the count of indexed references, references appended to the list since
+    the last lookup are indexed first.
+    """
+    __slots__ = ("buckets", "count")
+
+    def __init__(self) -> None:
+        self.buckets: Dict[_RefKey, typing.Union["Ref", List["Ref"]]] = dict()
+        self.count = 0
+
+    def contains(self, refs: List["Ref"], ref: "Ref") -> bool:
+        buckets = self.buckets
+        for index in range(self.count, len(refs)):
+            indexed = refs[index]
+            indexed_key = (indexed.ref_kind, indexed.lineno, indexed.col_offset)
+            bucket = buckets.get(indexed_key)
+            if bucket is None:
+                buckets[indexed_key] = indexed
+            elif isinstance(bucket, list):
+                bucket.append(indexed)
+            else:
+                buckets[indexed_key] = [bucket, indexed]
+        self.count = len(refs)
+        bucket = buckets.get((ref.ref_kind, ref.lineno, ref.col_offset))
+        if bucket is None:
+            return False
+        elif isinstance(bucket, list):
+            return ref in bucket
+        return bucket == ref
+
+
 # Entity is the abstract domain of the Abstract Interpreter
 class Entity(ABC):
+    # millions of entities are alive at once, slots leave out the instance dictionary
+    __slots__ = ("_id", "_refs", "_ref_index", "longname", "location")
 
     def __init__(self, longname: EntLongname, location: Location):
         global _EntityID
@@ -137,14 +252,35 @@ class Entity(ABC):
         # make sure the id is unique
         _EntityID += 1
         self._refs: List["Ref"] = []
+        self._ref_index: Optional[RefIndex] = None
         self.longname = longname
         self.location = location
 
     def refs(self) -> List["Ref"]:
+        if type(self._refs) is SpilledRefs:
+            self._refs.load()
         return self._refs
 
     def set_refs(self, refs: List["Ref"]) -> None:
         self._refs = refs
+        self._ref_index = None
+
+    def spill_refs(self, spilled: SpilledRefs) -> Optional[List["Ref"]]:
+        """
+        Replace the references by the marker of a spill without loading them.
+
+        :return: the replaced references, None if there's nothing to spill
+        """
+        if not self._refs or type(self._refs) is SpilledRefs:
+            return None
+        refs = self._refs
+        self._refs = spilled
+        self._ref_index = None
+        return refs
+
+    def restore_refs(self, spilled: SpilledRefs, refs: List["Ref"]) -> None:
+        if self._refs is spilled:
+            self._refs = refs
 
     @property
     def id(self) -> int:
@@ -156,8 +292,16 @@ class Entity(ABC):
 
     def add_ref(self, ref: "Ref") -> None:
         # todo: should we remove reference with same representation?
-        if ref not in self._refs:
-            self._refs.append(ref)
+        refs = self.refs()
+        if len(refs) < _RefIndexThreshold:
+            if ref not in refs:
+                refs.append(ref)
+            return
+        ref_index = self._ref_index
+        if ref_index is None or ref_index.count > len(refs):
+            ref_index = self._ref_index = RefIndex()
+        if not ref_index.contains(refs, ref):
+            refs.append(ref)
 
     def __eq__(self, other: object) -> bool:
         if isinstance(other, self.__class__):
@@ -173,6 +317,8 @@ class Entity(ABC):
 
 
 class NameSpaceEntity:
+    __slots__ = ()
+
     @property
     @abstractmethod
     def names(self) -> "NamespaceType":
@@ -180,6 +326,8 @@ class NameSpaceEntity:
 
 
 class ScopedEntity:
+    __slots__ = ()
+
     @abstractmethod
     def get_scope(self) -> Entity:
         ...
@@ -195,6 +343,8 @@ NamespaceType: TypeAlias = Dict[str, List[Entity]]
 
 
 class Variable(Entity, ScopedEntity):
+    __slots__ = ("scope",)
+
     def __init__(self, scope: Entity, longname: EntLongname, location: Location):
         self.scope = scope
         super().__init__(longname, location)
@@ -207,6 +357,8 @@ class Variable(Entity, ScopedEntity):
 
 
 class Function(Entity):
+    __slots__ = ("abstract_kind", "static_kind", "readonly_property_name")
+
     def __init__(self, longname: EntLongname, location: Location):
         super(Function, self).__init__(longname, location)
         self.abstract_kind: Optional[FunctionKind] = None
@@ -218,6 +370,8 @@ class Function(Entity):
 
 
 class LambdaFunction(Function):
+    __slots__ = ()
+
     def __init__(self, longname: EntLongname, location: Location):
         super(LambdaFunction, self).__init__(longname, location)
 
@@ -226,6 +380,8 @@ class LambdaFunction(Function):
 
 
 class Package(Entity, NameSpaceEntity):
+    __slots__ = ("_names", "package_path")
+
     def __init__(self, file_path: Path):
         import os
         path = os.path.normpath(str(file_path))
@@ -250,6 +406,8 @@ class Package(Entity, NameSpaceEntity):
 
 
 class Module(Entity, NameSpaceEntity):
+    __slots__ = ("module_path", "_names")
+
     def __init__(self, file_path: Path, hard_longname: Optional[List[str]] = None):
         # file_path: relative path to root directory's parent
         import os
@@ -282,6 +440,8 @@ class Module(Entity, NameSpaceEntity):
 
 
 class BuiltinModule(Entity, NameSpaceEntity):
+    __slots__ = ("module_path", "_names")
+
     def __init__(self, file_path: Path):
         # file_path: relative path to root directory's parent
         path_list = ["builtins"]
@@ -316,6 +476,8 @@ class BuiltinModule(Entity, NameSpaceEntity):
 
 
 class ModuleAlias(Entity):
+    __slots__ = ("module_ent", "module_path", "alias_name")
+
     def __init__(self, module_ent: Module, alias_location: Location):
         self.module_ent = module_ent
         self.module_path = module_ent.module_path
@@ -336,6 +498,8 @@ class ModuleAlias(Entity):
 
 
 class PackageAlias(Entity):
+    __slots__ = ("package_ent", "module_path", "alias_name")
+
     def __init__(self, package_ent: Package, alias_location: Location):
         super(PackageAlias, self).__init__(alias_location.to_longname(), alias_location)
         self.package_ent = package_ent
@@ -356,6 +520,8 @@ class PackageAlias(Entity):
 
 
 class Alias(Entity):
+    __slots__ = ("possible_target_ent",)
+
     def __init__(self, longname: EntLongname, location: Location, ents: List[Entity]) -> None:
         super(Alias, self).__init__(longname, location)
         self.possible_target_ent = ents
@@ -377,7 +543,28 @@ class Alias(Entity):
             self.add_ref(Ref(RefKind.AliasTo, ent, alias_span.start_line, alias_span.end_line, False, None))
 
 
+class _ClassCacheToken:
+    """Marks caches of classes built since names or bases were last changed without add_ref."""
+    __slots__ = ()
+
+
+_class_cache_token = _ClassCacheToken()
+
+
+def invalidate_class_caches() -> None:
+    """
+    Drop the cached MROs and attributes of all classes, called after names or bases of
+    classes are changed without `add_ref`. Caches of unpickled classes are never valid,
+    the pickled token is a new object.
+    """
+    global _class_cache_token
+    _class_cache_token = _ClassCacheToken()
+
+
 class Class(Entity, NameSpaceEntity):
+    __slots__ = ("_names", "_inherits", "abstract_info", "readonly_attribute", "private_attribute",
+                 "_mro", "_attributes", "_cache_token", "_subclasses")
+
     def __init__(self, longname: EntLongname, location: Location):
         super(Class, self).__init__(longname, location)
         self._names: Dict[str, List[Entity]] = defaultdict(list)
@@ -385,6 +572,12 @@ class Class(Entity, NameSpaceEntity):
         self.abstract_info: Optional[AbstractClassInfo] = None
         self.readonly_attribute: NamespaceType = defaultdict(list)
         self.private_attribute: NamespaceType = defaultdict(list)
+        self._mro: Optional[List["Class"]] = None
+        # attribute name to the bound entities found in the mro, an empty list if not found
+        self._attributes: Optional[Dict[str, List[Entity]]] = None
+        self._cache_token = _class_cache_token
+        # classes whose cached mro contains this class
+        self._subclasses: Dict[int, "Class"] = dict()
 
     def kind(self) -> EntKind:
         return EntKind.Class
@@ -398,22 +591,62 @@ class Class(Entity, NameSpaceEntity):
     def inherits(self) -> List["Class"]:
         return self._inherits
 
+    def get_mro(self) -> List["Class"]:
+        """
+        :return: the class and its bases depth first in the order of the bases, every
+            class once, attributes are looked up in this order
+        """
+        if self._cache_token is not _class_cache_token:
+            self._cache_token = _class_cache_token
+            self._mro = None
+            self._attributes = None
+        if self._mro is None:
+            mro: List[Class] = []
+            visited = set()
+            stack = [self]
+            while stack:
+                cls_ent = stack.pop()
+                if id(cls_ent) in visited:
+                    continue
+                visited.add(id(cls_ent))
+                mro.append(cls_ent)
+                stack.extend(reversed(cls_ent._inherits))
+            for base in mro[1:]:
+                base._subclasses[id(self)] = self
+            self._mro = mro
+        return self._mro
+
     def get_attribute(self, attr: str) -> List[Entity]:
-        current_class_attrs = self.names[attr]
-        if current_class_attrs:
-            return current_class_attrs
-        for cls_ent in self.inherits:
-            inherited_attrs = cls_ent.get_attribute(attr)
-            if inherited_attrs:
-                return inherited_attrs
-        return []
+        mro = self.get_mro()
+        attributes = self._attributes
+        if attributes is None:
+            attributes = self._attributes = dict()
+        found = attributes.get(attr)
+        if found is None:
+            found = []
+            for cls_ent in mro:
+                # looking up a class creates an empty entry in its names
+                cls_attrs = cls_ent.names[attr]
+                if cls_attrs:
+                    found = cls_attrs
+                    break
+            attributes[attr] = found
+        return found if found else []
+
+    def _invalidate_caches(self, mro: bool) -> None:
+        for cls_ent in [self, *self._subclasses.values()]:
+            cls_ent._attributes = None
+            if mro:
+                cls_ent._mro = None
 
     def add_ref(self, ref: "Ref") -> None:
         if ref.ref_kind == RefKind.DefineKind:
             self._names[ref.target_ent.longname.name].append(ref.target_ent)
+            self._invalidate_caches(mro=False)
         elif ref.ref_kind == RefKind.InheritKind:
             if isinstance(ref.target_ent, Class):
                 self._inherits.append(ref.target_ent)
+                self._invalidate_caches(mro=True)
         super(Class, self).add_ref(ref)
 
     def direct_type(self) -> "ValueInfo":
@@ -433,6 +666,8 @@ class Class(Entity, NameSpaceEntity):
 
 
 class UnknownVar(Entity):
+    __slots__ = ()
+
     _unknown_pool: Dict[str, "UnknownVar"] = dict()
 
     def __init__(self, name: str, loc: Optional[Location] = None):
@@ -443,6 +678,22 @@ class UnknownVar(Entity):
     def kind(self) -> EntKind:
         return EntKind.UnknownVar
 
+    @classmethod
+    def register_unknown_var(cls, unknown_var: "UnknownVar") -> None:
+        cls._unknown_pool.setdefault(unknown_var.longname.name, unknown_var)
+
+    @classmethod
+    def is_pooled_name(cls, name: str) -> bool:
+        return name in cls._unknown_pool
+
+    @classmethod
+    def is_pooled(cls, unknown_var: "UnknownVar") -> bool:
+        return cls._unknown_pool.get(unknown_var.longname.name) is unknown_var
+
+    @classmethod
+    def pooled_vars(cls) -> List["UnknownVar"]:
+        return list(cls._unknown_pool.values())
+
     @classmethod
     def get_unknown_var(cls, name: str) -> "UnknownVar":
         if name in cls._unknown_pool.keys():
@@ -454,6 +705,8 @@ class UnknownVar(Entity):
 
 
 class UnknownModule(Module):
+    __slots__ = ()
+
     def __init__(self, name: str):
         super(UnknownModule, self).__init__(Path(f"{name}.py"))
 
@@ -462,6 +715,8 @@ class UnknownModule(Module):
 
 
 class Parameter(Entity, ScopedEntity):
+    __slots__ = ("scope",)
+
     def __init__(self, scope: Entity, longname: EntLongname, location: Location):
         self.scope = scope
         super(Parameter, self).__init__(longname, location)
@@ -474,6 +729,8 @@ class Parameter(Entity, ScopedEntity):
 
 
 class LambdaParameter(Parameter):
+    __slots__ = ()
+
     def __init__(self, scope: Entity, longname: EntLongname, location: Location):
         super(LambdaParameter, self).__init__(scope, longname, location)
 
@@ -482,6 +739,8 @@ class LambdaParameter(Parameter):
 
 
 class Anonymous(Entity):
+    __slots__ = ()
+
     def __init__(self) -> None:
         super(Anonymous, self).__init__(EntLongname([""]), Location())
 
@@ -490,6 +749,8 @@ class Anonymous(Entity):
 
 
 class ClassAttribute(Entity):
+    __slots__ = ("class_ent",)
+
     def __init__(self, class_ent: Class, longname: EntLongname, location: Location):
         self.class_ent: Class = class_ent
         super(ClassAttribute, self).__init__(longname, location)
@@ -499,6 +760,8 @@ class ClassAttribute(Entity):
 
 
 class ReferencedAttribute(Entity):
+    __slots__ = ()
+
     def __init__(self, longname: EntLongname, location: Location):
         super(ReferencedAttribute, self).__init__(longname, location)
 
@@ -507,6 +770,8 @@ class ReferencedAttribute(Entity):
 
 
 class AmbiguousAttribute(Entity):
+    __slots__ = ()
+
     def __init__(self, name: str):
         super(AmbiguousAttribute, self).__init__(EntLongname([name]), Location())
 
@@ -515,6 +780,8 @@ class AmbiguousAttribute(Entity):
 
 
 class UnresolvedAttribute(Entity):
+    __slots__ = ("receiver_type",)
+
     def __init__(self, longname: EntLongname, location: Location, receiver_type: "ValueInfo") -> None:
         self.receiver_type = receiver_type
         super(UnresolvedAttribute, self).__init__(longname, location)
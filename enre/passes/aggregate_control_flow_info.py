@@ -46,6 +46,8 @@ def aggregate_cfg_info(root_db: "RootDB", resolver: "Resolver") -> None:
                         assert isinstance(summary, ClassSummary)
                         ref.resolved_targets.update(map_resolved_objs(summary.get_object().inherits))
 
+                if not root_db.projection.builds(RefKind.CallKind):
+                    continue
                 for invoke in summary.get_invokes():
                     if not invoke.expr in aggregated_expr:
                         invoke_targets = resolver.get_store_able_value(invoke.target, summary.get_namespace())
@@ -61,3 +63,4 @@ def aggregate_cfg_info(root_db: "RootDB", resolver: "Resolver") -> None:
                             ent.add_ref(
                                 Ref(RefKind.CallKind, target_func, invoke_expr.lineno, invoke_expr.col_offset, False, invoke_expr,
                                     set()))
+        root_db.checkpoint()
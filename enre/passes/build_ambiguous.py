@@ -23,7 +23,8 @@ class BuildAmbiguous(DepDBPass):
         return self._package_db
 
     def execute_pass(self) -> None:
-        self._build_ambiguous_attributes()
+        if self.package_db.projection.builds_ambiguous_attributes():
+            self._build_ambiguous_attributes()
 
     def build_attr_map(self) -> Dict[str, List[Entity]]:
         """
@@ -59,6 +60,7 @@ class BuildAmbiguous(DepDBPass):
             for ent in module_db.dep_db.ents:
                 for ref in ent.refs():
                     self.rebuild_ref(ent, ref, attr_map, ambiguous_ent_dict)
+            self.package_db.checkpoint()
 
     def _build_ambiguous_attributes(self) -> None:
         attr_map = self.build_attr_map()
@@ -72,6 +74,8 @@ class BuildAmbiguous(DepDBPass):
             ambiguous_ent = AmbiguousAttribute(name)
             ambiguous_ents_dict[name] = ambiguous_ent
             self._package_db.global_db.add_ent(ambiguous_ent)
+            if not self._package_db.projection.builds(RefKind.HasambiguousKind):
+                continue
             for tar_ent in ents:
                 tar_ent.add_ref(Ref(RefKind.HasambiguousKind, ambiguous_ent, -1, -1, False, None))
         return ambiguous_ents_dict
@@ -106,14 +110,21 @@ class BuildAmbiguous(DepDBPass):
             return
         attr_name = target_ent.longname.name
         ambiguous_ent = ambiguous_ent_dict[attr_name]
+        # the reference may only be created for the unresolved attribute
+        builds_ref = self.package_db.projection.builds(ref.ref_kind)
         if ambiguous_ent is not None:
+            if not builds_ref:
+                return
             ent.add_ref(Ref(ref.ref_kind, ambiguous_ent, ref.lineno, ref.col_offset, ref.in_type_ctx, ref.expr))
             return
         elif definite_attr := definite_attr_dict[attr_name]:
+            if not builds_ref:
+                return
             for attr_ent in definite_attr:
                 ent.add_ref(Ref(ref.ref_kind, attr_ent, ref.lineno, ref.col_offset, ref.in_type_ctx, ref.expr))
         else:
             # referenced attribute is an unresolved attribute
             unresolved = UnresolvedAttribute(target_ent.longname, target_ent.location, ValueInfo.get_any())
             self.package_db.add_ent_global(unresolved)
-            ent.add_ref(Ref(ref.ref_kind, unresolved, ref.lineno, ref.col_offset, ref.in_type_ctx, ref.expr))
+            if builds_ref:
+                ent.add_ref(Ref(ref.ref_kind, unresolved, ref.lineno, ref.col_offset, ref.in_type_ctx, ref.expr))
@@ -38,7 +38,7 @@ class BuildVisibility:
                                 ent.private_attribute[name].append(entity)
 
                     # todo: 目前对于内部类的继承通过_refs分析，完成之后注释掉这个for，取消注释下面for循环的第一个if
-                    for ref in ent._refs:
+                    for ref in ent.refs():
                         if ref.ref_kind == RefKind.InheritKind:
                             if ref.target_ent.longname.name == 'ABC':
                                 abstract_info.inherit = "ABC"
@@ -59,3 +59,4 @@ class BuildVisibility:
                                         flag = True
 
                     ent.abstract_info = abstract_info if flag else None
+            self._package_db.checkpoint()
@@ -0,0 +1,112 @@
+import hashlib
+import typing as ty
+from collections import defaultdict
+
+from enre.analysis.analyze_manager import RootDB
+from enre.ent.entity import Entity, renumber_entities
+
+# ids stay exact integers in json readers using doubles
+StableIdBits = 53
+
+
+def stable_key(ent: Entity) -> str:
+    location = ent.location
+    span = location.code_span
+    file_path = location.file_path.as_posix()
+    return f"{ent.kind().value}\0{ent.longname.longname}\0{file_path}\0" \
+           f"{span.start_line}:{span.start_col}-{span.end_line}:{span.end_col}"
+
+
+def stable_id(key: str, attempt: int = 0) -> int:
+    if attempt:
+        key = f"{key}\0{attempt}"
+    digest = hashlib.blake2b(key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") & ((1 << StableIdBits) - 1)
+
+
+def _reachable_entities(root_db: RootDB) -> ty.List[Entity]:
+    ents: ty.Dict[int, Entity] = dict()
+
+    def add(ent: Entity) -> None:
+        ents.setdefault(id(ent), ent)
+
+    for module_db in root_db.tree.values():
+        for ent in module_db.dep_db.ents:
+            add(ent)
+    for ent in root_db.global_db.ents:
+        add(ent)
+    for ent in list(ents.values()):
+        for ref in ent.refs():
+            add(ref.target_ent)
+            for resolved in ref.resolved_targets:
+                add(resolved)
+    return list(ents.values())
+
+
+def _disambiguated_keys(ents: ty.List[Entity]) -> ty.List[str]:
+    """
+    Keys of the entities, entities sharing a key, like unresolved attributes which have no
+    location, get the digest of their references from and to other entities added, described
+    by the keys of these entities, so they are told apart by content instead of analysis order.
+    """
+    keys = [stable_key(ent) for ent in ents]
+    counts: ty.Dict[str, int] = defaultdict(int)
+    for key in keys:
+        counts[key] += 1
+    shared = {id(ent): index for index, ent in enumerate(ents) if counts[keys[index]] > 1}
+    if not shared:
+        return keys
+    key_of = {id(ent): key for ent, key in zip(ents, keys)}
+    neighbours: ty.Dict[int, ty.List[str]] = defaultdict(list)
+    for index, ent in enumerate(ents):
+        for ref in ent.refs():
+            target_key = key_of.get(id(ref.target_ent)) or stable_key(ref.target_ent)
+            location = f"{ref.ref_kind.value}\0{ref.lineno}:{ref.col_offset}"
+            if id(ent) in shared:
+                neighbours[id(ent)].append(f"out\0{location}\0{target_key}")
+            if id(ref.target_ent) in shared:
+                neighbours[id(ref.target_ent)].append(f"in\0{location}\0{keys[index]}")
+    for ent_id, index in shared.items():
+        hasher = hashlib.blake2b(digest_size=8)
+        for neighbour in sorted(neighbours[ent_id]):
+            hasher.update(neighbour.encode())
+            hasher.update(b"\n")
+        keys[index] = f"{keys[index]}\0{hasher.hexdigest()}"
+    return keys
+
+
+def assign_stable_ids(root_db: RootDB) -> int:
+    """
+    Replace the ids of all entities with ids derived from their kind, long name, file
+    and span, so an entity keeps its id across runs no matter the order of analysis.
+
+    Entities with the same kind, long name, file and span are told apart by their
+    references. Entities are numbered in the order of their keys, an entity whose id is
+    taken hashes its key again with a counter, so colliding entities are numbered the same
+    in every run analyzing the same entities. Only entities whose keys and references are
+    all the same are numbered in the order of analysis, swapping them doesn't change the report.
+
+    :return: count of entities whose first id collided
+    """
+    ents = _reachable_entities(root_db)
+    keyed = sorted(((key, index) for index, key in enumerate(_disambiguated_keys(ents))))
+    used: ty.Set[int] = set()
+    new_ids: ty.List[ty.Tuple[Entity, int]] = []
+    collisions = 0
+    for key, index in keyed:
+        attempt = 0
+        ent_id = stable_id(key)
+        while ent_id in used:
+            attempt += 1
+            ent_id = stable_id(key, attempt)
+        if attempt:
+            collisions += 1
+        used.add(ent_id)
+        new_ids.append((ents[index], ent_id))
+    added_ents = {module_db: [ent for ent in module_db.dep_db.ents if ent.id in module_db.ent_id_set]
+                  for module_db in root_db.tree.values()}
+    # stable ids are far above the ids of the counter, created entities keep using it
+    renumber_entities(new_ids, reserve=False)
+    for module_db, module_ents in added_ents.items():
+        module_db.ent_id_set = {ent.id for ent in module_ents}
+    return collisions
@@ -7,7 +7,7 @@ from enre.ent.EntKind import RefKind
 from enre.ent.entity import Entity
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class Ref(ABC):
     ref_kind: RefKind
     target_ent: Entity
@@ -0,0 +1,244 @@
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+import typing as ty
+from collections import defaultdict
+from pathlib import Path
+
+from enre.analysis.analyze_manager import AnalyzeManager, DiscoveryFilter
+from enre.analysis.builtins_cache import BuiltinsCache
+from enre.analysis.incremental import IncrementalState
+from enre.analysis.parse_cache import ParseCache
+from enre.cfg.Resolver import Resolver
+from enre.ent.EntKind import RefKind
+from enre.ent.entity import Entity
+from enre.passes.aggregate_control_flow_info import aggregate_cfg_info
+from enre.ref.Ref import Ref
+
+logger = logging.getLogger(__name__)
+
+JsonDict = ty.Dict[str, ty.Any]
+
+
+def remove_stale_socket(socket_path: Path) -> None:
+    """
+    Remove the socket left at the path by a daemon which is no longer running.
+
+    :raise FileExistsError: if the path is not a socket, or a daemon is listening on it
+    """
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{socket_path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        try:
+            client.connect(str(socket_path))
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    raise FileExistsError(f"another daemon is listening on {socket_path}")
+
+
+class DependencyIndex:
+    """Lookup tables over an analyzed project used to answer queries."""
+
+    def __init__(self, manager: AnalyzeManager) -> None:
+        self.ents_by_longname: ty.Dict[str, ty.List[Entity]] = defaultdict(list)
+        self.module_of: ty.Dict[int, str] = dict()
+        # target entity id to the source entities and references pointing to it
+        self.incoming: ty.Dict[int, ty.List[ty.Tuple[Entity, Ref]]] = defaultdict(list)
+        self.module_ents: ty.Dict[str, ty.List[Entity]] = defaultdict(list)
+        root_db = manager.root_db
+        for module_db in root_db.tree.values():
+            module_name = module_db.module_ent.longname.longname
+            for ent in module_db.dep_db.ents:
+                self.module_of.setdefault(ent.id, module_name)
+                self.module_ents[module_name].append(ent)
+                self._add_ent(ent)
+        for ent in root_db.global_db.ents:
+            self._add_ent(ent)
+
+    def _add_ent(self, ent: Entity) -> None:
+        self.ents_by_longname[ent.longname.longname].append(ent)
+        for ref in ent.refs():
+            self.incoming[ref.target_ent.id].append((ent, ref))
+            for resolved in ref.resolved_targets:
+                if resolved.id != ref.target_ent.id:
+                    self.incoming[resolved.id].append((ent, ref))
+
+    def entity_repr(self, ent: Entity) -> JsonDict:
+        return {"id": ent.id,
+                "longname": ent.longname.longname,
+                "kind": ent.kind().value,
+                "file": str(ent.location.file_path).replace("\\", "/"),
+                "line": ent.location.code_span.start_line}
+
+    def ref_repr(self, src: Entity, ref: Ref, target: Entity) -> JsonDict:
+        return {"src": self.entity_repr(src),
+                "dest": self.entity_repr(target),
+                "kind": ref.ref_kind.value,
+                "lineno": ref.lineno,
+                "col_offset": ref.col_offset}
+
+    def callers(self, longname: str) -> ty.List[JsonDict]:
+        ret = []
+        for target in self.ents_by_longname.get(longname, []):
+            for src, ref in self.incoming.get(target.id, []):
+                if ref.ref_kind == RefKind.CallKind:
+                    ret.append(self.ref_repr(src, ref, target))
+        return ret
+
+    def callees(self, longname: str) -> ty.List[JsonDict]:
+        ret = []
+        for src in self.ents_by_longname.get(longname, []):
+            for ref in src.refs():
+                if ref.ref_kind == RefKind.CallKind:
+                    for target in {ref.target_ent} | ref.resolved_targets:
+                        ret.append(self.ref_repr(src, ref, target))
+        return ret
+
+    def dependencies(self, module_name: str) -> ty.List[JsonDict]:
+        """
+        :return: references from entities of the module to entities outside the module
+        """
+        ret = []
+        for src in self.module_ents.get(module_name, []):
+            for ref in src.refs():
+                if self.module_of.get(ref.target_ent.id) != module_name:
+                    ret.append(self.ref_repr(src, ref, ref.target_ent))
+        return ret
+
+    def dependents(self, module_name: str) -> ty.List[JsonDict]:
+        """
+        :return: references from entities outside the module to entities of the module
+        """
+        ret = []
+        for target in self.module_ents.get(module_name, []):
+            for src, ref in self.incoming.get(target.id, []):
+                if self.module_of.get(src.id) != module_name:
+                    ret.append(self.ref_repr(src, ref, target))
+        return ret
+
+    def entities(self, longname: str) -> ty.List[JsonDict]:
+        return [self.entity_repr(ent) for ent in self.ents_by_longname.get(longname, [])]
+
+
+class AnalysisDaemon:
+    """Keep an analyzed project in memory and answer queries about it.
+
+    The analyzed project is kept by an in-memory `IncrementalState`, which reverts
+    the global passes before a refresh, so changed files only re-analyze the
+    affected modules.
+    Queries are JSON objects, one per line, with a `query` field:
+    `callers`, `callees` and `entities` take a `name` (entity longname),
+    `dependencies` and `dependents` take a `module` (module longname),
+    `refresh` re-analyzes changed files and `ping` checks the daemon is alive.
+    """
+
+    def __init__(self, root_path: Path, builtin_path: ty.Optional[Path], need_cfg: bool, jobs: int = 1,
+                 parse_cache: ty.Optional[ParseCache] = None,
+                 builtins_cache: ty.Optional[BuiltinsCache] = None,
+                 discovery: ty.Optional[DiscoveryFilter] = None) -> None:
+        self.root_path = root_path
+        self.builtin_path = builtin_path
+        self.need_cfg = need_cfg
+        self.jobs = jobs
+        self.parse_cache = parse_cache
+        self.builtins_cache = builtins_cache
+        self.discovery = discovery
+        self._state = IncrementalState(None)
+        self._lock = threading.RLock()
+        self.manager: AnalyzeManager
+        self.resolver: ty.Optional[Resolver] = None
+        self.index: DependencyIndex
+        self._analyze()
+
+    def _analyze(self) -> None:
+        manager = self._state.analyze(self.root_path, self.builtin_path, self.jobs, self.parse_cache,
+                                      self.builtins_cache, self.discovery)
+        resolver = None
+        if self.need_cfg:
+            resolver = Resolver(manager.scene)
+            resolver.resolve_all()
+            aggregate_cfg_info(manager.root_db, resolver)
+        self.manager = manager
+        self.resolver = resolver
+        self.index = DependencyIndex(manager)
+
+    def refresh(self) -> bool:
+        with self._lock:
+            if not self._state.is_outdated(self.manager):
+                return False
+            self._analyze()
+            return True
+
+    def handle(self, request: JsonDict) -> JsonDict:
+        query = request.get("query")
+        with self._lock:
+            index = self.index
+            match query:
+                case "ping":
+                    return {"ok": True}
+                case "refresh":
+                    return {"ok": True, "refreshed": self.refresh()}
+                case "callers":
+                    return {"ok": True, "result": index.callers(str(request.get("name")))}
+                case "callees":
+                    return {"ok": True, "result": index.callees(str(request.get("name")))}
+                case "dependencies":
+                    return {"ok": True, "result": index.dependencies(str(request.get("module")))}
+                case "dependents":
+                    return {"ok": True, "result": index.dependents(str(request.get("module")))}
+                case "entities":
+                    return {"ok": True, "result": index.entities(str(request.get("name")))}
+                case _:
+                    return {"ok": False, "error": f"unknown query {query}"}
+
+    def watch(self, interval: float, stopped: threading.Event) -> None:
+        while not stopped.wait(interval):
+            try:
+                self.refresh()
+            except Exception:
+                # queries are answered from the last index until a refresh succeeds,
+                # the project is analyzed again by the next refresh
+                logger.exception("re-analyzing changed files of %s failed", self.root_path)
+
+    def serve(self, socket_path: Path, watch_interval: float = 0) -> None:
+        """
+        :raise FileExistsError: if the path is not a socket, or a daemon is listening on it
+        """
+        daemon = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                for line in self.rfile:
+                    if not line.strip():
+                        continue
+                    try:
+                        request = json.loads(line)
+                        response = daemon.handle(request) if isinstance(request, dict) else \
+                            {"ok": False, "error": "request should be a json object"}
+                    except json.JSONDecodeError as e:
+                        response = {"ok": False, "error": f"invalid json: {e}"}
+                    except Exception as e:
+                        logger.exception("query %s failed", line.strip()[:200])
+                        response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+                    self.wfile.write(json.dumps(response).encode() + b"\n")
+                    self.wfile.flush()
+
+        remove_stale_socket(socket_path)
+        stopped = threading.Event()
+        if watch_interval > 0:
+            threading.Thread(target=self.watch, args=(watch_interval, stopped), daemon=True).start()
+        with socketserver.ThreadingUnixStreamServer(str(socket_path), Handler) as server:
+            try:
+                server.serve_forever()
+            finally:
+                stopped.set()
+                os.remove(socket_path)
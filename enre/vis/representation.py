@@ -1,11 +1,16 @@
+import json
+import shutil
+import tempfile
 from dataclasses import dataclass
 from enum import Enum
 from typing import Iterable
-from typing import List, TypedDict, Any, TypeAlias, Dict
+from typing import List, TypedDict, Any, TypeAlias, Dict, TextIO, Callable, Iterator
 
 from enre.analysis.analyze_manager import RootDB
 from enre.analysis.analyze_method import FunctionKind
-from enre.ent.EntKind import EntKind
+from enre.analysis.projection import Projection
+from enre.dep.columnar import ColumnarDepGraph
+from enre.ent.EntKind import EntKind, RefKind
 from enre.ent.entity import Entity, Class, Function
 
 EdgeTy = TypedDict("EdgeTy", {"src": int,
@@ -21,7 +26,12 @@ EdgeTy = TypedDict("EdgeTy", {"src": int,
 NodeTy = TypedDict("NodeTy", {"id": int, "longname": str, "ent_type": str, "file_path": str,
                               "start_line": int, "end_line": int, "start_col": int, "end_col": int})
 
-DepTy = TypedDict("DepTy", {"Entities": List[NodeTy], "Dependencies": List[EdgeTy]})
+_DepEntsTy = TypedDict("_DepEntsTy", {"Entities": List[NodeTy], "Dependencies": List[EdgeTy]})
+
+
+class DepTy(_DepEntsTy, total=False):
+    skippedFiles: List[Dict[str, Any]]
+
 
 Location = TypedDict("Location", {"startLine": int, "endLine": int, "startColumn": int, "endColumn": int})
 
@@ -60,11 +70,30 @@ class Edge:
 
 JsonDict: TypeAlias = Dict[str, Any]
 
+# entities written to reports neither as nodes nor as targets of edges
+helper_ent_types = [EntKind.ReferencedAttr, EntKind.Anonymous]
+
+# edges of a columnar graph turned into objects at a time while writing
+_ChunkEdges = 4096
+
+# the projection reporting every relation and entity
+_FullProjection = Projection()
+
+
+def reports_ent(ent: Entity, projection: Projection) -> bool:
+    kind = ent.kind()
+    return kind not in helper_ent_types and projection.keeps_entity(kind)
+
+
+def reports_ref(kind: RefKind, target_ent: Entity, projection: Projection) -> bool:
+    return projection.keeps_relation(kind) and reports_ent(target_ent, projection)
+
 
 class DepRepr:
     def __init__(self) -> None:
         self._node_list: List[Node] = []
         self._edge_list: List[Edge] = []
+        self._skipped_files: List[JsonDict] = []
 
     def add_node(self, n: Node) -> None:
         self._node_list.append(n)
@@ -75,33 +104,28 @@ class DepRepr:
     def to_json(self) -> DepTy:
         ret: DepTy = {"Entities": [], "Dependencies": []}
         for n in self._node_list:
-            ret["Entities"].append({"id": n.id, "longname": n.longname, "ent_type": n.ent_type,
-                                    "file_path": n.file_path,
-                                    "start_line": n.start_line, "end_line": n.end_line,
-                                    "start_col": n.start_col, "end_col": n.end_col})
+            ret["Entities"].append(node_json(n))
         for e in self._edge_list:
-            ret["Dependencies"].append({"src": e.src,
-                                        "src_name": e.src_name,
-                                        "dest": e.dest,
-                                        "dest_name": e.dest_name,
-                                        "kind": e.kind,
-                                        "lineno": e.lineno,
-                                        "col_offset": e.col_offset,
-                                        "in_type_context": e.in_type_ctx})
+            ret["Dependencies"].append(edge_json(e))
+        if self._skipped_files:
+            ret["skippedFiles"] = self._skipped_files
         return ret
 
     @classmethod
-    def write_ent_repr(cls, ent: Entity, dep_repr: "DepRepr") -> None:
-        helper_ent_types = [EntKind.ReferencedAttr, EntKind.Anonymous]
-        if ent.kind() not in helper_ent_types:
-            modifiers = cls.get_modifiers(ent)
-            dep_repr.add_node(Node(ent.id, ent.longname.longname, ent.kind().value,
-                                   str(ent.location.file_path).replace("\\", "/"),
-                                   ent.location.code_span.start_line,
-                                   ent.location.code_span.end_line, ent.location.code_span.start_col,
-                                   ent.location.code_span.end_col, modifiers))
+    def node_of(cls, ent: Entity) -> Node:
+        modifiers = cls.get_modifiers(ent)
+        return Node(ent.id, ent.longname.longname, ent.kind().value,
+                    str(ent.location.file_path).replace("\\", "/"),
+                    ent.location.code_span.start_line,
+                    ent.location.code_span.end_line, ent.location.code_span.start_col,
+                    ent.location.code_span.end_col, modifiers)
+
+    @classmethod
+    def write_ent_repr(cls, ent: Entity, dep_repr: "DepRepr", projection: Projection = _FullProjection) -> None:
+        if reports_ent(ent, projection):
+            dep_repr.add_node(cls.node_of(ent))
             for ref in ent.refs():
-                if ref.target_ent.kind() not in helper_ent_types:
+                if reports_ref(ref.ref_kind, ref.target_ent, projection):
                     resolved_targets = [t.id for t in ref.resolved_targets]
                     dep_repr._edge_list.append(Edge(src=ent.id,
                                                     src_name=ent.longname.longname,
@@ -116,23 +140,11 @@ class DepRepr:
     def to_json_1(self) -> JsonDict:
         ret: JsonDict = {"variables": [], "cells": []}
         for n in self._node_list:
-            variable = {"id": n.id, "qualifiedName": n.longname, "category": n.ent_type,
-                        "location": {"startLine": n.start_line, "endLine": n.end_line,
-                                     "startColumn": n.start_col, "endColumn": n.end_col}}
-            if n.file_path != ".":
-                variable["File"] = n.file_path
-            if exist_no_empty(n.modifiers):
-                variable["modifiers"] = n.modifiers
-            ret["variables"].append(variable)
+            ret["variables"].append(variable_json(n))
         for e in self._edge_list:
-            values: JsonDict = {"kind": e.kind, "in_type_context": e.in_type_ctx}
-            location = {"startLine": e.lineno, "startCol": e.col_offset}
-            if e.resolved_targets:
-                values["resolved"] = e.resolved_targets
-            ret["cells"].append({"src": e.src,
-                                 "dest": e.dest,
-                                 "values": values,
-                                 "location": location})
+            ret["cells"].append(cell_json(e))
+        if self._skipped_files:
+            ret["skippedFiles"] = self._skipped_files
         return ret
 
     @classmethod
@@ -140,11 +152,98 @@ class DepRepr:
         dep_repr = DepRepr()
         for rel_path, module_db in package_db.tree.items():
             for ent in module_db.dep_db.ents:
-                cls.write_ent_repr(ent, dep_repr)
+                cls.write_ent_repr(ent, dep_repr, package_db.projection)
         for ent in package_db.global_db.ents:
-            cls.write_ent_repr(ent, dep_repr)
+            cls.write_ent_repr(ent, dep_repr, package_db.projection)
+        dep_repr._skipped_files = skipped_files_json(package_db)
         return dep_repr
 
+    @classmethod
+    def write_package_db(cls, package_db: RootDB, file: TextIO, compatible_format: bool = False) -> None:
+        """
+        Write the report of the package module by module, the output is the same as
+        `json.dump` of `to_json_1` or `to_json` with `indent=4`, but only the representation
+        of one module is in memory at a time, and the references of spilled modules are
+        spilled again after the module is written.
+        """
+
+        def module_reprs() -> Iterator[DepRepr]:
+            ent_lists = [module_db.dep_db.ents for module_db in package_db.tree.values()]
+            ent_lists.append(package_db.global_db.ents)
+            for ents in ent_lists:
+                dep_repr = DepRepr()
+                for ent in ents:
+                    cls.write_ent_repr(ent, dep_repr, package_db.projection)
+                yield dep_repr
+                package_db.checkpoint()
+
+        cls._write_reprs(module_reprs(), skipped_files_json(package_db), file, compatible_format)
+
+    @classmethod
+    def write_columnar(cls, graph: ColumnarDepGraph, package_db: RootDB, file: TextIO,
+                       compatible_format: bool = False) -> None:
+        """
+        Write the report of a columnar graph built from the package, the output is the same
+        as the output of `write_package_db` before the graph was built.
+        """
+
+        def chunk_reprs() -> Iterator[DepRepr]:
+            dep_repr = DepRepr()
+            for index in graph.occurrences:
+                cls.write_columnar_repr(graph, index, dep_repr, package_db.projection)
+                if len(dep_repr._edge_list) >= _ChunkEdges:
+                    yield dep_repr
+                    dep_repr = DepRepr()
+            yield dep_repr
+
+        cls._write_reprs(chunk_reprs(), skipped_files_json(package_db), file, compatible_format)
+
+    @classmethod
+    def write_columnar_repr(cls, graph: ColumnarDepGraph, index: int, dep_repr: "DepRepr",
+                            projection: Projection = _FullProjection) -> None:
+        ent = graph.ents[index]
+        if not reports_ent(ent, projection):
+            return
+        dep_repr.add_node(cls.node_of(ent))
+        ents = graph.ents
+        for edge in graph.out_edges(index):
+            target_ent = ents[graph.dest[edge]]
+            if reports_ref(graph.ref_kind(edge), target_ent, projection):
+                dep_repr._edge_list.append(Edge(src=ent.id,
+                                                src_name=ent.longname.longname,
+                                                dest=target_ent.id,
+                                                dest_name=target_ent.longname.longname,
+                                                kind=graph.ref_kind(edge).value,
+                                                lineno=graph.lineno[edge],
+                                                col_offset=graph.col_offset[edge],
+                                                in_type_ctx=graph.in_type_ctx(edge),
+                                                resolved_targets=[ents[t].id for t in graph.resolved_targets(edge)]))
+
+    @classmethod
+    def _write_reprs(cls, reprs: Iterable["DepRepr"], skipped_files: List[JsonDict], file: TextIO,
+                     compatible_format: bool) -> None:
+        # edges are written to a temporary file until all nodes are written
+        node_key, edge_key = ("Entities", "Dependencies") if compatible_format else ("variables", "cells")
+        to_node_json: Callable[[Node], Any] = node_json if compatible_format else variable_json
+        to_edge_json: Callable[[Edge], Any] = edge_json if compatible_format else cell_json
+        with tempfile.TemporaryFile("w+") as edge_file:
+            nodes = _JsonListWriter(file, 1)
+            edges = _JsonListWriter(edge_file, 1)
+            file.write(f"{{\n    {json.dumps(node_key)}: [")
+            for dep_repr in reprs:
+                for n in dep_repr._node_list:
+                    nodes.write(to_node_json(n))
+                for e in dep_repr._edge_list:
+                    edges.write(to_edge_json(e))
+            nodes.close()
+            file.write(f",\n    {json.dumps(edge_key)}: [")
+            edges.close()
+            edge_file.seek(0)
+            shutil.copyfileobj(edge_file, file)
+        if skipped_files:
+            file.write(",\n    \"skippedFiles\": " + json.dumps(skipped_files, indent=4).replace("\n", "\n    "))
+        file.write("\n}")
+
     @classmethod
     def from_und_db(cls, und_db: Any) -> "DepRepr":
         dep_repr = DepRepr()
@@ -201,6 +300,72 @@ class DepRepr:
         return ret
 
 
+def node_json(n: Node) -> NodeTy:
+    return {"id": n.id, "longname": n.longname, "ent_type": n.ent_type,
+            "file_path": n.file_path,
+            "start_line": n.start_line, "end_line": n.end_line,
+            "start_col": n.start_col, "end_col": n.end_col}
+
+
+def edge_json(e: Edge) -> EdgeTy:
+    return {"src": e.src,
+            "src_name": e.src_name,
+            "dest": e.dest,
+            "dest_name": e.dest_name,
+            "kind": e.kind,
+            "lineno": e.lineno,
+            "col_offset": e.col_offset,
+            "in_type_context": e.in_type_ctx}
+
+
+def variable_json(n: Node) -> JsonDict:
+    variable: JsonDict = {"id": n.id, "qualifiedName": n.longname, "category": n.ent_type,
+                          "location": {"startLine": n.start_line, "endLine": n.end_line,
+                                       "startColumn": n.start_col, "endColumn": n.end_col}}
+    if n.file_path != ".":
+        variable["File"] = n.file_path
+    if exist_no_empty(n.modifiers):
+        variable["modifiers"] = n.modifiers
+    return variable
+
+
+def cell_json(e: Edge) -> JsonDict:
+    values: JsonDict = {"kind": e.kind, "in_type_context": e.in_type_ctx}
+    location = {"startLine": e.lineno, "startCol": e.col_offset}
+    if e.resolved_targets:
+        values["resolved"] = e.resolved_targets
+    return {"src": e.src,
+            "dest": e.dest,
+            "values": values,
+            "location": location}
+
+
+def skipped_files_json(package_db: RootDB) -> List[JsonDict]:
+    return [{"File": str(rel_path).replace("\\", "/"), "reason": skipped.reason, "size": skipped.size}
+            for rel_path, skipped in sorted(package_db.skipped_files.items())]
+
+
+class _JsonListWriter:
+    """Write the items of a json list one by one, indented as `json.dump(..., indent=4)`
+    indents a list at the given depth."""
+
+    def __init__(self, file: TextIO, depth: int) -> None:
+        self._file = file
+        self._indent = "\n" + " " * 4 * (depth + 1)
+        self._count = 0
+
+    def write(self, item: Any) -> None:
+        self._file.write("," if self._count else "")
+        self._file.write(self._indent + json.dumps(item, indent=4).replace("\n", self._indent))
+        self._count += 1
+
+    def close(self) -> None:
+        if self._count:
+            self._file.write(self._indent[:-4] + "]")
+        else:
+            self._file.write("]")
+
+
 def exist_no_empty(modifiers: Dict[str, Any]) -> bool:
     return ('modifier' in modifiers and len(modifiers['modifier']) > 0) or \
            ('readonlyProperty' in modifiers and len(modifiers['readonlyProperty']) > 0) or \
@@ -0,0 +1,68 @@
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+from enre.analysis.analyze_manager import AnalyzeManager
+from enre.dep.columnar import ColumnarDepGraph
+from enre.ent.entity import Entity
+from enre.ref.Ref import Ref
+
+
+def shallow_size(obj: Any) -> int:
+    # the instance dictionary is a separate object, it's only there without __slots__
+    size = sys.getsizeof(obj)
+    instance_dict = getattr(obj, "__dict__", None)
+    if instance_dict is not None:
+        size += sys.getsizeof(instance_dict)
+    return size
+
+
+def entry() -> None:
+    """
+    usage: python memory_benchmark.py <root path> [builtins path]
+
+    Print the average bytes of an entity and of a reference of the analyzed project,
+    and of an edge of the same dependencies in a columnar graph, run it on two revisions
+    to compare them.
+    """
+    root_path = Path(sys.argv[1])
+    builtins_path = Path(sys.argv[2]) if len(sys.argv) > 2 else None
+    tracemalloc.start()
+    start = time.time()
+    manager = AnalyzeManager(root_path, builtins_path)
+    manager.work_flow()
+    end = time.time()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    ents: List[Entity] = []
+    for module_db in manager.root_db.tree.values():
+        ents.extend(module_db.dep_db.ents)
+    ents.extend(manager.root_db.global_db.ents)
+    refs: List[Ref] = [ref for ent in ents for ref in ent.refs()]
+    kind_sizes: Dict[str, List[int]] = defaultdict(list)
+    for ent in ents:
+        kind_sizes[type(ent).__name__].append(shallow_size(ent))
+    ent_bytes = sum(sum(sizes) for sizes in kind_sizes.values())
+    ref_bytes = sum(shallow_size(ref) for ref in refs)
+    resolved_bytes = sum(sys.getsizeof(ref.resolved_targets) for ref in refs)
+    location_bytes = sum(shallow_size(ent.location) + shallow_size(ent.location.code_span) for ent in ents)
+
+    print(f"analysing time: {end - start:.2f}s, peak traced memory: {peak / 1024 / 1024:.1f} MB")
+    print(f"entities: {len(ents)}, bytes per entity: {ent_bytes / max(len(ents), 1):.1f}, "
+          f"with location and span: {(ent_bytes + location_bytes) / max(len(ents), 1):.1f}")
+    print(f"references: {len(refs)}, bytes per reference: {ref_bytes / max(len(refs), 1):.1f}, "
+          f"with resolved targets: {(ref_bytes + resolved_bytes) / max(len(refs), 1):.1f}")
+    list_bytes = sum(sys.getsizeof(ent.refs()) for ent in ents)
+    graph = ColumnarDepGraph.from_package_db(manager.root_db)
+    print(f"columnar edges: {len(graph.src)}, bytes per edge: {graph.nbytes() / max(len(graph.src), 1):.1f}, "
+          f"reference lists and references: {(list_bytes + ref_bytes + resolved_bytes) / max(len(refs), 1):.1f}")
+    for kind, sizes in sorted(kind_sizes.items(), key=lambda item: -len(item[1])):
+        print(f"    {kind}: {len(sizes)} entities, {sum(sizes) / len(sizes):.1f} bytes")
+
+
+if __name__ == '__main__':
+    entry()